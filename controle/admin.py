@@ -1,5 +1,7 @@
-from django.contrib import admin
-from .models import Categoria, Conta, Transacao
+from django.contrib import admin, messages
+
+from . import arquivamento, busca
+from .models import Categoria, Conta, Transacao, Transferencia, Recorrencia, Orcamento, ResumoArquivado, ResumoMensalCategoria, SaldoMensalConta
 
 @admin.register(Categoria)
 class CategoriaAdmin(admin.ModelAdmin):
@@ -19,3 +21,88 @@ class TransacaoAdmin(admin.ModelAdmin):
     list_filter = ('data', 'categoria', 'conta', 'usuario')
     search_fields = ('descricao', 'observacao')
     date_hierarchy = 'data'
+
+    def get_search_results(self, request, queryset, search_term):
+        # Usa o índice de busca textual em vez de icontains (varredura da tabela)
+        return busca.filtrar(queryset, search_term), False
+
+@admin.register(Transferencia)
+class TransferenciaAdmin(admin.ModelAdmin):
+    list_display = ('descricao', 'valor', 'data', 'origem', 'destino', 'usuario')
+    list_filter = ('data', 'usuario')
+    date_hierarchy = 'data'
+    # As pernas e os saldos são gravados por transferencias.transferir
+    readonly_fields = ('descricao', 'valor', 'data', 'origem', 'destino', 'usuario')
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(Recorrencia)
+class RecorrenciaAdmin(admin.ModelAdmin):
+    list_display = ('descricao', 'valor', 'frequencia', 'intervalo', 'proxima_data', 'ativa', 'usuario')
+    list_filter = ('frequencia', 'ativa', 'usuario')
+    search_fields = ('descricao',)
+
+@admin.register(Orcamento)
+class OrcamentoAdmin(admin.ModelAdmin):
+    list_display = ('categoria', 'limite', 'alerta', 'usuario')
+    list_filter = ('usuario',)
+
+@admin.register(ResumoMensalCategoria)
+class ResumoMensalCategoriaAdmin(admin.ModelAdmin):
+    list_display = ('categoria', 'ano', 'mes', 'total', 'quantidade', 'usuario')
+    list_filter = ('ano', 'mes', 'usuario')
+    # Mantidos pelos sinais de Transacao; corrigir com reconstruir_resumos
+    readonly_fields = ('usuario', 'categoria', 'ano', 'mes', 'total', 'quantidade')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(SaldoMensalConta)
+class SaldoMensalContaAdmin(admin.ModelAdmin):
+    list_display = ('conta', 'ano', 'mes', 'movimento', 'acumulado')
+    list_filter = ('ano', 'mes')
+    # Mantidos pelos sinais de Transacao; corrigir com recalcular_saldos
+    readonly_fields = ('conta', 'ano', 'mes', 'movimento', 'acumulado')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(ResumoArquivado)
+class ResumoArquivadoAdmin(admin.ModelAdmin):
+    list_display = ('categoria', 'conta', 'ano', 'mes', 'total', 'quantidade', 'usuario')
+    list_filter = ('ano', 'usuario')
+    actions = ['restaurar_anos']
+
+    # Gravados por arquivamento.arquivar_ano; sem eles os recálculos
+    # perderiam as transações arquivadas
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    @admin.action(description='Restaurar as transações dos anos selecionados')
+    def restaurar_anos(self, request, queryset):
+        restauradas = 0
+        for usuario_id, ano in queryset.values_list('usuario_id', 'ano').distinct().order_by():
+            try:
+                restauradas += arquivamento.restaurar_ano(usuario_id, ano)
+            except arquivamento.ErroArquivo as erro:
+                self.message_user(request, str(erro), messages.ERROR)
+        self.message_user(request, f'{restauradas} transações restauradas.')
@@ -0,0 +1,236 @@
+"""
+Arquivamento das transações antigas.
+
+Os anos completos anteriores ao horizonte (o ano atual e os
+settings.ARQUIVO_TRANSACOES_ANOS anteriores ficam na tabela) saem de
+Transacao e vão para um arquivo JSON Lines comprimido por usuário e ano,
+em ARQUIVO_TRANSACOES_DIR/<usuário>/<ano>.jsonl.gz. No lugar delas ficam
+os totais por conta, categoria e mês em ResumoArquivado.
+
+Arquivar não muda nada do que já foi calculado: as transações saem com
+um DELETE direto, sem os sinais de Transacao, então o saldo das contas,
+os saldos mensais e os resumos por categoria continuam os mesmos, e os
+relatórios mensais e anuais, que leem deles, continuam exatos. Os
+recálculos (saldos.recalcular, resumos.reconstruir) somam os totais
+arquivados às transações da tabela. O que precisa do dia de cada
+transação (a série diária do saldo, o saldo no meio de um mês e o saldo
+corrido do extrato) lê as linhas do arquivo com transacoes_arquivadas,
+só para os anos do intervalo que têm arquivo. Um ano arquivado volta
+inteiro com restaurar_ano, com os ids originais.
+
+As pernas de transferências ficam na tabela: excluir a Transferencia
+precisa delas para desfazer os saldos.
+"""
+import gzip
+import json
+import os
+import tempfile
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.db.models.functions import ExtractYear
+from django.utils import timezone
+
+from . import cache, lancamentos
+from .models import Categoria, ResumoArquivado, Transacao
+
+CAMPOS = ('id', 'descricao', 'valor', 'data', 'categoria_id', 'conta_id', 'observacao', 'hash_importacao')
+# Ids por DELETE, abaixo do limite de parâmetros das versões antigas do SQLite
+TAMANHO_EXCLUSAO = 500
+
+
+class ErroArquivo(RuntimeError):
+    """O arquivo de um ano não confere com os totais arquivados dele."""
+
+
+def primeiro_ano_mantido(anos=None, hoje=None):
+    """Ano a partir do qual as transações ficam na tabela."""
+    if anos is None:
+        anos = settings.ARQUIVO_TRANSACOES_ANOS
+    return (hoje or timezone.localdate()).year - anos
+
+
+def caminho(usuario_id, ano):
+    return Path(settings.ARQUIVO_TRANSACOES_DIR) / str(usuario_id) / f'{ano}.jsonl.gz'
+
+
+def _arquivaveis(usuario_id=None):
+    transacoes = Transacao.objects.filter(transferencia__isnull=True)
+    if usuario_id is not None:
+        transacoes = transacoes.filter(usuario_id=usuario_id)
+    return transacoes
+
+
+def anos_arquivados(usuario_id):
+    """Anos do usuário que têm transações no arquivo, em ordem."""
+    return list(
+        ResumoArquivado.objects.filter(usuario_id=usuario_id)
+        .values_list('ano', flat=True).distinct().order_by('ano')
+    )
+
+
+def pendentes(ate_ano, usuario_id=None):
+    """[(usuario_id, ano)] com transações arquiváveis antes de `ate_ano`."""
+    return list(
+        _arquivaveis(usuario_id).filter(data__lt=date(ate_ano, 1, 1))
+        .annotate(ano=ExtractYear('data'))
+        .values_list('usuario_id', 'ano').distinct().order_by('usuario_id', 'ano')
+    )
+
+
+def ler(usuario_id, ano):
+    """Transações arquivadas do ano, como dicionários com os CAMPOS."""
+    arquivo = caminho(usuario_id, ano)
+    if not arquivo.exists():
+        return []
+    with gzip.open(arquivo, 'rt', encoding='utf-8') as entrada:
+        linhas = [json.loads(linha) for linha in entrada]
+    for linha in linhas:
+        linha['valor'] = Decimal(linha['valor'])
+        linha['data'] = date.fromisoformat(linha['data'])
+    return linhas
+
+
+def transacoes_arquivadas(usuario_id, inicio, fim, conta_id=None):
+    """
+    Transações arquivadas do usuário (ou só da `conta_id`) entre `inicio`
+    e `fim`, inclusive, como em ler(), com o 'tipo' da categoria. Anos sem
+    arquivo não custam leitura nem consulta. Linhas que também estão na
+    tabela (gravação interrompida, ver arquivar_ano) ficam de fora.
+    """
+    linhas = []
+    for ano in range(inicio.year, fim.year + 1):
+        if not caminho(usuario_id, ano).exists():
+            continue
+        presentes = set(_arquivaveis(usuario_id).filter(data__year=ano).values_list('pk', flat=True))
+        linhas += [
+            linha for linha in ler(usuario_id, ano)
+            if inicio <= linha['data'] <= fim and linha['id'] not in presentes
+            and (conta_id is None or linha['conta_id'] == conta_id)
+        ]
+    if linhas:
+        tipos = dict(Categoria.objects.filter(
+            pk__in={linha['categoria_id'] for linha in linhas},
+        ).values_list('pk', 'tipo'))
+        for linha in linhas:
+            linha['tipo'] = tipos[linha['categoria_id']]
+    return linhas
+
+
+def _gravar(arquivo, linhas):
+    arquivo.parent.mkdir(parents=True, exist_ok=True)
+    descritor, temporario = tempfile.mkstemp(dir=arquivo.parent, suffix='.tmp')
+    os.close(descritor)
+    try:
+        with gzip.open(temporario, 'wt', encoding='utf-8') as saida:
+            for linha in linhas:
+                saida.write(json.dumps(linha, ensure_ascii=False, default=str) + '\n')
+        os.replace(temporario, arquivo)
+    except BaseException:
+        os.unlink(temporario)
+        raise
+
+
+def _excluir(ids):
+    # SQL direto na tabela em vez de QuerySet.delete(): o delete do ORM
+    # dispararia os sinais de Transacao, que tirariam as transações dos
+    # saldos, dos saldos mensais e dos resumos, onde elas continuam
+    # contando (agora pelos totais arquivados)
+    tabela = connection.ops.quote_name(Transacao._meta.db_table)
+    coluna = connection.ops.quote_name(Transacao._meta.pk.column)
+    with connection.cursor() as cursor:
+        for inicio in range(0, len(ids), TAMANHO_EXCLUSAO):
+            bloco = ids[inicio:inicio + TAMANHO_EXCLUSAO]
+            cursor.execute(
+                f"DELETE FROM {tabela} WHERE {coluna} IN ({', '.join(['%s'] * len(bloco))})", bloco,
+            )
+
+
+def _resumos(usuario_id, ano, linhas):
+    totais = defaultdict(lambda: [0, 0])
+    for linha in linhas:
+        chave = (linha['data'].month, linha['conta_id'], linha['categoria_id'])
+        totais[chave][0] += linha['valor']
+        totais[chave][1] += 1
+    return [
+        ResumoArquivado(
+            usuario_id=usuario_id, ano=ano, mes=mes, conta_id=conta_id, categoria_id=categoria_id,
+            total=total, quantidade=quantidade,
+        )
+        for (mes, conta_id, categoria_id), (total, quantidade) in totais.items()
+    ]
+
+
+def arquivar_ano(usuario_id, ano):
+    """
+    Move as transações de `ano` do usuário para o arquivo e retorna
+    quantas saíram da tabela. Num ano já arquivado, junta ao arquivo as
+    transações lançadas nele depois disso.
+    """
+    with transaction.atomic():
+        transacoes = _arquivaveis(usuario_id).filter(data__year=ano)
+        novas = list(transacoes.values(*CAMPOS))
+        if not novas:
+            return 0
+        linhas = {linha['id']: linha for linha in ler(usuario_id, ano)}
+        linhas.update((linha['id'], linha) for linha in novas)
+
+        ResumoArquivado.objects.filter(usuario_id=usuario_id, ano=ano).delete()
+        ResumoArquivado.objects.bulk_create(_resumos(usuario_id, ano, linhas.values()))
+        _excluir([linha['id'] for linha in novas])
+        # Por último, ainda dentro da transação: se algo acima falhar o
+        # arquivo anterior fica intacto, e se o commit falhar depois da
+        # gravação as linhas que continuaram na tabela são ignoradas ao
+        # restaurar (os ids não se repetem)
+        _gravar(caminho(usuario_id, ano), sorted(linhas.values(), key=lambda l: (l['data'], l['id'])))
+    # A lista de recentes pode ter transações do ano arquivado
+    cache.invalidar(usuario_id, partes=('recentes',))
+    return len(novas)
+
+
+def restaurar_ano(usuario_id, ano):
+    """
+    Devolve à tabela as transações arquivadas de `ano`, com os ids
+    originais, sem mexer em saldos e resumos. Retorna quantas voltaram.
+    """
+    arquivo = caminho(usuario_id, ano)
+    with transaction.atomic():
+        resumos = ResumoArquivado.objects.filter(usuario_id=usuario_id, ano=ano)
+        esperadas = resumos.aggregate(total=Sum('quantidade'))['total'] or 0
+        presentes = set(_arquivaveis(usuario_id).filter(data__year=ano).values_list('pk', flat=True))
+        linhas = [linha for linha in ler(usuario_id, ano) if linha['id'] not in presentes]
+        if len(linhas) != esperadas:
+            raise ErroArquivo(
+                f'{arquivo}: {len(linhas)} transações no arquivo, {esperadas} nos totais arquivados.'
+            )
+        restauradas = Transacao.objects.bulk_create(
+            [Transacao(usuario_id=usuario_id, **linha) for linha in linhas],
+            batch_size=lancamentos.TAMANHO_LOTE,
+        )
+        resumos.delete()
+        transaction.on_commit(lambda: arquivo.unlink(missing_ok=True))
+    cache.invalidar(usuario_id, partes=('recentes',))
+    return len(restauradas)
+
+
+def arquivar(usuario_id=None, anos=None, relatar=None):
+    """
+    Arquiva, de todos os usuários ou de `usuario_id`, os anos anteriores
+    ao horizonte de `anos` (padrão: settings.ARQUIVO_TRANSACOES_ANOS). Cada
+    usuário e ano é uma transação do banco, então uma execução
+    interrompida pode ser repetida. `relatar`, se informado, recebe uma
+    linha por ano arquivado. Retorna {'anos': ..., 'transacoes': ...}.
+    """
+    resultado = {'anos': 0, 'transacoes': 0}
+    for pendente_usuario_id, ano in pendentes(primeiro_ano_mantido(anos), usuario_id):
+        quantidade = arquivar_ano(pendente_usuario_id, ano)
+        resultado['anos'] += 1
+        resultado['transacoes'] += quantidade
+        if relatar:
+            relatar(f'Usuário {pendente_usuario_id}, {ano}: {quantidade} transações arquivadas')
+    return resultado
@@ -0,0 +1,265 @@
+"""
+Harness de benchmark das views principais.
+
+Para cada tamanho de histórico, um usuário "benchmark_<n>" recebe <n>
+transações sintéticas (sinteticos.py) e cada cenário é requisitado pelo
+cliente de testes do Django. Por cenário são registrados latência p50,
+p95 e média, consultas SQL por requisição (instrumentacao.medir) e o
+pico de memória alocada, medido com tracemalloc em uma requisição à
+parte para não distorcer as latências.
+
+O comando "benchmark" roda tudo em um banco de testes descartável e
+grava o resultado em JSON; comparar() confronta duas execuções.
+
+comparar_asgi_wsgi() mede as views síncronas (WSGI) e as versões async
+do dashboard e dos relatórios (ASGI) sob requisições concorrentes; é o
+que roda o comando "benchmark_asgi".
+"""
+import asyncio
+import json
+import platform
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import django
+import numpy as np
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.urls import reverse
+
+from . import cache, sinteticos
+from .instrumentacao import medir
+from .models import Categoria, Conta, Transacao
+
+TAMANHOS = (1_000, 100_000, 1_000_000)
+REPETICOES = 20
+# Pares (view síncrona, versão async) comparados por comparar_asgi_wsgi
+VIEWS_ASGI = (
+    ('dashboard', 'dashboard_async'),
+    ('relatorio_mensal', 'relatorio_mensal_async'),
+    ('relatorio_anual', 'relatorio_anual_async'),
+)
+CONCORRENCIA = 8
+
+
+def _cenarios(usuario):
+    transacao = Transacao.objects.filter(usuario=usuario).order_by('-data', '-id').first()
+    categoria = Categoria.objects.filter(usuario=usuario, tipo='D').first()
+    conta = Conta.objects.filter(usuario=usuario).first()
+    hoje = date.today()
+
+    # (nome, método, url, dados, preparação antes de cada requisição)
+    return [
+        ('dashboard', 'get', reverse('controle:dashboard'), None, cache.limpar),
+        ('dashboard_em_cache', 'get', reverse('controle:dashboard'), None, None),
+        ('lista_transacoes', 'get', reverse('controle:lista_transacoes'), None, None),
+        ('lista_transacoes_filtrada', 'get',
+         f"{reverse('controle:lista_transacoes')}?categoria={categoria.pk}&data_inicio={hoje.replace(day=1)}", None, None),
+        ('relatorio_mensal', 'get', reverse('controle:relatorio_mensal'), None, None),
+        ('relatorio_anual', 'get', reverse('controle:relatorio_anual'), None, None),
+        ('nova_transacao_form', 'get', reverse('controle:nova_transacao'), None, None),
+        ('nova_transacao_post', 'post', reverse('controle:nova_transacao'), {
+            'descricao': 'Benchmark', 'valor': '12.34', 'data': hoje.isoformat(),
+            'categoria': categoria.pk, 'conta': conta.pk,
+        }, None),
+        ('editar_transacao_form', 'get', reverse('controle:editar_transacao', args=[transacao.pk]), None, None),
+    ]
+
+
+def _requisitar(cliente, metodo, url, dados):
+    resposta = getattr(cliente, metodo)(url, dados) if dados else getattr(cliente, metodo)(url)
+    # Um POST de formulário válido redireciona; 200 indicaria erro de validação
+    if resposta.status_code >= 400 or (metodo == 'post' and resposta.status_code != 302):
+        raise RuntimeError(f'{url} respondeu {resposta.status_code}')
+    return resposta
+
+
+def medir_cenario(cliente, metodo, url, dados=None, preparar=None, repeticoes=REPETICOES):
+    """Latências (ms), consultas e pico de memória (KiB) de um cenário."""
+    # Aquecimento: a primeira requisição carrega templates e URLs
+    _requisitar(cliente, metodo, url, dados)
+
+    latencias = []
+    consultas = []
+    for _ in range(repeticoes):
+        if preparar:
+            preparar()
+        with medir(consultas_lentas=0) as medicao:
+            inicio = time.perf_counter()
+            _requisitar(cliente, metodo, url, dados)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+        consultas.append(medicao.consultas)
+
+    if preparar:
+        preparar()
+    tracemalloc.start()
+    try:
+        _requisitar(cliente, metodo, url, dados)
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'repeticoes': repeticoes,
+        'p50_ms': round(float(np.percentile(latencias, 50)), 2),
+        'p95_ms': round(float(np.percentile(latencias, 95)), 2),
+        'media_ms': round(float(np.mean(latencias)), 2),
+        'consultas': max(consultas),
+        'pico_memoria_kib': round(pico / 1024, 1),
+    }
+
+
+def _medidas_concorrentes(latencias, duracao):
+    return {
+        'requisicoes': len(latencias),
+        'requisicoes_s': round(len(latencias) / duracao, 1),
+        'p50_ms': round(float(np.percentile(latencias, 50)), 2),
+        'p95_ms': round(float(np.percentile(latencias, 95)), 2),
+    }
+
+
+def _carga_wsgi(usuario, url, concorrencia, requisicoes):
+    # Um cliente por thread, como as threads de um servidor WSGI
+    clientes = [Client() for _ in range(concorrencia)]
+    for cliente in clientes:
+        cliente.force_login(usuario)
+
+    def trabalhar(cliente):
+        latencias = []
+        for _ in range(requisicoes):
+            cache.limpar()
+            inicio = time.perf_counter()
+            _requisitar(cliente, 'get', url, None)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+        return latencias
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(concorrencia) as executor:
+        latencias = [ms for parcial in executor.map(trabalhar, clientes) for ms in parcial]
+    return _medidas_concorrentes(latencias, time.perf_counter() - inicio)
+
+
+def _carga_asgi(usuario, url, concorrencia, requisicoes):
+    # Um cliente por tarefa, todas no mesmo loop de eventos
+    clientes = [AsyncClient() for _ in range(concorrencia)]
+    for cliente in clientes:
+        cliente.force_login(usuario)
+
+    async def trabalhar(cliente):
+        latencias = []
+        for _ in range(requisicoes):
+            cache.limpar()
+            inicio = time.perf_counter()
+            resposta = await cliente.get(url)
+            if resposta.status_code != 200:
+                raise RuntimeError(f'{url} respondeu {resposta.status_code}')
+            latencias.append((time.perf_counter() - inicio) * 1000)
+        return latencias
+
+    async def principal():
+        return await asyncio.gather(*(trabalhar(cliente) for cliente in clientes))
+
+    inicio = time.perf_counter()
+    latencias = [ms for parcial in asyncio.run(principal()) for ms in parcial]
+    return _medidas_concorrentes(latencias, time.perf_counter() - inicio)
+
+
+def comparar_asgi_wsgi(usuario, concorrencia=CONCORRENCIA, requisicoes=REPETICOES, relatar=None):
+    """
+    Vazão e latências de cada view síncrona (WSGI, `concorrencia`
+    threads) e da sua versão async (ASGI, `concorrencia` tarefas em um
+    loop), cada cliente fazendo `requisicoes` requisições com o cache
+    do dashboard vazio.
+    """
+    resultados = []
+    for sincrona, assincrona in VIEWS_ASGI:
+        for modo, nome, carga in (('wsgi', sincrona, _carga_wsgi), ('asgi', assincrona, _carga_asgi)):
+            url = reverse(f'controle:{nome}')
+            # Aquecimento: a primeira requisição carrega templates e URLs
+            carga(usuario, url, 1, 1)
+            medida = carga(usuario, url, concorrencia, requisicoes)
+            resultados.append({'view': sincrona, 'modo': modo, 'concorrencia': concorrencia, **medida})
+            if relatar:
+                relatar(
+                    f"{sincrona:<18} {modo}  {medida['requisicoes_s']:>7.1f} req/s  "
+                    f"p50 {medida['p50_ms']:>8.1f}ms  p95 {medida['p95_ms']:>8.1f}ms"
+                )
+    return resultados
+
+
+def preparar_dados(tamanho, semente=0, assimetria=1.0, dias=3 * 365):
+    """Usuário benchmark_<tamanho> com exatamente `tamanho` transações."""
+    usuario = sinteticos.preparar_usuario(f'benchmark_{tamanho}')
+    faltando = tamanho - Transacao.objects.filter(usuario=usuario).count()
+    if faltando > 0:
+        sinteticos.gerar_transacoes(usuario, faltando, dias=dias, assimetria=assimetria, semente=semente)
+    return usuario
+
+
+def executar(tamanhos=TAMANHOS, repeticoes=REPETICOES, cenarios=None, semente=0, relatar=None):
+    """
+    Roda os cenários para cada tamanho no banco atual e devolve o
+    dicionário de resultados (o mesmo gravado em JSON pelo comando).
+    `relatar`, se informado, recebe uma linha de texto por cenário medido.
+    """
+    resultados = []
+    for tamanho in tamanhos:
+        inicio = time.perf_counter()
+        usuario = preparar_dados(tamanho, semente=semente)
+        if relatar:
+            relatar(f'{tamanho} transações prontas em {time.perf_counter() - inicio:.1f}s')
+
+        cliente = Client()
+        cliente.force_login(usuario)
+        for nome, metodo, url, dados, preparar in _cenarios(usuario):
+            if cenarios and nome not in cenarios:
+                continue
+            medida = medir_cenario(cliente, metodo, url, dados, preparar, repeticoes)
+            resultados.append({'tamanho': tamanho, 'cenario': nome, **medida})
+            if relatar:
+                relatar(
+                    f"{tamanho:>9} {nome:<28} p50 {medida['p50_ms']:>8.1f}ms  p95 {medida['p95_ms']:>8.1f}ms  "
+                    f"{medida['consultas']:>3} consultas  {medida['pico_memoria_kib']:>9.1f} KiB"
+                )
+
+    return {
+        'executado_em': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'ambiente': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'banco': connection.vendor,
+            'plataforma': platform.platform(),
+        },
+        'semente': semente,
+        'resultados': resultados,
+    }
+
+
+def comparar(anterior, atual):
+    """Linhas de texto com a variação de p50, p95 e consultas entre duas execuções."""
+    chave = lambda r: (r['tamanho'], r['cenario'])
+    base = {chave(r): r for r in anterior['resultados']}
+    linhas = []
+    for resultado in atual['resultados']:
+        antes = base.get(chave(resultado))
+        if antes is None:
+            continue
+        variacoes = []
+        for campo in ('p50_ms', 'p95_ms'):
+            if antes[campo]:
+                variacoes.append(f'{campo[:3]} {(resultado[campo] / antes[campo] - 1) * 100:+.1f}%')
+        variacoes.append(f"consultas {antes['consultas']} -> {resultado['consultas']}")
+        linhas.append(f"{resultado['tamanho']:>9} {resultado['cenario']:<28} " + '  '.join(variacoes))
+    return linhas
+
+
+def salvar(resultado, caminho):
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        json.dump(resultado, arquivo, ensure_ascii=False, indent=2)
+
+
+def carregar(caminho):
+    with open(caminho, encoding='utf-8') as arquivo:
+        return json.load(arquivo)
@@ -0,0 +1,118 @@
+"""
+Busca textual nas transações (descricao e observacao).
+
+No SQLite a busca usa a tabela virtual FTS5 controle_transacao_fts, de
+conteúdo externo, mantida por triggers criados na migração 0007: assim
+ela acompanha também bulk_create e updates em lote, que não disparam
+sinais. No PostgreSQL usa to_tsvector/to_tsquery com um índice GIN sobre
+a mesma expressão. Em outros bancos cai no icontains.
+
+Cada palavra digitada vira um prefixo ("merc" encontra "Mercado") e
+todas precisam aparecer. No SQLite os acentos são ignorados.
+"""
+import re
+
+from django.db import connections, router
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+
+from .models import Transacao
+
+TABELA_FTS = 'controle_transacao_fts'
+CONFIGURACAO_POSTGRES = 'portuguese'
+# Mesma expressão do índice GIN criado na migração; a descrição pesa mais
+# que a observação na relevância
+VETOR_POSTGRES = (
+    f"(setweight(to_tsvector('{CONFIGURACAO_POSTGRES}', coalesce(controle_transacao.descricao, '')), 'A') || "
+    f"setweight(to_tsvector('{CONFIGURACAO_POSTGRES}', coalesce(controle_transacao.observacao, '')), 'B'))"
+)
+# Pesos de (descricao, observacao) no bm25 do SQLite
+PESOS_FTS5 = (2.0, 1.0)
+MAXIMO_PALAVRAS = 10
+
+
+def palavras(texto):
+    return re.findall(r'\w+', texto.lower())[:MAXIMO_PALAVRAS]
+
+
+def _expressao_fts5(termos):
+    # Aspas impedem que palavras como AND/NOT/NEAR virem operadores
+    return ' '.join(f'"{termo}"*' for termo in termos)
+
+
+def _expressao_tsquery(termos):
+    return ' & '.join(f"'{termo}':*" for termo in termos)
+
+
+def filtrar(queryset, texto):
+    """Restringe `queryset` às transações que contêm todas as palavras de `texto`."""
+    termos = palavras(texto)
+    if not termos:
+        texto = texto.strip()
+        return queryset.filter(Q(descricao__icontains=texto) | Q(observacao__icontains=texto)) if texto else queryset
+
+    vendor = connections[queryset.db].vendor
+    if vendor == 'sqlite':
+        return queryset.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {TABELA_FTS} WHERE {TABELA_FTS} MATCH %s', (_expressao_fts5(termos),)
+        ))
+    if vendor == 'postgresql':
+        return queryset.filter(RawSQL(
+            f"{VETOR_POSTGRES} @@ to_tsquery('{CONFIGURACAO_POSTGRES}', %s)",
+            (_expressao_tsquery(termos),),
+            output_field=BooleanField(),
+        ))
+
+    condicao = Q()
+    for termo in termos:
+        condicao &= Q(descricao__icontains=termo) | Q(observacao__icontains=termo)
+    return queryset.filter(condicao)
+
+
+def buscar(usuario, texto, limite=20):
+    """
+    As `limite` transações do `usuario` mais relevantes para `texto`,
+    com a pontuação no atributo `relevancia` (maior é melhor). Empates
+    ficam com as mais recentes.
+    """
+    termos = palavras(texto)
+    if not termos:
+        return []
+
+    # Leitura pelo roteador, para usar a réplica quando for o caso
+    conexao = connections[router.db_for_read(Transacao)]
+    if conexao.vendor == 'sqlite':
+        # bm25 é negativo: quanto menor, mais relevante
+        bm25 = f"bm25({TABELA_FTS}, {', '.join(map(str, PESOS_FTS5))})"
+        sql = (
+            f'SELECT t.id, -{bm25} FROM {TABELA_FTS} '
+            f'JOIN controle_transacao t ON t.id = {TABELA_FTS}.rowid '
+            f'WHERE {TABELA_FTS} MATCH %s AND t.usuario_id = %s '
+            f'ORDER BY {bm25}, t.data DESC, t.id DESC LIMIT %s'
+        )
+        parametros = (_expressao_fts5(termos), usuario.pk, limite)
+    elif conexao.vendor == 'postgresql':
+        sql = (
+            f'SELECT id, ts_rank({VETOR_POSTGRES}, consulta) AS relevancia '
+            f"FROM controle_transacao, to_tsquery('{CONFIGURACAO_POSTGRES}', %s) consulta "
+            f'WHERE usuario_id = %s AND {VETOR_POSTGRES} @@ consulta '
+            f'ORDER BY relevancia DESC, data DESC, id DESC LIMIT %s'
+        )
+        parametros = (_expressao_tsquery(termos), usuario.pk, limite)
+    else:
+        transacoes = list(filtrar(Transacao.objects.filter(usuario=usuario), texto)
+                          .select_related('categoria', 'conta')[:limite])
+        for transacao in transacoes:
+            transacao.relevancia = 0.0
+        return transacoes
+
+    with conexao.cursor() as cursor:
+        cursor.execute(sql, parametros)
+        pontuacoes = dict(cursor.fetchall())
+    transacoes = Transacao.objects.select_related('categoria', 'conta').in_bulk(pontuacoes)
+    resultado = []
+    for pk, relevancia in pontuacoes.items():
+        transacao = transacoes[pk]
+        transacao.relevancia = float(relevancia)
+        resultado.append(transacao)
+    return resultado
@@ -0,0 +1,331 @@
+"""
+Cache do contexto do dashboard.
+
+O contexto é dividido em partes com invalidação independente:
+
+- saldo: contas e saldo total do usuário;
+- recentes: as últimas transações;
+- mes: receitas, despesas e gráfico por categoria de um mês;
+- orcamentos: consumo dos orçamentos por categoria de um mês;
+- escolhas: pares (id, rótulo) das categorias para os selects dos
+  formulários de transação (ver forms.EscolhasUsuarioMixin). Os rótulos
+  das contas trazem o saldo e por isso saem da parte saldo, que as
+  transações já invalidam; assim um lançamento não descarta as categorias.
+
+As chaves de mês (mes e orcamentos) incluem uma geração por usuário, incrementada quando
+uma categoria muda (o nome e o tipo aparecem em todos os meses). As
+transações invalidam só os meses que tocam. Os contadores de acertos e
+falhas ficam no próprio cache (ver estatisticas()).
+
+Toda invalidação também registra o instante da última alteração dos
+dados do usuário, usado pela API para ETag e Last-Modified.
+
+As funções com prefixo "a" (acontexto_dashboard, aparte_*) são as
+versões assíncronas, usadas pelas views async: as partes ausentes do
+cache são calculadas com o ORM assíncrono. O asyncio.gather só agenda as
+partes juntas; o Django executa as consultas de uma requisição em uma
+única thread, uma de cada vez, então o cálculo não fica mais rápido que
+o síncrono (ver o comando benchmark_asgi).
+"""
+import asyncio
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+
+from . import orcamentos, resumos
+from .models import Categoria, Conta, Transacao
+
+PARTES = ('saldo', 'recentes', 'mes', 'orcamentos', 'escolhas')
+# Partes com uma chave por mês
+PARTES_MENSAIS = ('mes', 'orcamentos')
+
+CORES_GRAFICO = [
+    '#FF6384', '#36A2EB', '#FFCE56', '#4BC0C0', '#9966FF',
+    '#FF9F40', '#8AC249', '#EA526F', '#49ADF5', '#C8B0F5'
+]
+
+
+def _cache():
+    return caches[getattr(settings, 'DASHBOARD_CACHE_ALIAS', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 24 * 60 * 60)
+
+
+def _geracao(usuario_id):
+    return _cache().get_or_set(f'dashboard:{usuario_id}:geracao', 0, None)
+
+
+async def _ageracao(usuario_id):
+    return await _cache().aget_or_set(f'dashboard:{usuario_id}:geracao', 0, None)
+
+
+def _chave_mes(usuario_id, geracao, ano, mes, parte='mes'):
+    return f'dashboard:{usuario_id}:g{geracao}:{parte}:{ano}-{mes:02d}'
+
+
+def chave(usuario_id, parte, ano=None, mes=None):
+    if parte in PARTES_MENSAIS:
+        return _chave_mes(usuario_id, _geracao(usuario_id), ano, mes, parte)
+    return f'dashboard:{usuario_id}:{parte}'
+
+
+def _contar(parte, resultado):
+    contador = f'dashboard:estatisticas:{parte}:{resultado}'
+    cache = _cache()
+    cache.add(contador, 0, None)
+    try:
+        cache.incr(contador)
+    except ValueError:
+        # A chave expirou entre o add e o incr
+        cache.set(contador, 1, None)
+
+
+async def _acontar(parte, resultado):
+    contador = f'dashboard:estatisticas:{parte}:{resultado}'
+    cache = _cache()
+    await cache.aadd(contador, 0, None)
+    try:
+        await cache.aincr(contador)
+    except ValueError:
+        await cache.aset(contador, 1, None)
+
+
+def _obter(chave_cache, parte, calcular):
+    cache = _cache()
+    valor = cache.get(chave_cache)
+    if valor is not None:
+        _contar(parte, 'acertos')
+        return valor
+    _contar(parte, 'falhas')
+    valor = calcular()
+    cache.set(chave_cache, valor, _timeout())
+    return valor
+
+
+async def _aobter(chave_cache, parte, calcular):
+    cache = _cache()
+    valor = await cache.aget(chave_cache)
+    if valor is not None:
+        await _acontar(parte, 'acertos')
+        return valor
+    await _acontar(parte, 'falhas')
+    valor = await calcular()
+    await cache.aset(chave_cache, valor, _timeout())
+    return valor
+
+
+def _calcular_saldo(usuario):
+    contas = list(Conta.objects.filter(usuario=usuario))
+    return {
+        'contas': contas,
+        'saldo_total': sum((conta.saldo for conta in contas), 0),
+    }
+
+
+async def _acalcular_saldo(usuario):
+    contas = [conta async for conta in Conta.objects.filter(usuario=usuario)]
+    return {
+        'contas': contas,
+        'saldo_total': sum((conta.saldo for conta in contas), 0),
+    }
+
+
+def _recentes(usuario):
+    return Transacao.objects.filter(usuario=usuario).select_related('categoria').order_by('-data', '-id')[:5]
+
+
+def _calcular_recentes(usuario):
+    return {'transacoes_recentes': list(_recentes(usuario))}
+
+
+async def _acalcular_recentes(usuario):
+    return {'transacoes_recentes': [transacao async for transacao in _recentes(usuario)]}
+
+
+def _calcular_escolhas(usuario):
+    tipos = dict(Categoria.TIPO_CHOICES)
+    return [
+        (pk, f'{nome} ({tipos[tipo]})')
+        for pk, nome, tipo in Categoria.objects.filter(
+            usuario=usuario, transferencia=False,
+        ).values_list('pk', 'nome', 'tipo')
+    ]
+
+
+def _calcular_mes(usuario, ano, mes):
+    return _montar_mes(
+        resumos.totais_mes(usuario, ano, mes),
+        resumos.totais_por_categoria(usuario, ano, mes),
+    )
+
+
+async def _acalcular_mes(usuario, ano, mes):
+    return _montar_mes(*await asyncio.gather(
+        resumos.atotais_mes(usuario, ano, mes),
+        resumos.atotais_por_categoria(usuario, ano, mes),
+    ))
+
+
+def _montar_mes(totais, por_categoria):
+    receitas_mes, despesas_mes = totais
+
+    dados_grafico = []
+    labels = []
+    for categoria, total in por_categoria:
+        if total > 0:
+            dados_grafico.append(float(total))
+            labels.append(categoria.nome)
+
+    return {
+        'receitas_mes': receitas_mes,
+        'despesas_mes': despesas_mes,
+        # Dados para o gráfico de despesas por categoria (Chart.js)
+        'dados_categorias': {
+            'labels': labels,
+            'datasets': [{
+                'data': dados_grafico,
+                'backgroundColor': CORES_GRAFICO[:len(dados_grafico)],
+                'borderWidth': 1
+            }]
+        },
+    }
+
+
+def parte_orcamentos(usuario, ano, mes):
+    return _obter(
+        chave(usuario.pk, 'orcamentos', ano, mes), 'orcamentos',
+        lambda: orcamentos.consumo(usuario, ano, mes),
+    )
+
+
+def escolhas(usuario):
+    """Opções (id, rótulo) de 'categoria' e 'conta' do usuário, do cache."""
+    return {
+        'categoria': _obter(chave(usuario.pk, 'escolhas'), 'escolhas', lambda: _calcular_escolhas(usuario)),
+        # "Nome - R$ saldo", das contas já guardadas para o dashboard
+        'conta': [(conta.pk, str(conta)) for conta in parte_saldo(usuario)['contas']],
+    }
+
+
+def parte_saldo(usuario):
+    return _obter(chave(usuario.pk, 'saldo'), 'saldo', lambda: _calcular_saldo(usuario))
+
+
+def parte_recentes(usuario):
+    return _obter(chave(usuario.pk, 'recentes'), 'recentes', lambda: _calcular_recentes(usuario))
+
+
+def parte_mes(usuario, ano, mes):
+    return _obter(chave(usuario.pk, 'mes', ano, mes), 'mes', lambda: _calcular_mes(usuario, ano, mes))
+
+
+async def aparte_saldo(usuario):
+    return await _aobter(chave(usuario.pk, 'saldo'), 'saldo', lambda: _acalcular_saldo(usuario))
+
+
+async def aparte_recentes(usuario):
+    return await _aobter(chave(usuario.pk, 'recentes'), 'recentes', lambda: _acalcular_recentes(usuario))
+
+
+async def aparte_mes(usuario, ano, mes):
+    chave_cache = _chave_mes(usuario.pk, await _ageracao(usuario.pk), ano, mes)
+    return await _aobter(chave_cache, 'mes', lambda: _acalcular_mes(usuario, ano, mes))
+
+
+async def aparte_orcamentos(usuario, ano, mes):
+    chave_cache = _chave_mes(usuario.pk, await _ageracao(usuario.pk), ano, mes, 'orcamentos')
+    return await _aobter(chave_cache, 'orcamentos', lambda: orcamentos.aconsumo(usuario, ano, mes))
+
+
+def contexto_dashboard(usuario, hoje):
+    """Contexto do dashboard para o mês de `hoje`, montado a partir do cache."""
+    contexto = {}
+    contexto.update(parte_saldo(usuario))
+    contexto.update(parte_recentes(usuario))
+    contexto.update(parte_mes(usuario, hoje.year, hoje.month))
+    contexto.update(parte_orcamentos(usuario, hoje.year, hoje.month))
+    return contexto
+
+
+async def acontexto_dashboard(usuario, hoje):
+    """Versão assíncrona de contexto_dashboard (consultas ainda em sequência)."""
+    contexto = {}
+    for parte in await asyncio.gather(
+        aparte_saldo(usuario),
+        aparte_recentes(usuario),
+        aparte_mes(usuario, hoje.year, hoje.month),
+        aparte_orcamentos(usuario, hoje.year, hoje.month),
+    ):
+        contexto.update(parte)
+    return contexto
+
+
+def _marcar_alteracao(usuario_id):
+    _cache().set(f'dashboard:{usuario_id}:alterado_em', timezone.now().timestamp(), None)
+
+
+def ultima_alteracao(usuario_id):
+    """
+    Instante (aware, UTC) da última escrita nos dados do usuário. Sem
+    registro no cache, o instante atual passa a valer como referência.
+    """
+    instante = _cache().get_or_set(f'dashboard:{usuario_id}:alterado_em', lambda: timezone.now().timestamp(), None)
+    return datetime.fromtimestamp(instante, tz=dt_timezone.utc)
+
+
+def _depois_do_commit(funcao):
+    # Invalida só depois do commit, para que uma leitura concorrente não
+    # repopule o cache com os dados anteriores à escrita
+    transaction.on_commit(funcao)
+
+
+def invalidar(usuario_id, partes=(), meses=()):
+    """Remove as `partes` do usuário e os `meses` [(ano, mes), ...] indicados."""
+    def executar():
+        chaves = [chave(usuario_id, parte) for parte in partes]
+        chaves += [chave(usuario_id, parte, ano, mes) for parte in PARTES_MENSAIS for ano, mes in set(meses)]
+        _cache().delete_many(chaves)
+        _marcar_alteracao(usuario_id)
+    _depois_do_commit(executar)
+
+
+def invalidar_meses_do_usuario(usuario_id):
+    """Descarta todos os meses do usuário trocando a geração das chaves."""
+    def executar():
+        cache = _cache()
+        chave_geracao = f'dashboard:{usuario_id}:geracao'
+        cache.add(chave_geracao, 0, None)
+        try:
+            cache.incr(chave_geracao)
+        except ValueError:
+            cache.set(chave_geracao, 1, None)
+        _marcar_alteracao(usuario_id)
+    _depois_do_commit(executar)
+
+
+def limpar():
+    """Esvazia o cache usado pelo dashboard (benchmarks e manutenção)."""
+    _cache().clear()
+
+
+def estatisticas():
+    """Acertos, falhas e taxa de acerto por parte do contexto."""
+    cache = _cache()
+    nomes = [f'dashboard:estatisticas:{parte}:{resultado}' for parte in PARTES for resultado in ('acertos', 'falhas')]
+    valores = cache.get_many(nomes)
+    resultado = {}
+    for parte in PARTES:
+        acertos = valores.get(f'dashboard:estatisticas:{parte}:acertos', 0)
+        falhas = valores.get(f'dashboard:estatisticas:{parte}:falhas', 0)
+        total = acertos + falhas
+        resultado[parte] = {
+            'acertos': acertos,
+            'falhas': falhas,
+            'taxa_acerto': acertos / total if total else None,
+        }
+    return resultado
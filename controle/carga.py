@@ -0,0 +1,153 @@
+"""
+Teste de carga concorrente de leitura e escrita no banco.
+
+Escritores gravam transações pelo caminho normal (Transacao.save: a
+transação, o saldo da conta, o resumo mensal e o índice de busca) e
+leitores repetem as consultas dos relatórios e da lista de transações,
+cada um em seu processo e com sua própria conexão, como os workers do
+gunicorn. O resultado traz as operações por segundo de cada lado,
+os erros de "database is locked" e os PRAGMAs em vigor.
+
+O comando "carga_sqlite" roda a carga em um banco de testes descartável
+e pode compará-la com a configuração padrão do Django.
+"""
+import multiprocessing
+import time
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection, connections
+
+from . import paginacao, relatorios, sinteticos
+from .models import Categoria, Conta, Transacao
+
+PRAGMAS = ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size')
+
+# Variáveis de ambiente que reproduzem a configuração padrão do Django
+# (ver DATABASES em settings), usadas como linha de base
+CONFIGURACAO_PADRAO_DJANGO = {
+    'SQLITE_JOURNAL_MODE': 'DELETE',
+    'SQLITE_SYNCHRONOUS': 'FULL',
+    'SQLITE_TRANSACTION_MODE': 'DEFERRED',
+    'SQLITE_CACHE_SIZE_KIB': '2000',
+    'SQLITE_MMAP_SIZE': '0',
+    'DB_CONN_MAX_AGE': '0',
+}
+
+
+def configuracao_atual():
+    """PRAGMAs em vigor na conexão atual (vazio fora do SQLite)."""
+    if connection.vendor != 'sqlite':
+        return {}
+    configuracao = {}
+    with connection.cursor() as cursor:
+        for pragma in PRAGMAS:
+            cursor.execute(f'PRAGMA {pragma}')
+            configuracao[pragma] = cursor.fetchone()[0]
+    configuracao['transaction_mode'] = connection.transaction_mode or 'DEFERRED'
+    return configuracao
+
+
+def preparar_dados(transacoes=20_000, semente=0):
+    """Usuário "carga" com `transacoes` transações sintéticas."""
+    usuario = sinteticos.preparar_usuario('carga')
+    faltando = transacoes - Transacao.objects.filter(usuario=usuario).count()
+    if faltando > 0:
+        sinteticos.gerar_transacoes(usuario, faltando, dias=2 * 365, semente=semente)
+    return usuario
+
+
+def _ler(usuario, hoje):
+    fim = (hoje.year, hoje.month)
+    relatorios.totais_mensais(usuario, relatorios.somar_meses(*fim, -11), fim)
+    relatorios.serie_saldo(usuario, hoje.replace(day=1), hoje)
+    paginacao.paginar(Transacao.objects.filter(usuario=usuario).select_related('categoria', 'conta'))
+
+
+def _escrever(usuario, categorias, contas, indice):
+    Transacao.objects.create(
+        descricao=f'Carga {indice}',
+        valor=Decimal('12.34'),
+        data=date.today(),
+        categoria=categorias[indice % len(categorias)],
+        conta=contas[indice % len(contas)],
+        usuario=usuario,
+    )
+
+
+def _trabalhar(tipo, numero, usuario_id, fim):
+    # Roda em um processo filho, com conexão própria
+    usuario = User.objects.get(pk=usuario_id)
+    categorias = list(Categoria.objects.filter(usuario=usuario))
+    contas = list(Conta.objects.filter(usuario=usuario))
+    hoje = date.today()
+    latencias = []
+    erros = 0
+    indice = 0
+    try:
+        while time.monotonic() < fim:
+            inicio = time.perf_counter()
+            indice += 1
+            try:
+                if tipo == 'leituras':
+                    _ler(usuario, hoje)
+                else:
+                    _escrever(usuario, categorias, contas, numero * 1_000_000 + indice)
+            except OperationalError as erro:
+                if 'locked' not in str(erro):
+                    raise
+                erros += 1
+                continue
+            latencias.append((time.perf_counter() - inicio) * 1000)
+        return tipo, latencias, erros, None
+    except Exception as erro:
+        return tipo, latencias, erros, repr(erro)
+    finally:
+        connections.close_all()
+
+
+def executar(usuario, leitores=4, escritores=2, segundos=10.0):
+    """
+    Roda `leitores` e `escritores` processos por `segundos`, como workers
+    do gunicorn, e devolve as contagens, as vazões (operações/s), as
+    latências p95 (ms) e os erros.
+    """
+    # Os processos filhos não podem herdar a conexão aberta
+    connections.close_all()
+    tarefas = [('leituras', i) for i in range(leitores)] + [('escritas', i) for i in range(escritores)]
+    inicio = time.monotonic()
+    fim = inicio + segundos
+    with multiprocessing.get_context('fork').Pool(len(tarefas)) as pool:
+        retornos = pool.starmap(_trabalhar, [(tipo, numero, usuario.pk, fim) for tipo, numero in tarefas])
+    duracao = time.monotonic() - inicio
+
+    medidas = {'leituras': [], 'escritas': []}
+    resultado = {
+        'configuracao': configuracao_atual(),
+        'leitores': leitores,
+        'escritores': escritores,
+        'segundos': round(duracao, 2),
+        'erros_lock': 0,
+        'outros_erros': [],
+    }
+    for tipo, latencias, erros, outro_erro in retornos:
+        medidas[tipo].extend(latencias)
+        resultado['erros_lock'] += erros
+        if outro_erro:
+            resultado['outros_erros'].append(outro_erro)
+    for tipo, latencias in medidas.items():
+        resultado[tipo] = len(latencias)
+        resultado[f'{tipo}_s'] = round(len(latencias) / duracao, 1)
+        resultado[f'{tipo}_p95_ms'] = round(float(np.percentile(latencias, 95)), 2) if latencias else None
+    return resultado
+
+
+def resumo(resultado):
+    """Linha de texto com as vazões e os erros de um resultado."""
+    return (
+        f"{resultado['leituras_s']:>8.1f} leituras/s (p95 {resultado['leituras_p95_ms'] or 0:.0f}ms)  "
+        f"{resultado['escritas_s']:>7.1f} escritas/s (p95 {resultado['escritas_p95_ms'] or 0:.0f}ms)  "
+        f"{resultado['erros_lock']} erros de lock"
+    )
@@ -0,0 +1,207 @@
+"""
+Demonstrativo mensal de cada usuário, em HTML e PDF, gerado em lote.
+
+Os números são os do relatório mensal (relatorios.totais_mensais), mas
+lidos para um lote de usuários de uma vez com
+relatorios.totais_do_mes_por_usuario: uma consulta agrupada por lote,
+nunca uma por usuário. O desenho dos arquivos (template, gráfico e PDF
+do matplotlib) roda em um pool de processos, sem acesso ao banco.
+
+Os arquivos ficam em MEDIA_ROOT/demonstrativos/AAAA-MM/<usuário>.<formato>
+e são gravados em um temporário e renomeados: um usuário só conta como
+feito quando todos os seus arquivos existem, então rodar de novo depois
+de uma interrupção continua de onde parou.
+"""
+import io
+import multiprocessing
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.template.loader import render_to_string
+from matplotlib.backends.backend_pdf import FigureCanvasPdf
+from matplotlib.figure import Figure
+
+from . import graficos, relatorios
+
+FORMATOS = ('html', 'pdf')
+TAMANHO_LOTE = 200
+PROCESSOS = 4
+# A4 retrato, em polegadas
+TAMANHO_PDF = (8.27, 11.69)
+# Linhas de categoria que cabem na tabela da página do PDF
+MAXIMO_LINHAS_PDF = 20
+
+
+def diretorio(ano, mes):
+    return Path(settings.MEDIA_ROOT) / 'demonstrativos' / f'{ano}-{mes:02d}'
+
+
+def _arquivo(ano, mes, usuario_id, formato):
+    return diretorio(ano, mes) / f'{usuario_id}.{formato}'
+
+
+def pendentes(ano, mes, usuarios=None, formatos=FORMATOS):
+    """Ids dos usuários (todos ou os de `usuarios`) sem todos os arquivos do mês."""
+    existentes = set(os.listdir(diretorio(ano, mes))) if diretorio(ano, mes).is_dir() else set()
+    consulta = User.objects.filter(is_active=True).order_by('pk')
+    if usuarios is not None:
+        consulta = consulta.filter(pk__in=[u.pk for u in usuarios])
+    return [
+        usuario_id for usuario_id in consulta.values_list('pk', flat=True)
+        if any(f'{usuario_id}.{formato}' not in existentes for formato in formatos)
+    ]
+
+
+def _formatar(valor):
+    return f'R$ {float(valor):,.2f}'.replace(',', '_').replace('.', ',').replace('_', '.')
+
+
+def contexto(nome, ano, mes, totais):
+    """Contexto do template do demonstrativo a partir dos totais do mês."""
+    despesas = [c for c in totais['categorias'] if c['tipo'] == 'D']
+    total_despesas = totais['despesas'][0]
+    return {
+        'nome': nome,
+        'ano': ano,
+        'mes': mes,
+        'nome_mes': relatorios.NOMES_MESES[mes - 1],
+        'total_receitas': totais['receitas'][0],
+        'total_despesas': total_despesas,
+        'saldo_mensal': totais['saldos'][0],
+        'variacao_mensal': totais['variacao_mensal'][0],
+        'variacao_anual': totais['variacao_anual'][0],
+        'receitas_por_categoria': [c for c in totais['categorias'] if c['tipo'] == 'R'],
+        'despesas_por_categoria': [
+            {**c, 'percentual': float(c['total'] / total_despesas * 100) if total_despesas else 0}
+            for c in despesas
+        ],
+        'grafico': {
+            'titulo': f'Despesas por categoria - {relatorios.NOMES_MESES[mes - 1]}/{ano}',
+            'rotulos': [c['nome'] for c in despesas],
+            'valores': [float(c['total']) for c in despesas],
+        },
+    }
+
+
+def html(dados):
+    grafico = graficos.desenhar('categorias', dados['grafico'], 'png')
+    return render_to_string('controle/demonstrativo_mensal.html', {
+        **dados, 'grafico_uri': graficos.data_uri(grafico),
+    }).encode()
+
+
+def pdf(dados):
+    figura = Figure(figsize=TAMANHO_PDF)
+    FigureCanvasPdf(figura)
+    figura.text(0.08, 0.95, f"Demonstrativo de {dados['nome_mes']}/{dados['ano']}", fontsize=18, weight='bold')
+    figura.text(0.08, 0.925, dados['nome'], fontsize=11, color='#555555')
+
+    linhas = [
+        ('Receitas', dados['total_receitas'], dados['variacao_mensal']['receitas']),
+        ('Despesas', dados['total_despesas'], dados['variacao_mensal']['despesas']),
+        ('Saldo do mês', dados['saldo_mensal'], dados['variacao_mensal']['saldo']),
+    ]
+    for i, (rotulo, valor, variacao) in enumerate(linhas):
+        altura = 0.87 - i * 0.03
+        figura.text(0.08, altura, rotulo, fontsize=12)
+        figura.text(0.45, altura, _formatar(valor), fontsize=12, ha='right')
+        if variacao['percentual'] is not None:
+            figura.text(0.50, altura, f"{variacao['percentual']:+.1f}% vs mês anterior", fontsize=9, color='#555555')
+
+    eixo = figura.add_axes((0.1, 0.42, 0.8, 0.35))
+    graficos.desenhar_categorias(eixo, dados['grafico'])
+    eixo.set_title(dados['grafico']['titulo'])
+
+    tabela = figura.add_axes((0.08, 0.05, 0.84, 0.33))
+    tabela.set_axis_off()
+    categorias = (dados['receitas_por_categoria'] + dados['despesas_por_categoria'])[:MAXIMO_LINHAS_PDF]
+    if categorias:
+        tabela.table(
+            cellText=[
+                [c['nome'], 'Receita' if c['tipo'] == 'R' else 'Despesa', _formatar(c['total'])]
+                for c in categorias
+            ],
+            colLabels=['Categoria', 'Tipo', 'Total'],
+            cellLoc='left',
+            colLoc='left',
+            loc='upper center',
+        )
+
+    saida = io.BytesIO()
+    figura.savefig(saida, format='pdf', metadata={'CreationDate': None})
+    return saida.getvalue()
+
+
+RENDERIZADORES = {'html': html, 'pdf': pdf}
+
+
+def _gravar(arquivo, conteudo):
+    descritor, temporario = tempfile.mkstemp(dir=arquivo.parent, suffix='.tmp')
+    with os.fdopen(descritor, 'wb') as saida:
+        saida.write(conteudo)
+    os.replace(temporario, arquivo)
+
+
+def _gerar(tarefa):
+    # Roda nos processos do pool: só desenha e grava, sem tocar no banco
+    usuario_id, ano, mes, dados, formatos = tarefa
+    for formato in formatos:
+        arquivo = _arquivo(ano, mes, usuario_id, formato)
+        if not arquivo.exists():
+            _gravar(arquivo, RENDERIZADORES[formato](dados))
+    return usuario_id
+
+
+def _tarefas(usuario_ids, ano, mes, formatos):
+    nomes = {
+        usuario.pk: usuario.get_full_name() or usuario.username
+        for usuario in User.objects.filter(pk__in=usuario_ids).only('username', 'first_name', 'last_name')
+    }
+    totais = relatorios.totais_do_mes_por_usuario(usuario_ids, ano, mes)
+    return [
+        (usuario_id, ano, mes, contexto(nomes[usuario_id], ano, mes, totais[usuario_id]), formatos)
+        for usuario_id in usuario_ids
+    ]
+
+
+def gerar(ano, mes, usuarios=None, formatos=FORMATOS, processos=PROCESSOS,
+          tamanho_lote=TAMANHO_LOTE, refazer=False, relatar=None):
+    """
+    Gera os demonstrativos de `ano`/`mes` dos usuários ativos (ou dos
+    `usuarios`) que ainda não os têm; com `refazer`, apaga antes os já
+    gerados. `relatar`, se informado, recebe uma linha de progresso por
+    lote. Retorna um dicionário com o número de usuários pendentes, os
+    gerados e a duração.
+    """
+    diretorio(ano, mes).mkdir(parents=True, exist_ok=True)
+    if refazer:
+        ids = None if usuarios is None else {str(u.pk) for u in usuarios}
+        for arquivo in diretorio(ano, mes).iterdir():
+            # Só os formatos pedidos: os demais continuam valendo
+            if arquivo.suffix[1:] in formatos and (ids is None or arquivo.stem in ids):
+                arquivo.unlink()
+    faltando = pendentes(ano, mes, usuarios, formatos)
+    resultado = {'pendentes': len(faltando), 'gerados': 0}
+    inicio = time.monotonic()
+    if not faltando:
+        resultado['segundos'] = 0.0
+        return resultado
+
+    # Os filhos herdam a conexão aberta, mas não a usam: os dados vão prontos
+    with multiprocessing.get_context('fork').Pool(processos) as pool:
+        for posicao in range(0, len(faltando), tamanho_lote):
+            lote = faltando[posicao:posicao + tamanho_lote]
+            for _ in pool.imap_unordered(_gerar, _tarefas(lote, ano, mes, formatos)):
+                resultado['gerados'] += 1
+            if relatar:
+                decorrido = time.monotonic() - inicio
+                relatar(
+                    f"{resultado['gerados']}/{len(faltando)} usuários "
+                    f"({resultado['gerados'] / decorrido:.1f}/s)"
+                )
+    resultado['segundos'] = round(time.monotonic() - inicio, 2)
+    return resultado
@@ -0,0 +1,181 @@
+"""
+Exportação de transações em CSV, JSON Lines e XLSX.
+
+Os geradores daqui produzem o arquivo em pedaços à medida que as linhas
+chegam do banco (.iterator), para serem usados com StreamingHttpResponse
+sem carregar o histórico inteiro em memória.
+"""
+import csv
+import json
+import re
+import zipfile
+from datetime import date
+from xml.sax.saxutils import escape
+
+TAMANHO_BLOCO = 2000
+
+FORMATOS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
+
+CAMPOS = ('data', 'descricao', 'valor', 'categoria__tipo', 'categoria__nome', 'conta__nome', 'observacao')
+CABECALHO = ('Data', 'Descrição', 'Valor', 'Tipo', 'Categoria', 'Conta', 'Observação')
+
+# Início de célula que planilhas interpretam como fórmula
+_INICIO_FORMULA = ('=', '+', '-', '@', '\t', '\r')
+
+
+def linhas(queryset):
+    """Tuplas na ordem de CAMPOS, lidas do banco em blocos."""
+    return queryset.order_by('-data', '-id').values_list(*CAMPOS).iterator(chunk_size=TAMANHO_BLOCO)
+
+
+def texto_seguro(texto):
+    """Prefixa com ' o texto livre que seria lido como fórmula ao abrir o arquivo."""
+    texto = texto or ''
+    return f"'{texto}" if texto.startswith(_INICIO_FORMULA) else texto
+
+
+class _Eco:
+    # Buffer que só devolve o que recebe, para usar csv.writer em um gerador
+    def write(self, valor):
+        return valor
+
+
+def gerar_csv(queryset):
+    escritor = csv.writer(_Eco(), delimiter=';')
+    yield '\ufeff' + escritor.writerow(CABECALHO)
+    for data, descricao, valor, tipo, categoria, conta, observacao in linhas(queryset):
+        yield escritor.writerow((
+            data.strftime('%d/%m/%Y'), texto_seguro(descricao), f'{valor:.2f}'.replace('.', ','),
+            tipo, texto_seguro(categoria), texto_seguro(conta), texto_seguro(observacao),
+        ))
+
+
+def gerar_jsonl(queryset):
+    for data, descricao, valor, tipo, categoria, conta, observacao in linhas(queryset):
+        yield json.dumps({
+            'data': data.isoformat(),
+            'descricao': descricao,
+            'valor': str(valor),
+            'tipo': tipo,
+            'categoria': categoria,
+            'conta': conta,
+            'observacao': observacao,
+        }, ensure_ascii=False) + '\n'
+
+
+class _BufferZip:
+    # Arquivo "não pesquisável" para o zipfile: acumula bytes até serem consumidos
+    def __init__(self):
+        self.pedacos = []
+
+    def write(self, dados):
+        self.pedacos.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def esvaziar(self):
+        dados = b''.join(self.pedacos)
+        self.pedacos = []
+        return dados
+
+
+_XLSX_FIXOS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Transações" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    # Estilo 1: data (dd/mm/aaaa); estilo 2: valor com duas casas
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<numFmts count="1"><numFmt numFmtId="164" formatCode="dd/mm/yyyy"/></numFmts>'
+        '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="1"><fill><patternFill patternType="none"/></fill></fills>'
+        '<borders count="1"><border/></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="3">'
+        '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="4" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '</cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'
+    ),
+}
+
+_EPOCA_EXCEL = date(1899, 12, 30)
+_CARACTERES_INVALIDOS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _celula_texto(texto):
+    texto = _CARACTERES_INVALIDOS.sub('', texto_seguro(texto))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(texto)}</t></is></c>'
+
+
+def gerar_xlsx(queryset):
+    """Gera um XLSX mínimo (uma planilha, strings inline) em pedaços de bytes."""
+    buffer = _BufferZip()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as arquivo_zip:
+        for nome, conteudo in _XLSX_FIXOS.items():
+            arquivo_zip.writestr(nome, conteudo)
+        yield buffer.esvaziar()
+
+        with arquivo_zip.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as planilha:
+            planilha.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                '<row>' + ''.join(_celula_texto(titulo) for titulo in CABECALHO) + '</row>'
+            ).encode())
+
+            for indice, (data, descricao, valor, tipo, categoria, conta, observacao) in enumerate(linhas(queryset)):
+                planilha.write((
+                    f'<row><c s="1"><v>{(data - _EPOCA_EXCEL).days}</v></c>'
+                    f'{_celula_texto(descricao)}'
+                    f'<c s="2"><v>{valor}</v></c>'
+                    f'{_celula_texto(tipo)}{_celula_texto(categoria)}'
+                    f'{_celula_texto(conta)}{_celula_texto(observacao)}</row>'
+                ).encode())
+                if indice % TAMANHO_BLOCO == 0:
+                    yield buffer.esvaziar()
+
+            planilha.write(b'</sheetData></worksheet>')
+    yield buffer.esvaziar()
+
+
+GERADORES = {
+    'csv': gerar_csv,
+    'jsonl': gerar_jsonl,
+    'xlsx': gerar_xlsx,
+}
@@ -1,5 +1,9 @@
 from django import forms
-from .models import Categoria, Conta, Transacao
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from . import busca, cache, importacao, lancamentos, transferencias
+from .models import Categoria, Conta, Orcamento, Recorrencia, Transacao, Transferencia
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 
@@ -21,10 +25,70 @@ class ContaForm(forms.ModelForm):
             'saldo': forms.NumberInput(attrs={'class': 'form-control'}),
         }
 
-class TransacaoForm(forms.ModelForm):
+    def save(self, commit=True):
+        conta = super().save(commit=False)
+        if conta.pk is None:
+            conta.saldo_inicial = conta.saldo
+            if commit:
+                conta.save()
+            return conta
+
+        # Na edição o saldo informado vira um ajuste aplicado com F(), para não
+        # sobrescrever transações gravadas desde que o formulário foi aberto
+        ajuste = conta.saldo - self.initial['saldo']
+        if commit:
+            with transaction.atomic():
+                conta.save(update_fields=['nome'])
+                Conta.objects.filter(pk=conta.pk).update(
+                    saldo=F('saldo') + ajuste,
+                    saldo_inicial=F('saldo_inicial') + ajuste,
+                )
+            conta.refresh_from_db(fields=['saldo', 'saldo_inicial'])
+        return conta
+
+class EscolhaCarregadaField(forms.ModelChoiceField):
+    """
+    ModelChoiceField que, com `instancias` ({pk: objeto}) definidas, valida
+    o id enviado contra elas em vez de consultar o banco: nos lotes, cada
+    linha não custa uma consulta por select.
+    """
+    instancias = None
+
+    def to_python(self, value):
+        if self.instancias is None or value in self.empty_values:
+            return super().to_python(value)
+        try:
+            return self.instancias[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise forms.ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+
+class EscolhasUsuarioMixin:
+    """
+    Preenche os selects de categoria e conta com as opções do usuário
+    guardadas no cache (cache.escolhas), sem consultas ao renderizar. O
+    queryset continua filtrado pelo usuário e só é consultado para
+    validar o id enviado em um POST, a não ser que `instancias` já
+    carregadas sejam informadas (ver EscolhaCarregadaField).
+    """
+    def aplicar_escolhas(self, usuario, opcoes=None, instancias=None):
+        if opcoes is None:
+            opcoes = cache.escolhas(usuario)
+        querysets = {
+            'categoria': Categoria.objects.filter(usuario=usuario, transferencia=False),
+            'conta': Conta.objects.filter(usuario=usuario),
+        }
+        for nome, queryset in querysets.items():
+            campo = self.fields[nome]
+            campo.queryset = queryset
+            campo.choices = [('', campo.empty_label)] + opcoes[nome]
+            if instancias is not None:
+                campo.instancias = instancias[nome]
+
+class TransacaoForm(EscolhasUsuarioMixin, forms.ModelForm):
     class Meta:
         model = Transacao
         fields = ['descricao', 'valor', 'data', 'categoria', 'conta', 'observacao']
+        field_classes = {'categoria': EscolhaCarregadaField, 'conta': EscolhaCarregadaField}
         widgets = {
             'descricao': forms.TextInput(attrs={'class': 'form-control'}),
             'valor': forms.NumberInput(attrs={'class': 'form-control'}),
@@ -34,6 +98,257 @@ class TransacaoForm(forms.ModelForm):
             'observacao': forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
         }
 
+    def __init__(self, usuario, *args, opcoes=None, instancias=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.aplicar_escolhas(usuario, opcoes, instancias)
+
+    def _get_validation_exclusions(self):
+        exclusoes = super()._get_validation_exclusions()
+        if self.fields['categoria'].instancias is not None:
+            # Já validadas contra as instâncias carregadas para o lote; sem
+            # isso o full_clean do modelo faria um EXISTS por linha
+            exclusoes |= {'categoria', 'conta'}
+        return exclusoes
+
+class BaseLancamentoLoteFormSet(forms.BaseFormSet):
+    """
+    Várias transações em um envio. As opções dos selects e, num envio, as
+    categorias e contas do usuário são lidas uma vez para o lote inteiro
+    e repartidas entre as linhas. Linhas extras deixadas em branco são
+    ignoradas; com `exigir_todas` (lotes da API), são erro.
+    """
+    def __init__(self, usuario, data=None, *args, exigir_todas=False, **kwargs):
+        self.usuario = usuario
+        self.exigir_todas = exigir_todas
+        # Data inicial como date (o padrão do modelo é um datetime), para que
+        # linhas deixadas em branco não contem como alteradas
+        form_kwargs = {
+            'usuario': usuario,
+            'opcoes': cache.escolhas(usuario),
+            'initial': {'data': timezone.localdate()},
+        }
+        if data is not None:
+            form_kwargs['instancias'] = {
+                'categoria': {c.pk: c for c in Categoria.objects.filter(usuario=usuario, transferencia=False)},
+                'conta': {c.pk: c for c in Conta.objects.filter(usuario=usuario)},
+            }
+        super().__init__(data, *args, form_kwargs=form_kwargs, **kwargs)
+
+    def get_form_kwargs(self, index):
+        kwargs = super().get_form_kwargs(index)
+        if self.exigir_todas and index is not None:
+            kwargs['empty_permitted'] = False
+        return kwargs
+
+    @classmethod
+    def de_itens(cls, usuario, itens):
+        """Formset preenchido com uma lista de dicionários (corpo JSON), uma linha por item."""
+        prefixo = cls.get_default_prefix()
+        dados = {f'{prefixo}-TOTAL_FORMS': len(itens), f'{prefixo}-INITIAL_FORMS': 0}
+        for indice, item in enumerate(itens):
+            for campo, valor in item.items():
+                dados[f'{prefixo}-{indice}-{campo}'] = valor
+        return cls(usuario, dados, exigir_todas=True)
+
+    def clean(self):
+        if not any(form.has_changed() for form in self.forms):
+            raise forms.ValidationError('Preencha ao menos uma transação.')
+
+    def erros_por_linha(self):
+        """[{indice, erros: {campo: [mensagens]}}] das linhas inválidas."""
+        return [
+            {'indice': indice, 'erros': {campo: list(erros) for campo, erros in form.errors.items()}}
+            for indice, form in enumerate(self.forms)
+            if form.errors
+        ]
+
+    def transacoes(self):
+        """Transações não salvas das linhas preenchidas; chamar depois de is_valid()."""
+        transacoes = []
+        for form in self.forms:
+            if not form.cleaned_data:
+                continue
+            transacao = form.save(commit=False)
+            transacao.usuario = self.usuario
+            transacoes.append(transacao)
+        return transacoes
+
+LancamentoLoteFormSet = forms.formset_factory(
+    TransacaoForm,
+    formset=BaseLancamentoLoteFormSet,
+    extra=5,
+    max_num=lancamentos.MAXIMO_LOTE,
+    absolute_max=lancamentos.MAXIMO_LOTE,
+    validate_max=True,
+)
+
+class RecorrenciaForm(EscolhasUsuarioMixin, forms.ModelForm):
+    class Meta:
+        model = Recorrencia
+        fields = ['descricao', 'valor', 'categoria', 'conta', 'frequencia', 'intervalo',
+                  'data_inicio', 'data_fim', 'ativa', 'observacao']
+        widgets = {
+            'descricao': forms.TextInput(attrs={'class': 'form-control'}),
+            'valor': forms.NumberInput(attrs={'class': 'form-control'}),
+            'categoria': forms.Select(attrs={'class': 'form-select'}),
+            'conta': forms.Select(attrs={'class': 'form-select'}),
+            'frequencia': forms.Select(attrs={'class': 'form-select'}),
+            'intervalo': forms.NumberInput(attrs={'class': 'form-control', 'min': 1}),
+            'data_inicio': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}, format='%Y-%m-%d'),
+            'data_fim': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}, format='%Y-%m-%d'),
+            'ativa': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+            'observacao': forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
+        }
+
+    def __init__(self, usuario, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.aplicar_escolhas(usuario)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('valor') is not None and cleaned_data['valor'] <= 0:
+            self.add_error('valor', 'Informe um valor maior que zero.')
+        if cleaned_data.get('intervalo') == 0:
+            self.add_error('intervalo', 'O intervalo deve ser de pelo menos 1.')
+        data_inicio, data_fim = cleaned_data.get('data_inicio'), cleaned_data.get('data_fim')
+        if data_inicio and data_fim and data_fim < data_inicio:
+            self.add_error('data_fim', 'A data final não pode ser anterior à data inicial.')
+        return cleaned_data
+
+class TransferenciaForm(forms.ModelForm):
+    class Meta:
+        model = Transferencia
+        fields = ['origem', 'destino', 'valor', 'data', 'descricao']
+        widgets = {
+            'origem': forms.Select(attrs={'class': 'form-select'}),
+            'destino': forms.Select(attrs={'class': 'form-select'}),
+            'valor': forms.NumberInput(attrs={'class': 'form-control'}),
+            'data': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}, format='%Y-%m-%d'),
+            'descricao': forms.TextInput(attrs={'class': 'form-control'}),
+        }
+
+    def __init__(self, usuario, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['origem'].queryset = Conta.objects.filter(usuario=usuario)
+        self.fields['destino'].queryset = Conta.objects.filter(usuario=usuario)
+        self.fields['descricao'].required = False
+        self.fields['descricao'].initial = transferencias.DESCRICAO_PADRAO
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if self.errors:
+            return cleaned_data
+        try:
+            transferencias.validar(Transferencia(**cleaned_data))
+        except transferencias.ErroTransferencia as erro:
+            raise forms.ValidationError(str(erro))
+        return cleaned_data
+
+class OrcamentoForm(forms.ModelForm):
+    class Meta:
+        model = Orcamento
+        fields = ['categoria', 'limite', 'alerta']
+        widgets = {
+            'categoria': forms.Select(attrs={'class': 'form-select'}),
+            'limite': forms.NumberInput(attrs={'class': 'form-control'}),
+            'alerta': forms.NumberInput(attrs={'class': 'form-control', 'min': 1, 'max': 100}),
+        }
+
+    def __init__(self, usuario, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Só categorias de despesa que ainda não têm orçamento (além da atual, na edição)
+        categorias = Categoria.objects.filter(usuario=usuario, tipo='D', transferencia=False, orcamento__isnull=True)
+        if self.instance.pk:
+            categorias = categorias | Categoria.objects.filter(pk=self.instance.categoria_id)
+        self.fields['categoria'].queryset = categorias
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('limite') is not None and cleaned_data['limite'] <= 0:
+            self.add_error('limite', 'Informe um limite maior que zero.')
+        alerta = cleaned_data.get('alerta')
+        if alerta is not None and not 1 <= alerta <= 100:
+            self.add_error('alerta', 'O alerta deve ficar entre 1% e 100% do limite.')
+        return cleaned_data
+
+class FiltroTransacaoForm(forms.Form):
+    TIPO_CHOICES = (('', 'Todos'),) + Categoria.TIPO_CHOICES
+
+    data_inicio = forms.DateField(required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+    data_fim = forms.DateField(required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+    categoria = forms.ModelChoiceField(queryset=Categoria.objects.none(), required=False, empty_label='Todas',
+                                       widget=forms.Select(attrs={'class': 'form-select'}))
+    conta = forms.ModelChoiceField(queryset=Conta.objects.none(), required=False, empty_label='Todas',
+                                   widget=forms.Select(attrs={'class': 'form-select'}))
+    tipo = forms.ChoiceField(choices=TIPO_CHOICES, required=False, widget=forms.Select(attrs={'class': 'form-select'}))
+    q = forms.CharField(required=False, max_length=100,
+                        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Buscar...'}))
+
+    def __init__(self, usuario, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['categoria'].queryset = Categoria.objects.filter(usuario=usuario)
+        self.fields['conta'].queryset = Conta.objects.filter(usuario=usuario)
+
+    def filtrar(self, queryset):
+        # Aplica somente os filtros válidos: com erro em um campo, os demais
+        # continuam em cleaned_data
+        self.is_valid()
+        dados = getattr(self, 'cleaned_data', {})
+        if dados.get('data_inicio'):
+            queryset = queryset.filter(data__gte=dados['data_inicio'])
+        if dados.get('data_fim'):
+            queryset = queryset.filter(data__lte=dados['data_fim'])
+        if dados.get('categoria'):
+            queryset = queryset.filter(categoria=dados['categoria'])
+        if dados.get('conta'):
+            queryset = queryset.filter(conta=dados['conta'])
+        if dados.get('tipo'):
+            queryset = queryset.filter(categoria__tipo=dados['tipo'])
+        if dados.get('q'):
+            queryset = busca.filtrar(queryset, dados['q'])
+        return queryset
+
+class PeriodoExtratoForm(forms.Form):
+    data_inicio = forms.DateField(required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+    data_fim = forms.DateField(required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+
+    def periodo(self):
+        # (inicio, fim) válidos ou (None, None); datas com erro são ignoradas
+        dados = self.cleaned_data if self.is_valid() else {}
+        return dados.get('data_inicio'), dados.get('data_fim')
+
+class ImportacaoForm(forms.Form):
+    FORMATO_CHOICES = (
+        ('', 'Detectar pela extensão'),
+        ('csv', 'CSV'),
+        ('ofx', 'OFX'),
+    )
+
+    arquivo = forms.FileField(widget=forms.ClearableFileInput(attrs={'class': 'form-control'}))
+    formato = forms.ChoiceField(choices=FORMATO_CHOICES, required=False, widget=forms.Select(attrs={'class': 'form-select'}))
+    conta = forms.ModelChoiceField(queryset=Conta.objects.none(), required=False,
+                                   widget=forms.Select(attrs={'class': 'form-select'}))
+    categoria_receita = forms.ModelChoiceField(queryset=Categoria.objects.none(), required=False,
+                                               widget=forms.Select(attrs={'class': 'form-select'}))
+    categoria_despesa = forms.ModelChoiceField(queryset=Categoria.objects.none(), required=False,
+                                               widget=forms.Select(attrs={'class': 'form-select'}))
+
+    def __init__(self, usuario, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['conta'].queryset = Conta.objects.filter(usuario=usuario)
+        self.fields['categoria_receita'].queryset = Categoria.objects.filter(usuario=usuario, tipo='R', transferencia=False)
+        self.fields['categoria_despesa'].queryset = Categoria.objects.filter(usuario=usuario, tipo='D', transferencia=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        arquivo = cleaned_data.get('arquivo')
+        if arquivo and not cleaned_data.get('formato'):
+            formato = importacao.detectar_formato(arquivo.name)
+            if not formato:
+                raise forms.ValidationError('Não foi possível detectar o formato do arquivo. Selecione CSV ou OFX.')
+            cleaned_data['formato'] = formato
+        return cleaned_data
+
 class RegistroForm(UserCreationForm):
     email = forms.EmailField(required=True, widget=forms.EmailInput(attrs={'class': 'form-control'}))
     first_name = forms.CharField(required=True, widget=forms.TextInput(attrs={'class': 'form-control'}))
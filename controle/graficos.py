@@ -0,0 +1,265 @@
+"""
+Renderização dos gráficos no servidor (PNG ou SVG), com o matplotlib.
+
+Os mesmos gráficos que o Chart.js desenha no navegador: a pizza de
+despesas por categoria do mês e a linha do saldo diário de um período.
+Servem para relatórios em PDF, e-mails e clientes sem JavaScript.
+
+A renderização roda em um pool de processos (GRAFICOS_PROCESSOS), com a
+Figure ligada diretamente ao canvas Agg, sem pyplot; a thread ou o loop
+da requisição só espera o resultado. Com GRAFICOS_PROCESSOS = 0 o
+gráfico é desenhado no próprio processo.
+
+Cada imagem fica em disco, em GRAFICOS_CACHE_DIR/<usuário>/, com nome
+formado pelo tipo, o período e um hash dos dados: dados novos geram um
+arquivo novo e o antigo deixa de ser lido. Cada leitura atualiza o mtime
+do arquivo e, quando o diretório passa de GRAFICOS_CACHE_MAXIMO_BYTES,
+os arquivos lidos há mais tempo são apagados (LRU). Para não varrer o
+diretório a cada gravação, cada processo soma o tamanho do que grava ao
+total medido na última varredura e só varre de novo quando a soma passa
+do máximo ou depois de INTERVALO_VARREDURA segundos (o que os outros
+processos gravaram só aparece na varredura).
+"""
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+import django
+from django.conf import settings
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from . import relatorios, resumos
+from .cache import CORES_GRAFICO
+
+FORMATOS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+TIPOS = ('categorias', 'saldo')
+# Muda quando o desenho muda, para não servir imagens antigas do cache
+VERSAO = 1
+TAMANHO = (8, 4.5)
+DPI = 100
+# Depois de podar, o cache fica com esta fração do máximo
+FRACAO_APOS_PODA = 0.8
+# Segundos até a próxima varredura, mesmo sem a soma passar do máximo
+INTERVALO_VARREDURA = 300
+
+_pool = None
+_trava_pool = threading.Lock()
+_trava_poda = threading.Lock()
+# Diretório -> (bytes estimados, instante da última varredura)
+_tamanho_estimado = {}
+
+
+def dados_categorias(usuario, ano, mes):
+    """Dados da pizza de despesas por categoria do mês."""
+    totais = resumos.totais_por_categoria(usuario, ano, mes)
+    return {
+        'titulo': f'Despesas por categoria - {relatorios.NOMES_MESES[mes - 1]}/{ano}',
+        'rotulos': [categoria.nome for categoria, _ in totais],
+        'valores': [float(total) for _, total in totais],
+    }
+
+
+def dados_saldo(usuario, inicio, fim):
+    """Dados da linha do saldo diário de `inicio` a `fim`."""
+    serie = relatorios.serie_saldo(usuario, inicio, fim, projetar=True)
+    dados = {
+        'titulo': f"Saldo de {inicio.strftime('%d/%m/%Y')} a {fim.strftime('%d/%m/%Y')}",
+        'datas': [d.isoformat() for d in serie['datas']],
+        'saldos': serie['saldos'],
+    }
+    if 'projecao' in serie:
+        dados['projecao'] = serie['projecao']
+    return dados
+
+
+def desenhar_categorias(eixo, dados):
+    if not any(dados['valores']):
+        eixo.text(0.5, 0.5, 'Sem despesas no período', ha='center', va='center')
+        eixo.set_axis_off()
+        return
+    cores = [CORES_GRAFICO[i % len(CORES_GRAFICO)] for i in range(len(dados['valores']))]
+    eixo.pie(dados['valores'], labels=dados['rotulos'], colors=cores, autopct='%1.0f%%',
+             startangle=90, counterclock=False, wedgeprops={'linewidth': 1, 'edgecolor': 'white'})
+    eixo.axis('equal')
+
+
+def desenhar_saldo(eixo, dados):
+    # Datas como posições no eixo x, rotuladas como no Chart.js (dd/mm)
+    dias = range(len(dados['datas']))
+    eixo.plot(dias, dados['saldos'], color='#4BC0C0', linewidth=2, label='Saldo Acumulado')
+    eixo.fill_between(dias, dados['saldos'], color='#4BC0C0', alpha=0.2)
+    if 'projecao' in dados:
+        eixo.plot(dias, dados['projecao'], color='#9966FF', linewidth=2, linestyle='--',
+                  label='Projeção com Recorrências')
+        eixo.legend(loc='upper left')
+    passo = max(1, len(dados['datas']) // 10)
+    eixo.set_xticks(dias[::passo])
+    eixo.set_xticklabels([f'{data[8:10]}/{data[5:7]}' for data in dados['datas'][::passo]])
+    eixo.grid(True, alpha=0.3)
+    eixo.margins(x=0)
+
+
+def desenhar(tipo, dados, formato):
+    """Bytes da imagem do gráfico; roda nos processos do pool."""
+    figura = Figure(figsize=TAMANHO, dpi=DPI)
+    FigureCanvasAgg(figura)
+    eixo = figura.add_subplot()
+    if tipo == 'categorias':
+        desenhar_categorias(eixo, dados)
+    else:
+        desenhar_saldo(eixo, dados)
+    eixo.set_title(dados['titulo'])
+    figura.tight_layout()
+
+    saida = io.BytesIO()
+    # Sem data nos metadados, o mesmo gráfico gera sempre os mesmos bytes
+    metadados = {'Date': None} if formato == 'svg' else {}
+    figura.savefig(saida, format=formato, metadata=metadados)
+    return saida.getvalue()
+
+
+def _obter_pool():
+    global _pool
+    with _trava_pool:
+        if _pool is None:
+            # spawn: não herda threads nem conexões do servidor; cada
+            # processo configura o Django antes de importar este módulo
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.GRAFICOS_PROCESSOS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup,
+            )
+        return _pool
+
+
+def encerrar():
+    """Encerra o pool de processos; o próximo gráfico cria outro."""
+    global _pool
+    with _trava_pool:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def caminho(usuario_id, tipo, periodo, dados, formato):
+    """Arquivo do cache para o gráfico: (usuário, período, hash dos dados)."""
+    conteudo = json.dumps([VERSAO, tipo, dados], sort_keys=True, default=str)
+    resumo = hashlib.sha256(conteudo.encode()).hexdigest()[:32]
+    return Path(settings.GRAFICOS_CACHE_DIR) / str(usuario_id) / f'{tipo}-{periodo}-{resumo}.{formato}'
+
+
+def _ler_cache(arquivo):
+    try:
+        conteudo = arquivo.read_bytes()
+        # O mtime marca o último uso, para a poda LRU
+        os.utime(arquivo)
+    except FileNotFoundError:
+        return None
+    return conteudo
+
+
+def _gravar_cache(arquivo, conteudo):
+    arquivo.parent.mkdir(parents=True, exist_ok=True)
+    # Grava em um temporário e renomeia: um leitor nunca vê arquivo pela metade
+    descritor, temporario = tempfile.mkstemp(dir=arquivo.parent, suffix='.tmp')
+    with os.fdopen(descritor, 'wb') as saida:
+        saida.write(conteudo)
+    os.replace(temporario, arquivo)
+    _registrar_gravacao(len(conteudo))
+
+
+def _registrar_gravacao(tamanho):
+    # Soma a gravação à estimativa e só poda (varrendo o diretório) quando
+    # ela passa do máximo ou quando a última varredura ficou velha
+    raiz = str(settings.GRAFICOS_CACHE_DIR)
+    with _trava_poda:
+        estimado = _tamanho_estimado.get(raiz)
+        if estimado is not None and time.monotonic() - estimado[1] < INTERVALO_VARREDURA:
+            total = estimado[0] + tamanho
+            _tamanho_estimado[raiz] = (total, estimado[1])
+            if total <= settings.GRAFICOS_CACHE_MAXIMO_BYTES:
+                return
+    podar()
+
+
+def _varrer(raiz):
+    """(mtime, tamanho, caminho) de cada gráfico do cache."""
+    arquivos = []
+    for arquivo in raiz.glob('*/*.*'):
+        if arquivo.suffix[1:] not in FORMATOS:
+            continue
+        try:
+            estado = arquivo.stat()
+        except FileNotFoundError:
+            continue
+        arquivos.append((estado.st_mtime, estado.st_size, arquivo))
+    return arquivos
+
+
+def podar(maximo=None):
+    """Apaga os gráficos usados há mais tempo até o cache caber em `maximo` bytes."""
+    maximo = settings.GRAFICOS_CACHE_MAXIMO_BYTES if maximo is None else maximo
+    raiz = Path(settings.GRAFICOS_CACHE_DIR)
+    with _trava_poda:
+        arquivos = _varrer(raiz)
+        total = sum(tamanho for _, tamanho, _ in arquivos)
+        apagados = 0
+        if total > maximo:
+            for _, tamanho, arquivo in sorted(arquivos, key=lambda item: item[0]):
+                if total <= maximo * FRACAO_APOS_PODA:
+                    break
+                arquivo.unlink(missing_ok=True)
+                total -= tamanho
+                apagados += 1
+        _tamanho_estimado[str(raiz)] = (total, time.monotonic())
+        return apagados
+
+
+def renderizar(usuario, tipo, periodo, dados, formato='png'):
+    """Bytes do gráfico, do cache em disco ou desenhado no pool de processos."""
+    arquivo = caminho(usuario.pk, tipo, periodo, dados, formato)
+    conteudo = _ler_cache(arquivo)
+    if conteudo is None:
+        if settings.GRAFICOS_PROCESSOS:
+            try:
+                conteudo = _obter_pool().submit(desenhar, tipo, dados, formato).result()
+            except BrokenProcessPool:
+                encerrar()
+                raise
+        else:
+            conteudo = desenhar(tipo, dados, formato)
+        _gravar_cache(arquivo, conteudo)
+    return conteudo
+
+
+async def arenderizar(usuario, tipo, periodo, dados, formato='png'):
+    """Versão assíncrona de renderizar: o loop fica livre enquanto o pool desenha."""
+    arquivo = caminho(usuario.pk, tipo, periodo, dados, formato)
+    conteudo = await asyncio.to_thread(_ler_cache, arquivo)
+    if conteudo is None:
+        if settings.GRAFICOS_PROCESSOS:
+            try:
+                conteudo = await asyncio.wrap_future(_obter_pool().submit(desenhar, tipo, dados, formato))
+            except BrokenProcessPool:
+                encerrar()
+                raise
+        else:
+            conteudo = await asyncio.to_thread(desenhar, tipo, dados, formato)
+        await asyncio.to_thread(_gravar_cache, arquivo, conteudo)
+    return conteudo
+
+
+def data_uri(conteudo, formato='png'):
+    """URI data: da imagem, para embutir em e-mails e PDFs."""
+    return f"data:{FORMATOS[formato]};base64,{base64.b64encode(conteudo).decode('ascii')}"
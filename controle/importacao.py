@@ -0,0 +1,311 @@
+"""
+Importação de extratos bancários (CSV e OFX).
+
+Os arquivos são lidos de forma incremental, linha a linha (CSV) ou em
+blocos (OFX), e as transações são gravadas em lotes com
+lancamentos.inserir_em_lote. Cada linha recebe um hash que permite
+reimportar o mesmo arquivo sem duplicar transações.
+"""
+import csv
+import hashlib
+import io
+import unicodedata
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import IntegrityError
+
+from .lancamentos import TAMANHO_LOTE, inserir_em_lote
+from .models import Categoria, Conta, Transacao
+
+FORMATOS = ('csv', 'ofx')
+MAXIMO_ERROS = 100
+VALOR_MAXIMO = Decimal('99999999.99')
+
+# Nomes aceitos para cada coluna do CSV (já normalizados)
+COLUNAS_CSV = {
+    'data': ('data', 'date', 'dt'),
+    'descricao': ('descricao', 'historico', 'description', 'memo'),
+    'valor': ('valor', 'amount', 'quantia'),
+    'categoria': ('categoria', 'category'),
+    'conta': ('conta', 'account'),
+    'tipo': ('tipo', 'type'),
+    'observacao': ('observacao', 'obs', 'notes'),
+}
+
+
+class ErroLinha(ValueError):
+    pass
+
+
+def _normalizar(texto):
+    texto = unicodedata.normalize('NFKD', texto or '').encode('ascii', 'ignore').decode()
+    return texto.strip().lower()
+
+
+def converter_valor(texto):
+    """Aceita '1.234,56', '1,234.56', '-12.50' e 'R$ 10,00'."""
+    texto = (texto or '').replace('R$', '').replace(' ', '').strip()
+    if ',' in texto and '.' in texto:
+        if texto.rfind(',') > texto.rfind('.'):
+            texto = texto.replace('.', '').replace(',', '.')
+        else:
+            texto = texto.replace(',', '')
+    else:
+        texto = texto.replace(',', '.')
+    try:
+        valor = Decimal(texto).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ErroLinha(f'Valor inválido: {texto!r}')
+    # NaN passa pelo quantize, mas não pode ser comparado
+    if not valor.is_finite():
+        raise ErroLinha(f'Valor inválido: {texto!r}')
+    if not valor or abs(valor) > VALOR_MAXIMO:
+        raise ErroLinha(f'Valor fora do intervalo permitido: {texto!r}')
+    return valor
+
+
+def converter_data(texto):
+    """Aceita AAAA-MM-DD, DD/MM/AAAA e o formato do OFX (AAAAMMDD...)."""
+    texto = (texto or '').strip()
+    for formato, tamanho in (('%Y-%m-%d', 10), ('%d/%m/%Y', 10), ('%Y%m%d', 8)):
+        try:
+            return datetime.strptime(texto[:tamanho], formato).date()
+        except ValueError:
+            continue
+    raise ErroLinha(f'Data inválida: {texto!r}')
+
+
+def _tipo_informado(texto):
+    texto = _normalizar(texto)
+    if texto in ('r', 'receita', 'credito', 'c', 'credit'):
+        return 'R'
+    if texto in ('d', 'despesa', 'debito', 'debit'):
+        return 'D'
+    return None
+
+
+def ler_csv(arquivo):
+    """
+    Gera um dicionário por linha de um CSV com cabeçalho. O separador
+    (vírgula ou ponto e vírgula) é detectado na primeira linha.
+    """
+    cabecalho = arquivo.readline()
+    separador = ';' if cabecalho.count(';') > cabecalho.count(',') else ','
+    try:
+        nomes = [_normalizar(nome) for nome in next(csv.reader([cabecalho], delimiter=separador), [])]
+    except csv.Error as erro:
+        raise ErroLinha(f'Cabeçalho do CSV inválido: {erro}')
+
+    indices = {}
+    for campo, apelidos in COLUNAS_CSV.items():
+        for apelido in apelidos:
+            if apelido in nomes:
+                indices[campo] = nomes.index(apelido)
+                break
+    faltando = {'data', 'descricao', 'valor'} - set(indices)
+    if faltando:
+        raise ErroLinha(f"Colunas obrigatórias ausentes: {', '.join(sorted(faltando))}")
+
+    leitor = csv.reader(arquivo, delimiter=separador)
+    numero = 1
+    while True:
+        numero += 1
+        try:
+            linha = next(leitor)
+        except StopIteration:
+            return
+        except csv.Error as erro:
+            # Um erro do leitor (campo grande demais, aspas quebradas) deixa
+            # o restante do arquivo sem posição confiável
+            raise ErroLinha(f'Linha {numero}: CSV inválido ({erro})')
+        if not any(linha):
+            continue
+        yield numero, {
+            campo: linha[indice] if indice < len(linha) else ''
+            for campo, indice in indices.items()
+        }
+
+
+def _partes_ofx(arquivo, tamanho_bloco=64 * 1024):
+    # Divide o arquivo em trechos "TAG>valor" sem carregá-lo inteiro
+    resto = ''
+    while True:
+        bloco = arquivo.read(tamanho_bloco)
+        if not bloco:
+            break
+        partes = (resto + bloco).split('<')
+        resto = partes.pop()
+        yield from partes
+    yield resto
+
+
+def ler_ofx(arquivo):
+    """Gera um dicionário por <STMTTRN> de um arquivo OFX (SGML ou XML)."""
+    atual = None
+    numero = 0
+    for parte in _partes_ofx(arquivo):
+        tag, separador, valor = parte.partition('>')
+        if not separador:
+            continue
+        tag = tag.strip().upper()
+        if tag == 'STMTTRN':
+            atual = {}
+        elif tag == '/STMTTRN' and atual is not None:
+            numero += 1
+            yield numero, {
+                'data': atual.get('DTPOSTED', ''),
+                'descricao': atual.get('MEMO') or atual.get('NAME', ''),
+                'valor': atual.get('TRNAMT', ''),
+                'identificador': atual.get('FITID', ''),
+            }
+            atual = None
+        elif atual is not None and not tag.startswith('/'):
+            atual[tag] = valor.strip()
+
+
+def abrir_texto(arquivo, formato):
+    """Envolve um arquivo binário em texto, respeitando o charset do cabeçalho OFX."""
+    encoding = 'utf-8-sig'
+    if formato == 'ofx':
+        inicio = arquivo.read(1024)
+        arquivo.seek(0)
+        if b'CHARSET:1252' in inicio or b'ENCODING:USASCII' in inicio:
+            encoding = 'cp1252'
+    return io.TextIOWrapper(arquivo, encoding=encoding, errors='replace', newline='')
+
+
+def importar(usuario, linhas, conta=None, categoria_receita=None, categoria_despesa=None,
+             tamanho_lote=TAMANHO_LOTE):
+    """
+    Grava as `linhas` geradas por ler_csv/ler_ofx para o `usuario`.
+
+    `conta` é usada quando a linha não traz a conta, e as categorias
+    padrão quando a linha não traz uma categoria conhecida (escolhidas
+    pelo sinal do valor). Retorna um dicionário com os totais e até
+    MAXIMO_ERROS mensagens de erro.
+
+    Cada lote é gravado na sua própria transação. Se a leitura do arquivo
+    falhar (ErroLinha vindo de `linhas`) depois de algum lote, os lotes
+    anteriores ficam gravados e o erro volta em 'interrompida'; reimportar
+    o arquivo corrigido ignora o que já entrou. Antes de qualquer linha
+    lida, o erro é propagado.
+    """
+    categorias = {}
+    for categoria in Categoria.objects.filter(usuario=usuario, transferencia=False):
+        categorias.setdefault((_normalizar(categoria.nome), categoria.tipo), categoria)
+        categorias.setdefault((_normalizar(categoria.nome), None), categoria)
+    contas = {_normalizar(c.nome): c for c in Conta.objects.filter(usuario=usuario)}
+    padrao = {'R': categoria_receita, 'D': categoria_despesa}
+
+    resultado = {'lidas': 0, 'importadas': 0, 'duplicadas': 0, 'com_erro': 0, 'erros': [], 'interrompida': None}
+    ocorrencias = {}
+
+    def montar(dados):
+        valor = converter_valor(dados['valor'])
+        tipo = _tipo_informado(dados.get('tipo')) or ('D' if valor < 0 else 'R')
+        nome_categoria = _normalizar(dados.get('categoria'))
+        categoria = (
+            categorias.get((nome_categoria, tipo))
+            or categorias.get((nome_categoria, None))
+            or padrao[tipo]
+        )
+        if categoria is None:
+            raise ErroLinha('Categoria não encontrada e nenhuma categoria padrão informada')
+        conta_linha = contas.get(_normalizar(dados.get('conta'))) or conta
+        if conta_linha is None:
+            raise ErroLinha('Conta não encontrada e nenhuma conta padrão informada')
+
+        transacao = Transacao(
+            descricao=(dados['descricao'] or '').strip()[:200] or 'Importado',
+            valor=abs(valor),
+            data=converter_data(dados['data']),
+            categoria=categoria,
+            conta=conta_linha,
+            observacao=(dados.get('observacao') or '').strip() or None,
+            usuario=usuario,
+        )
+
+        # O FITID do OFX identifica a transação; no CSV, linhas idênticas
+        # no mesmo arquivo são diferenciadas pela ordem em que aparecem
+        if dados.get('identificador'):
+            chave = f"{conta_linha.pk}|ofx|{dados['identificador']}"
+        else:
+            chave = f'{conta_linha.pk}|{transacao.data}|{valor}|{_normalizar(transacao.descricao)}'
+            digest = hashlib.sha256(chave.encode()).digest()
+            ocorrencias[digest] = ocorrencias.get(digest, 0) + 1
+            chave = f'{chave}|{ocorrencias[digest]}'
+        transacao.hash_importacao = hashlib.sha256(chave.encode()).hexdigest()
+        return transacao
+
+    linhas = iter(linhas)
+    while resultado['interrompida'] is None:
+        lote = []
+        try:
+            for item in islice(linhas, tamanho_lote):
+                lote.append(item)
+        except ErroLinha as erro:
+            if not resultado['lidas'] and not lote:
+                raise
+            resultado['interrompida'] = str(erro)
+        if not lote:
+            break
+        resultado['lidas'] += len(lote)
+
+        novas = {}
+        for numero, dados in lote:
+            try:
+                transacao = montar(dados)
+            except ErroLinha as erro:
+                resultado['com_erro'] += 1
+                if len(resultado['erros']) < MAXIMO_ERROS:
+                    resultado['erros'].append(f'Linha {numero}: {erro}')
+                continue
+            if transacao.hash_importacao in novas:
+                resultado['duplicadas'] += 1
+                continue
+            novas[transacao.hash_importacao] = transacao
+
+        for tentativa in range(2):
+            # Filtrar só pelo hash deixa o SQLite usar o índice único
+            # (hash_importacao, usuario) em vez de percorrer as linhas do usuário
+            existentes = {
+                hash_importacao
+                for hash_importacao, usuario_id in Transacao.objects.filter(
+                    hash_importacao__in=list(novas),
+                ).values_list('hash_importacao', 'usuario_id')
+                if usuario_id == usuario.pk
+            }
+            try:
+                criadas = inserir_em_lote(
+                    [t for h, t in novas.items() if h not in existentes],
+                    tamanho_lote=tamanho_lote,
+                )
+                break
+            except IntegrityError:
+                # Uma importação simultânea gravou linhas do lote entre a
+                # consulta e o INSERT: o lote voltou atrás e é conferido de novo
+                if tentativa:
+                    raise
+        resultado['duplicadas'] += len(existentes)
+        resultado['importadas'] += len(criadas)
+
+    return resultado
+
+
+def importar_arquivo(usuario, arquivo, formato, **opcoes):
+    """Lê `arquivo` (binário) no `formato` indicado e importa as transações."""
+    if formato not in FORMATOS:
+        raise ErroLinha(f'Formato não suportado: {formato}')
+    texto = abrir_texto(arquivo, formato)
+    try:
+        linhas = ler_csv(texto) if formato == 'csv' else ler_ofx(texto)
+        return importar(usuario, linhas, **opcoes)
+    finally:
+        texto.detach()
+
+
+def detectar_formato(nome_arquivo):
+    extensao = nome_arquivo.rsplit('.', 1)[-1].lower() if '.' in nome_arquivo else ''
+    return extensao if extensao in FORMATOS else None
@@ -0,0 +1,211 @@
+"""
+Instrumentação de requisições: consultas SQL, tempo de banco e de templates.
+
+InstrumentacaoMiddleware mede cada requisição e publica o resultado no
+cabeçalho Server-Timing e em um log estruturado (JSON) no logger
+"controle.instrumentacao". Requisições acima dos limites configurados
+são registradas com nível WARNING; as demais, com INFO.
+
+As consultas são capturadas por um execute_wrapper, que funciona também
+com DEBUG desligado. As conexões do Django são por thread e, no ASGI, o
+ORM roda em outra thread (sync_to_async), então o wrapper fica instalado
+em toda conexão criada (sinal connection_created) e encontra a medição
+em andamento por uma ContextVar, que o asgiref leva para essa thread. O
+tempo de renderização vem do backend de templates DjangoTemplatesMedidos
+(ver TEMPLATES em settings).
+
+Nos testes, medir() dá acesso às mesmas medições para verificar o
+orçamento de consultas de cada view.
+"""
+import heapq
+import json
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger('controle.instrumentacao')
+
+_medicao_atual = ContextVar('medicao_atual', default=None)
+
+
+def _config(nome, padrao):
+    return getattr(settings, f'INSTRUMENTACAO_{nome}', padrao)
+
+
+class Medicao:
+    """Acumula as consultas e o tempo de templates de um trecho de código."""
+
+    def __init__(self, consultas_lentas=None):
+        self.consultas = 0
+        self.tempo_banco = 0.0
+        self.tempo_templates = 0.0
+        self.inicio = time.perf_counter()
+        self.fim = None
+        self._maximo_lentas = consultas_lentas if consultas_lentas is not None else _config('CONSULTAS_LENTAS', 3)
+        self._lentas = []
+        # Medição que envolve esta (medir() aninhado), que também recebe o tempo de templates
+        self.pai = None
+
+    def registrar_consulta(self, sql, duracao):
+        self.consultas += 1
+        self.tempo_banco += duracao
+        if self._maximo_lentas:
+            item = (duracao, self.consultas, sql)
+            if len(self._lentas) < self._maximo_lentas:
+                heapq.heappush(self._lentas, item)
+            else:
+                heapq.heappushpop(self._lentas, item)
+
+    def encerrar(self):
+        self.fim = time.perf_counter()
+
+    @property
+    def tempo_total(self):
+        return (self.fim or time.perf_counter()) - self.inicio
+
+    @property
+    def consultas_lentas(self):
+        """Até CONSULTAS_LENTAS pares (sql, ms), da mais lenta para a mais rápida."""
+        return [(sql, duracao * 1000) for duracao, _, sql in sorted(self._lentas, reverse=True)]
+
+    def server_timing(self):
+        return ', '.join((
+            f'db;dur={self.tempo_banco * 1000:.1f};desc="{self.consultas} consultas"',
+            f'tpl;dur={self.tempo_templates * 1000:.1f}',
+            f'total;dur={self.tempo_total * 1000:.1f}',
+        ))
+
+    def como_dict(self):
+        return {
+            'consultas': self.consultas,
+            'tempo_banco_ms': round(self.tempo_banco * 1000, 2),
+            'tempo_templates_ms': round(self.tempo_templates * 1000, 2),
+            'tempo_total_ms': round(self.tempo_total * 1000, 2),
+            'consultas_lentas': [
+                {'sql': sql[:500], 'ms': round(ms, 2)} for sql, ms in self.consultas_lentas
+            ],
+        }
+
+
+def _capturar(execute, sql, params, many, context):
+    # Assinatura de connection.execute_wrapper; fora de medir() só executa
+    medicao = _medicao_atual.get()
+    if medicao is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duracao = time.perf_counter() - inicio
+        while medicao is not None:
+            medicao.registrar_consulta(sql, duracao)
+            medicao = medicao.pai
+
+
+def _instalar(conexao):
+    if _capturar not in conexao.execute_wrappers:
+        conexao.execute_wrappers.append(_capturar)
+
+
+@receiver(connection_created)
+def instalar_na_conexao(sender, connection, **kwargs):
+    _instalar(connection)
+
+
+@contextmanager
+def medir(consultas_lentas=None):
+    """
+    Mede as consultas (de todos os bancos, em qualquer thread que herde o
+    contexto) e templates do bloco.
+    """
+    # Conexões desta thread abertas antes da importação deste módulo
+    for conexao in connections.all():
+        _instalar(conexao)
+    medicao = Medicao(consultas_lentas)
+    medicao.pai = _medicao_atual.get()
+    token = _medicao_atual.set(medicao)
+    try:
+        yield medicao
+    finally:
+        medicao.encerrar()
+        _medicao_atual.reset(token)
+
+
+class _TemplateMedido:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, nome):
+        return getattr(self.template, nome)
+
+    def render(self, context=None, request=None):
+        medicao = _medicao_atual.get()
+        if medicao is None:
+            return self.template.render(context, request)
+        inicio = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            duracao = time.perf_counter() - inicio
+            while medicao is not None:
+                medicao.tempo_templates += duracao
+                medicao = medicao.pai
+
+
+class DjangoTemplatesMedidos(DjangoTemplates):
+    """Backend DjangoTemplates que soma o tempo de render à medição atual."""
+
+    def from_string(self, template_code):
+        return _TemplateMedido(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TemplateMedido(super().get_template(template_name))
+
+
+class InstrumentacaoMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with medir() as medicao:
+            response = self.get_response(request)
+        return self.publicar(request, response, medicao)
+
+    async def __acall__(self, request):
+        with medir() as medicao:
+            response = await self.get_response(request)
+        return self.publicar(request, response, medicao)
+
+    def publicar(self, request, response, medicao):
+        if _config('SERVER_TIMING', True):
+            response['Server-Timing'] = medicao.server_timing()
+
+        match = request.resolver_match
+        dados = {
+            'metodo': request.method,
+            'caminho': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            **medicao.como_dict(),
+        }
+        excedeu = (
+            medicao.consultas > _config('LIMITE_CONSULTAS', 50)
+            or medicao.tempo_total * 1000 > _config('LIMITE_MS', 1000)
+        )
+        logger.log(logging.WARNING if excedeu else logging.INFO, json.dumps(dados, ensure_ascii=False), extra={'instrumentacao': dados})
+        return response
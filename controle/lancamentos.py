@@ -0,0 +1,48 @@
+"""
+Inserção de transações em lote.
+
+Usado pelos caminhos que gravam muitas transações de uma vez (importação
+de extratos e lançamento em lote, por exemplo). As linhas entram com bulk_create, sem passar
+por Transacao.save, e os efeitos colaterais são aplicados uma vez por
+lote: um UPDATE de saldo por conta e um por chave de resumo mensal.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+
+from . import resumos
+from .models import Conta, Transacao, sinal_do_tipo
+from .signals import transacoes_em_lote
+
+TAMANHO_LOTE = 1000
+# Limite de transações por envio do lançamento em lote (página e AJAX)
+MAXIMO_LOTE = 500
+
+
+def movimentos_por_conta(transacoes):
+    """Soma com sinal por conta; exige `categoria` já carregada em cada transação."""
+    movimentos = defaultdict(int)
+    for transacao in transacoes:
+        movimentos[transacao.conta_id] += sinal_do_tipo(transacao.categoria.tipo) * transacao.valor
+    return movimentos
+
+
+def inserir_em_lote(transacoes, tamanho_lote=TAMANHO_LOTE):
+    """
+    Grava `transacoes` (instâncias não salvas) e atualiza saldos e resumos
+    em uma única transação do banco. Retorna a lista de objetos criados.
+    """
+    transacoes = list(transacoes)
+    if not transacoes:
+        return []
+
+    with transaction.atomic():
+        criadas = Transacao.objects.bulk_create(transacoes, batch_size=tamanho_lote)
+        Conta.aplicar_movimentos(movimentos_por_conta(criadas))
+        resumos.aplicar_deltas(resumos.deltas_de_transacoes(criadas))
+        transacoes_em_lote.send(sender=Transacao, transacoes=criadas)
+    # bulk_create não passa por from_db: sem isso uma edição posterior da
+    # instância seria tratada como inclusão e contaria o valor duas vezes
+    for transacao in criadas:
+        transacao.guardar_estado_original()
+    return criadas
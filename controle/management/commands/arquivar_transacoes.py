@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from controle import arquivamento
+
+
+class Command(BaseCommand):
+    help = (
+        'Move as transações dos anos anteriores ao horizonte para arquivos .jsonl.gz em '
+        'ARQUIVO_TRANSACOES_DIR, deixando os totais por conta, categoria e mês. Com --restaurar, '
+        'devolve um ano arquivado à tabela de transações.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', help='Arquiva (ou restaura) apenas as transações deste username.')
+        parser.add_argument('--anos', type=int, default=settings.ARQUIVO_TRANSACOES_ANOS,
+                            help='Anos completos, além do atual, que ficam na tabela '
+                                 f'(padrão: {settings.ARQUIVO_TRANSACOES_ANOS}).')
+        parser.add_argument('--restaurar', type=int, metavar='ANO',
+                            help='Restaura o ano arquivado do --usuario.')
+
+    def handle(self, *args, **options):
+        usuario = None
+        if options['usuario']:
+            try:
+                usuario = User.objects.get(username=options['usuario'])
+            except User.DoesNotExist:
+                raise CommandError(f"Usuário '{options['usuario']}' não encontrado.")
+
+        if options['restaurar'] is not None:
+            if usuario is None:
+                raise CommandError('Informe o --usuario do ano a restaurar.')
+            try:
+                total = arquivamento.restaurar_ano(usuario.pk, options['restaurar'])
+            except arquivamento.ErroArquivo as erro:
+                raise CommandError(str(erro))
+            self.stdout.write(self.style.SUCCESS(f"{total} transações de {options['restaurar']} restauradas."))
+            return
+
+        if options['anos'] < 0:
+            raise CommandError('--anos não pode ser negativo.')
+        resultado = arquivamento.arquivar(
+            usuario.pk if usuario else None, options['anos'], relatar=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado['transacoes']} transações de {resultado['anos']} anos arquivadas em "
+            f"{settings.ARQUIVO_TRANSACOES_DIR}."
+        ))
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from controle import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede latência (p50/p95), consultas e pico de memória das views principais '
+        'com históricos sintéticos de vários tamanhos, em um banco de testes descartável.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamanhos', default=','.join(str(t) for t in benchmark.TAMANHOS),
+                            help='Tamanhos de histórico separados por vírgula (padrão: 1000,100000,1000000).')
+        parser.add_argument('--repeticoes', type=int, default=benchmark.REPETICOES)
+        parser.add_argument('--cenarios', help='Cenários separados por vírgula (padrão: todos).')
+        parser.add_argument('--semente', type=int, default=0)
+        parser.add_argument('--saida', help='Arquivo JSON onde gravar os resultados.')
+        parser.add_argument('--comparar', help='JSON de uma execução anterior para comparar.')
+        parser.add_argument('--manter-banco', action='store_true',
+                            help='Reaproveita o banco de testes (e os dados gerados) entre execuções.')
+
+    def handle(self, *args, **options):
+        try:
+            tamanhos = [int(t) for t in options['tamanhos'].split(',')]
+        except ValueError:
+            raise CommandError('--tamanhos deve ser uma lista de inteiros separados por vírgula.')
+        cenarios = options['cenarios'].split(',') if options['cenarios'] else None
+        try:
+            anterior = benchmark.carregar(options['comparar']) if options['comparar'] else None
+        except (OSError, ValueError) as erro:
+            raise CommandError(f'Não foi possível ler {options["comparar"]}: {erro}')
+
+        setup_test_environment()
+        nome_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['manter_banco'])
+        try:
+            resultado = benchmark.executar(
+                tamanhos,
+                repeticoes=options['repeticoes'],
+                cenarios=cenarios,
+                semente=options['semente'],
+                relatar=self.stdout.write,
+            )
+        finally:
+            connection.creation.destroy_test_db(nome_original, verbosity=0, keepdb=options['manter_banco'])
+            teardown_test_environment()
+
+        if options['saida']:
+            benchmark.salvar(resultado, options['saida'])
+            self.stdout.write(self.style.SUCCESS(f"Resultados gravados em {options['saida']}."))
+        if anterior:
+            self.stdout.write('Comparação com a execução anterior:')
+            for linha in benchmark.comparar(anterior, resultado):
+                self.stdout.write(linha)
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from controle import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara as views síncronas (WSGI) do dashboard e dos relatórios com as versões '
+        'async (ASGI) sob requisições concorrentes, em um banco de testes descartável.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transacoes', type=int, default=100_000,
+                            help='Tamanho do histórico sintético (padrão: 100000).')
+        parser.add_argument('--concorrencia', type=int, default=benchmark.CONCORRENCIA,
+                            help='Clientes simultâneos (threads no WSGI, tarefas no ASGI).')
+        parser.add_argument('--requisicoes', type=int, default=benchmark.REPETICOES,
+                            help='Requisições por cliente.')
+        parser.add_argument('--semente', type=int, default=0)
+        parser.add_argument('--saida', help='Arquivo JSON onde gravar os resultados.')
+        parser.add_argument('--manter-banco', action='store_true',
+                            help='Reaproveita o banco de testes (e os dados gerados) entre execuções.')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        nome_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['manter_banco'])
+        try:
+            usuario = benchmark.preparar_dados(options['transacoes'], semente=options['semente'])
+            self.stdout.write(f"{options['transacoes']} transações prontas; "
+                              f"{options['concorrencia']} clientes simultâneos")
+            resultados = benchmark.comparar_asgi_wsgi(
+                usuario,
+                concorrencia=options['concorrencia'],
+                requisicoes=options['requisicoes'],
+                relatar=self.stdout.write,
+            )
+        finally:
+            connection.creation.destroy_test_db(nome_original, verbosity=0, keepdb=options['manter_banco'])
+            teardown_test_environment()
+
+        if options['saida']:
+            benchmark.salvar(resultados, options['saida'])
+            self.stdout.write(self.style.SUCCESS(f"Resultados gravados em {options['saida']}."))
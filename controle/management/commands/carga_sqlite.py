@@ -0,0 +1,81 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from controle import carga
+
+
+class Command(BaseCommand):
+    help = (
+        'Teste de carga com leituras e escritas concorrentes em um banco de testes '
+        'descartável. Com --comparar-padrao, roda antes a mesma carga com a '
+        'configuração padrão do Django e mostra as duas.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--leitores', type=int, default=4)
+        parser.add_argument('--escritores', type=int, default=2)
+        parser.add_argument('--segundos', type=float, default=10.0)
+        parser.add_argument('--transacoes', type=int, default=20_000,
+                            help='Transações sintéticas no banco antes da carga.')
+        parser.add_argument('--comparar-padrao', action='store_true',
+                            help='Compara com journal DELETE, synchronous FULL e BEGIN DEFERRED.')
+        parser.add_argument('--json', action='store_true', help='Escreve só o resultado em JSON.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('O teste de carga é específico do SQLite.')
+
+        padrao = self.linha_de_base(options) if options['comparar_padrao'] else None
+
+        setup_test_environment()
+        nome_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            usuario = carga.preparar_dados(options['transacoes'])
+            resultado = carga.executar(
+                usuario,
+                leitores=options['leitores'],
+                escritores=options['escritores'],
+                segundos=options['segundos'],
+            )
+        finally:
+            connection.creation.destroy_test_db(nome_original, verbosity=0)
+            teardown_test_environment()
+
+        if options['json']:
+            self.stdout.write(json.dumps(resultado))
+            return
+
+        if padrao:
+            self.stdout.write(f"Padrão do Django:  {carga.resumo(padrao)}")
+        self.stdout.write(f"Configuração atual: {carga.resumo(resultado)}")
+        self.stdout.write(f"PRAGMAs: {resultado['configuracao']}")
+        if padrao and padrao['escritas_s']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Vazão: leituras x{resultado['leituras_s'] / max(padrao['leituras_s'], 0.1):.1f}, "
+                f"escritas x{resultado['escritas_s'] / padrao['escritas_s']:.1f}"
+            ))
+        for erro in resultado['outros_erros']:
+            self.stderr.write(erro)
+
+    def linha_de_base(self, options):
+        # Os settings são lidos na inicialização, então a linha de base roda em outro processo
+        comando = [
+            sys.executable, str(settings.BASE_DIR / 'manage.py'), 'carga_sqlite', '--json',
+            '--leitores', str(options['leitores']), '--escritores', str(options['escritores']),
+            '--segundos', str(options['segundos']), '--transacoes', str(options['transacoes']),
+        ]
+        processo = subprocess.run(
+            comando, capture_output=True, text=True,
+            env={**os.environ, **carga.CONFIGURACAO_PADRAO_DJANGO},
+        )
+        if processo.returncode != 0:
+            raise CommandError(f'A linha de base falhou:\n{processo.stderr}')
+        return json.loads(processo.stdout.strip().splitlines()[-1])
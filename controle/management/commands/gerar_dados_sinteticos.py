@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from controle import sinteticos
+
+
+class Command(BaseCommand):
+    help = 'Gera usuários, categorias, contas e transações sintéticas para testes de desempenho.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=1, help='Quantidade de usuários (padrão: 1).')
+        parser.add_argument('--prefixo', default='sintetico', help='Prefixo dos usernames: <prefixo>_<n>.')
+        parser.add_argument('--transacoes', type=int, default=100_000, help='Transações por usuário.')
+        parser.add_argument('--categorias', type=int, default=12, help='Categorias por usuário (1/4 de receitas).')
+        parser.add_argument('--contas', type=int, default=3, help='Contas por usuário.')
+        parser.add_argument('--dias', type=int, default=3 * 365, help='Janela de datas, em dias até hoje.')
+        parser.add_argument('--assimetria', type=float, default=1.0,
+                            help='0 para datas e categorias uniformes; maior concentra em datas recentes '
+                                 'e nas primeiras categorias.')
+        parser.add_argument('--semente', type=int, help='Semente do gerador, para dados reproduzíveis.')
+        parser.add_argument('--tamanho-lote', type=int, default=sinteticos.TAMANHO_LOTE)
+
+    def handle(self, *args, **options):
+        if options['usuarios'] < 1 or options['transacoes'] < 0 or options['dias'] < 1:
+            raise CommandError('Use --usuarios >= 1, --transacoes >= 0 e --dias >= 1.')
+
+        for indice in range(1, options['usuarios'] + 1):
+            inicio = time.monotonic()
+            usuario = sinteticos.preparar_usuario(
+                f"{options['prefixo']}_{indice}",
+                categorias=options['categorias'],
+                contas=options['contas'],
+            )
+            semente = None if options['semente'] is None else options['semente'] + indice
+            criadas = sinteticos.gerar_transacoes(
+                usuario, options['transacoes'],
+                dias=options['dias'],
+                assimetria=options['assimetria'],
+                semente=semente,
+                tamanho_lote=options['tamanho_lote'],
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f'{usuario.username}: {criadas} transações em {time.monotonic() - inicio:.1f}s.'
+            ))
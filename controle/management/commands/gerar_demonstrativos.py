@@ -0,0 +1,62 @@
+from datetime import date, datetime
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from controle import demonstrativos, relatorios
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera o demonstrativo mensal (HTML e PDF) de todos os usuários ativos ou dos escolhidos, '
+        'em MEDIA_ROOT/demonstrativos. Pode ser interrompido e executado de novo: só gera o que falta.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mes', help='Mês no formato AAAA-MM. Padrão: o mês anterior ao atual.')
+        parser.add_argument('--usuarios', help='Usernames separados por vírgula (padrão: todos os ativos).')
+        parser.add_argument('--formatos', default=','.join(demonstrativos.FORMATOS),
+                            help='Formatos separados por vírgula (padrão: html,pdf).')
+        parser.add_argument('--processos', type=int, default=demonstrativos.PROCESSOS)
+        parser.add_argument('--tamanho-lote', type=int, default=demonstrativos.TAMANHO_LOTE,
+                            help='Usuários por consulta ao banco.')
+        parser.add_argument('--refazer', action='store_true',
+                            help='Apaga e gera de novo os demonstrativos já existentes.')
+
+    def handle(self, *args, **options):
+        if options['mes']:
+            try:
+                referencia = datetime.strptime(options['mes'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError('Use --mes no formato AAAA-MM.')
+            ano, mes = referencia.year, referencia.month
+        else:
+            hoje = date.today()
+            ano, mes = relatorios.somar_meses(hoje.year, hoje.month, -1)
+
+        formatos = options['formatos'].split(',')
+        invalidos = set(formatos) - set(demonstrativos.FORMATOS)
+        if invalidos:
+            raise CommandError(f"Formatos inválidos: {', '.join(sorted(invalidos))}.")
+
+        usuarios = None
+        if options['usuarios']:
+            nomes = options['usuarios'].split(',')
+            usuarios = list(User.objects.filter(username__in=nomes))
+            faltando = set(nomes) - {u.username for u in usuarios}
+            if faltando:
+                raise CommandError(f"Usuários não encontrados: {', '.join(sorted(faltando))}.")
+
+        resultado = demonstrativos.gerar(
+            ano, mes,
+            usuarios=usuarios,
+            formatos=formatos,
+            processos=options['processos'],
+            tamanho_lote=options['tamanho_lote'],
+            refazer=options['refazer'],
+            relatar=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado['gerados']} demonstrativos de {mes:02d}/{ano} gerados em {resultado['segundos']:.1f}s "
+            f"em {demonstrativos.diretorio(ano, mes)}."
+        ))
@@ -0,0 +1,61 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from controle import importacao
+from controle.models import Categoria, Conta
+
+
+class Command(BaseCommand):
+    help = 'Importa um extrato CSV ou OFX para as transações de um usuário.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='Caminho do arquivo .csv ou .ofx.')
+        parser.add_argument('--usuario', required=True, help='Username dono das transações.')
+        parser.add_argument('--formato', choices=importacao.FORMATOS, help='Padrão: detectado pela extensão.')
+        parser.add_argument('--conta', help='Nome da conta usada quando a linha não informa uma.')
+        parser.add_argument('--categoria-receita', help='Nome da categoria padrão para receitas.')
+        parser.add_argument('--categoria-despesa', help='Nome da categoria padrão para despesas.')
+        parser.add_argument('--tamanho-lote', type=int, default=importacao.TAMANHO_LOTE)
+
+    def handle(self, *args, **options):
+        try:
+            usuario = User.objects.get(username=options['usuario'])
+        except User.DoesNotExist:
+            raise CommandError(f"Usuário '{options['usuario']}' não encontrado.")
+
+        formato = options['formato'] or importacao.detectar_formato(options['arquivo'])
+        if not formato:
+            raise CommandError('Não foi possível detectar o formato; use --formato.')
+
+        def buscar(modelo, nome, **filtros):
+            if not nome:
+                return None
+            try:
+                return modelo.objects.get(usuario=usuario, nome=nome, **filtros)
+            except modelo.DoesNotExist:
+                raise CommandError(f"{modelo._meta.verbose_name} '{nome}' não encontrada.")
+
+        inicio = time.monotonic()
+        try:
+            with open(options['arquivo'], 'rb') as arquivo:
+                resultado = importacao.importar_arquivo(
+                    usuario, arquivo, formato,
+                    conta=buscar(Conta, options['conta']),
+                    categoria_receita=buscar(Categoria, options['categoria_receita'], tipo='R'),
+                    categoria_despesa=buscar(Categoria, options['categoria_despesa'], tipo='D'),
+                    tamanho_lote=options['tamanho_lote'],
+                )
+        except (OSError, importacao.ErroLinha) as erro:
+            raise CommandError(str(erro))
+
+        for erro in resultado['erros']:
+            self.stderr.write(erro)
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado['lidas']} linhas lidas, {resultado['importadas']} importadas, "
+            f"{resultado['duplicadas']} duplicadas e {resultado['com_erro']} com erro "
+            f"em {time.monotonic() - inicio:.1f}s."
+        ))
+        if resultado['interrompida']:
+            raise CommandError(f"Importação interrompida: {resultado['interrompida']}")
@@ -0,0 +1,42 @@
+import time
+from datetime import datetime
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from controle import recorrencias
+
+
+class Command(BaseCommand):
+    help = (
+        'Lança as ocorrências vencidas das recorrências ativas. Pode ser executado '
+        'várias vezes (por exemplo, diariamente pelo cron) sem duplicar transações.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--data', help='Lança as ocorrências até esta data (AAAA-MM-DD). Padrão: hoje.')
+        parser.add_argument('--usuario', help='Processa apenas as recorrências deste username.')
+        parser.add_argument('--tamanho-lote', type=int, default=recorrencias.TAMANHO_LOTE,
+                            help='Recorrências por transação do banco.')
+
+    def handle(self, *args, **options):
+        ate = None
+        if options['data']:
+            try:
+                ate = datetime.strptime(options['data'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Use --data no formato AAAA-MM-DD.')
+
+        usuario = None
+        if options['usuario']:
+            try:
+                usuario = User.objects.get(username=options['usuario'])
+            except User.DoesNotExist:
+                raise CommandError(f"Usuário '{options['usuario']}' não encontrado.")
+
+        inicio = time.monotonic()
+        resultado = recorrencias.materializar(ate=ate, usuario=usuario, tamanho_lote=options['tamanho_lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado['transacoes']} transações lançadas de {resultado['recorrencias']} recorrências "
+            f"em {time.monotonic() - inicio:.1f}s."
+        ))
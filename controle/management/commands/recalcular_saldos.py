@@ -0,0 +1,23 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from controle import saldos
+from controle.models import Conta
+
+
+class Command(BaseCommand):
+    help = 'Recalcula o saldo e os saldos mensais das contas a partir do saldo inicial, das transações e dos totais arquivados.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', help='Recalcula apenas as contas deste username.')
+
+    def handle(self, *args, **options):
+        contas = Conta.objects.all()
+        if options['usuario']:
+            try:
+                contas = contas.filter(usuario=User.objects.get(username=options['usuario']))
+            except User.DoesNotExist:
+                raise CommandError(f"Usuário '{options['usuario']}' não encontrado.")
+
+        total = saldos.recalcular(contas)
+        self.stdout.write(self.style.SUCCESS(f'{total} saldos de conta recalculados.'))
@@ -0,0 +1,22 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from controle import resumos
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói do zero os resumos mensais por categoria a partir das transações e dos totais arquivados.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', help='Reconstrói apenas os resumos deste username.')
+
+    def handle(self, *args, **options):
+        usuario = None
+        if options['usuario']:
+            try:
+                usuario = User.objects.get(username=options['usuario'])
+            except User.DoesNotExist:
+                raise CommandError(f"Usuário '{options['usuario']}' não encontrado.")
+
+        total = resumos.reconstruir(usuario)
+        self.stdout.write(self.style.SUCCESS(f'{total} resumos mensais reconstruídos.'))
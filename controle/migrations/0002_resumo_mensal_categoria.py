@@ -0,0 +1,53 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+
+def popular_resumos(apps, schema_editor):
+    Transacao = apps.get_model('controle', 'Transacao')
+    ResumoMensalCategoria = apps.get_model('controle', 'ResumoMensalCategoria')
+    linhas = Transacao.objects.annotate(
+        ano=ExtractYear('data'),
+        mes=ExtractMonth('data'),
+    ).values('usuario_id', 'ano', 'mes', 'categoria_id').annotate(
+        total=Sum('valor'),
+        quantidade=Count('id'),
+    ).order_by()
+    ResumoMensalCategoria.objects.bulk_create(
+        [ResumoMensalCategoria(**linha) for linha in linhas],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controle', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoMensalCategoria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ano', models.PositiveSmallIntegerField()),
+                ('mes', models.PositiveSmallIntegerField()),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('quantidade', models.IntegerField(default=0)),
+                ('categoria', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumos', to='controle.categoria')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Resumo Mensal por Categoria',
+                'verbose_name_plural': 'Resumos Mensais por Categoria',
+                'ordering': ['-ano', '-mes'],
+                'constraints': [models.UniqueConstraint(fields=('usuario', 'ano', 'mes', 'categoria'), name='resumo_mensal_categoria_unico')],
+            },
+        ),
+        migrations.RunPython(popular_resumos, migrations.RunPython.noop),
+    ]
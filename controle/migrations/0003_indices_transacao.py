@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controle', '0002_resumo_mensal_categoria'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='transacao',
+            options={'ordering': ['-data', '-id'], 'verbose_name': 'Transação', 'verbose_name_plural': 'Transações'},
+        ),
+        migrations.AlterField(
+            model_name='transacao',
+            name='conta',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='controle.conta'),
+        ),
+        migrations.AlterField(
+            model_name='transacao',
+            name='usuario',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='transacao',
+            index=models.Index(fields=['usuario', 'data'], name='transacao_usuario_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transacao',
+            index=models.Index(fields=['usuario', 'categoria', 'data'], name='transacao_usr_cat_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transacao',
+            index=models.Index(fields=['conta', 'data'], name='transacao_conta_data_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:34
+
+from django.db import migrations, models
+from django.db.models import Case, DecimalField, F, Sum, When
+
+
+def preencher_saldo_inicial(apps, schema_editor):
+    # Mantém o saldo atual de cada conta: saldo_inicial = saldo - movimentos
+    Conta = apps.get_model('controle', 'Conta')
+    Transacao = apps.get_model('controle', 'Transacao')
+    movimentos = dict(
+        Transacao.objects.values('conta_id').annotate(
+            movimento=Sum(Case(
+                When(categoria__tipo='R', then=F('valor')),
+                default=-F('valor'),
+                output_field=DecimalField(max_digits=14, decimal_places=2),
+            ))
+        ).order_by().values_list('conta_id', 'movimento')
+    )
+    for conta in Conta.objects.all():
+        conta.saldo_inicial = conta.saldo - (movimentos.get(conta.pk) or 0)
+        conta.save(update_fields=['saldo_inicial'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controle', '0003_indices_transacao'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conta',
+            name='saldo_inicial',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(preencher_saldo_inicial, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:55
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controle', '0005_transacao_hash_importacao'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Recorrencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('descricao', models.CharField(max_length=200)),
+                ('valor', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('frequencia', models.CharField(choices=[('D', 'Diária'), ('S', 'Semanal'), ('M', 'Mensal'), ('A', 'Anual')], default='M', max_length=1)),
+                ('intervalo', models.PositiveSmallIntegerField(default=1, help_text='A cada quantos períodos a transação se repete.')),
+                ('data_inicio', models.DateField(default=django.utils.timezone.now)),
+                ('data_fim', models.DateField(blank=True, null=True)),
+                ('proxima_data', models.DateField(editable=False)),
+                ('ativa', models.BooleanField(default=True)),
+                ('observacao', models.TextField(blank=True, null=True)),
+                ('categoria', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='controle.categoria')),
+                ('conta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='controle.conta')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Recorrência',
+                'verbose_name_plural': 'Recorrências',
+                'ordering': ['proxima_data', 'descricao'],
+                'indexes': [models.Index(fields=['ativa', 'proxima_data'], name='recorrencia_pendentes_idx')],
+            },
+        ),
+    ]
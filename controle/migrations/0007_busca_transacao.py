@@ -0,0 +1,75 @@
+from django.db import migrations
+
+# Tabela FTS5 de conteúdo externo: guarda só o índice e lê os textos de
+# controle_transacao. Os triggers mantêm o índice em dia com qualquer
+# escrita, inclusive bulk_create e updates em lote, que não disparam sinais.
+SQLITE_CRIAR = [
+    """
+    CREATE VIRTUAL TABLE controle_transacao_fts USING fts5(
+        descricao, observacao,
+        content='controle_transacao', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER controle_transacao_fts_insert AFTER INSERT ON controle_transacao BEGIN
+        INSERT INTO controle_transacao_fts(rowid, descricao, observacao)
+        VALUES (new.id, new.descricao, new.observacao);
+    END
+    """,
+    """
+    CREATE TRIGGER controle_transacao_fts_delete AFTER DELETE ON controle_transacao BEGIN
+        INSERT INTO controle_transacao_fts(controle_transacao_fts, rowid, descricao, observacao)
+        VALUES ('delete', old.id, old.descricao, old.observacao);
+    END
+    """,
+    """
+    CREATE TRIGGER controle_transacao_fts_update AFTER UPDATE OF descricao, observacao ON controle_transacao BEGIN
+        INSERT INTO controle_transacao_fts(controle_transacao_fts, rowid, descricao, observacao)
+        VALUES ('delete', old.id, old.descricao, old.observacao);
+        INSERT INTO controle_transacao_fts(rowid, descricao, observacao)
+        VALUES (new.id, new.descricao, new.observacao);
+    END
+    """,
+    # Indexa as transações já existentes
+    "INSERT INTO controle_transacao_fts(controle_transacao_fts) VALUES ('rebuild')",
+]
+SQLITE_REMOVER = [
+    'DROP TRIGGER IF EXISTS controle_transacao_fts_update',
+    'DROP TRIGGER IF EXISTS controle_transacao_fts_delete',
+    'DROP TRIGGER IF EXISTS controle_transacao_fts_insert',
+    'DROP TABLE IF EXISTS controle_transacao_fts',
+]
+
+# Mesma expressão usada por controle.busca, para que o índice seja usado
+POSTGRES_CRIAR = [
+    """
+    CREATE INDEX transacao_busca_idx ON controle_transacao USING gin ((
+        setweight(to_tsvector('portuguese', coalesce(controle_transacao.descricao, '')), 'A') ||
+        setweight(to_tsvector('portuguese', coalesce(controle_transacao.observacao, '')), 'B')
+    ))
+    """,
+]
+POSTGRES_REMOVER = ['DROP INDEX IF EXISTS transacao_busca_idx']
+
+
+def _executar(comandos):
+    def executar(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for sql in comandos.get(vendor, ()):
+            schema_editor.execute(sql)
+    return executar
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controle', '0006_recorrencia'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _executar({'sqlite': SQLITE_CRIAR, 'postgresql': POSTGRES_CRIAR}),
+            _executar({'sqlite': SQLITE_REMOVER, 'postgresql': POSTGRES_REMOVER}),
+        ),
+    ]
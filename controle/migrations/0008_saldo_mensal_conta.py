@@ -0,0 +1,58 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Case, DecimalField, F, Sum, When
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+
+def popular_saldos(apps, schema_editor):
+    Transacao = apps.get_model('controle', 'Transacao')
+    SaldoMensalConta = apps.get_model('controle', 'SaldoMensalConta')
+    linhas = Transacao.objects.annotate(
+        ano=ExtractYear('data'),
+        mes=ExtractMonth('data'),
+    ).values('conta_id', 'ano', 'mes').annotate(
+        movimento=Sum(Case(
+            When(categoria__tipo='R', then=F('valor')),
+            default=-F('valor'),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        )),
+    ).order_by('conta_id', 'ano', 'mes')
+
+    novos = []
+    conta_id, acumulado = None, 0
+    for linha in linhas:
+        if linha['conta_id'] != conta_id:
+            conta_id, acumulado = linha['conta_id'], 0
+        acumulado += linha['movimento']
+        novos.append(SaldoMensalConta(acumulado=acumulado, **linha))
+    SaldoMensalConta.objects.bulk_create(novos, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controle', '0007_busca_transacao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaldoMensalConta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ano', models.PositiveSmallIntegerField()),
+                ('mes', models.PositiveSmallIntegerField()),
+                ('movimento', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('acumulado', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('conta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos_mensais', to='controle.conta')),
+            ],
+            options={
+                'verbose_name': 'Saldo Mensal da Conta',
+                'verbose_name_plural': 'Saldos Mensais das Contas',
+                'ordering': ['-ano', '-mes'],
+                'constraints': [models.UniqueConstraint(fields=('conta', 'ano', 'mes'), name='saldo_mensal_conta_unico')],
+            },
+        ),
+        migrations.RunPython(popular_saldos, migrations.RunPython.noop),
+    ]
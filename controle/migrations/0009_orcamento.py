@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controle', '0008_saldo_mensal_conta'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Orcamento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('limite', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('alerta', models.PositiveSmallIntegerField(default=80, help_text='Percentual do limite que dispara o alerta.')),
+                ('categoria', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='orcamento', to='controle.categoria')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Orçamento',
+                'verbose_name_plural': 'Orçamentos',
+                'ordering': ['categoria__nome'],
+            },
+        ),
+    ]
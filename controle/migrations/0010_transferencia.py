@@ -0,0 +1,51 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:33
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controle', '0009_orcamento'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='categoria',
+            name='transferencia',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddConstraint(
+            model_name='categoria',
+            constraint=models.UniqueConstraint(condition=models.Q(('transferencia', True)), fields=('usuario', 'tipo'), name='categoria_transferencia_unica'),
+        ),
+        migrations.CreateModel(
+            name='Transferencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('descricao', models.CharField(max_length=200)),
+                ('valor', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('data', models.DateField(default=django.utils.timezone.now)),
+                ('destino', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transferencias_recebidas', to='controle.conta')),
+                ('origem', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transferencias_enviadas', to='controle.conta')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Transferência',
+                'verbose_name_plural': 'Transferências',
+                'ordering': ['-data', '-id'],
+                'indexes': [models.Index(fields=['usuario', 'data'], name='transferencia_usr_data_idx')],
+            },
+        ),
+        # Coluna nula: no SQLite vira um ALTER TABLE ADD COLUMN, sem recriar
+        # controle_transacao (o que apagaria os triggers da busca FTS5)
+        migrations.AddField(
+            model_name='transacao',
+            name='transferencia',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='pernas', to='controle.transferencia'),
+        ),
+    ]
@@ -1,7 +1,16 @@
-from django.db import models
+from collections import defaultdict
+
+from django.db import models, transaction
+from django.db.models import F, Sum
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+
+def sinal_do_tipo(tipo):
+    # Receitas somam no saldo da conta e despesas subtraem
+    return 1 if tipo == 'R' else -1
+
+
 class Categoria(models.Model):
     TIPO_CHOICES = (
         ('R', 'Receita'),
@@ -10,6 +19,9 @@ class Categoria(models.Model):
     nome = models.CharField(max_length=100)
     tipo = models.CharField(max_length=1, choices=TIPO_CHOICES)
     usuario = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Categorias internas das pernas de transferências (ver
+    # controle/transferencias.py); não aparecem nas listas do usuário
+    transferencia = models.BooleanField(default=False, editable=False)
     
     def __str__(self):
         return f'{self.nome} ({self.get_tipo_display()})'
@@ -18,10 +30,43 @@ class Categoria(models.Model):
         verbose_name = 'Categoria'
         verbose_name_plural = 'Categorias'
         ordering = ['nome']
+        constraints = [
+            # Uma categoria de transferência de cada tipo por usuário
+            models.UniqueConstraint(
+                fields=['usuario', 'tipo'],
+                condition=models.Q(transferencia=True),
+                name='categoria_transferencia_unica',
+            ),
+        ]
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._tipo_original = instancia.__dict__.get('tipo')
+        return instancia
+    
+    def save(self, *args, **kwargs):
+        tipo_original = getattr(self, '_tipo_original', None)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if tipo_original and tipo_original != self.tipo:
+                # Trocar o tipo inverte o efeito de todas as transações da
+                # categoria, inclusive as que estão no arquivo
+                movimentos = defaultdict(int)
+                for consulta in (
+                    Transacao.objects.filter(categoria=self).values('conta_id').annotate(total=Sum('valor')),
+                    ResumoArquivado.objects.filter(categoria=self).values('conta_id').annotate(total=Sum('total')),
+                ):
+                    for linha in consulta.order_by():
+                        movimentos[linha['conta_id']] += 2 * sinal_do_tipo(self.tipo) * linha['total']
+                Conta.aplicar_movimentos(movimentos)
+        self._tipo_original = self.tipo
 
 class Conta(models.Model):
     nome = models.CharField(max_length=100)
     saldo = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # Saldo antes de qualquer transação; saldo = saldo_inicial + movimentos
+    saldo_inicial = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     usuario = models.ForeignKey(User, on_delete=models.CASCADE)
     
     def __str__(self):
@@ -31,15 +76,35 @@ class Conta(models.Model):
         verbose_name = 'Conta'
         verbose_name_plural = 'Contas'
         ordering = ['nome']
+    
+    @staticmethod
+    def aplicar_movimentos(movimentos):
+        """
+        Soma no banco, com F(), o valor de cada conta em {conta_id: valor}.
+
+        Não lê o saldo atual, então escritas concorrentes não se perdem.
+        """
+        for conta_id, valor in movimentos.items():
+            if valor:
+                Conta.objects.filter(pk=conta_id).update(saldo=F('saldo') + valor)
 
 class Transacao(models.Model):
     descricao = models.CharField(max_length=200)
     valor = models.DecimalField(max_digits=10, decimal_places=2)
     data = models.DateField(default=timezone.now)
     categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE)
-    conta = models.ForeignKey(Conta, on_delete=models.CASCADE)
+    # conta e usuario são cobertos pelos índices compostos abaixo
+    conta = models.ForeignKey(Conta, on_delete=models.CASCADE, db_index=False)
     observacao = models.TextField(blank=True, null=True)
-    usuario = models.ForeignKey(User, on_delete=models.CASCADE)
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    # Identifica linhas vindas de importação de extratos, para evitar duplicatas
+    hash_importacao = models.CharField(max_length=64, blank=True, null=True, editable=False)
+    # Pernas de uma transferência entre contas: movem saldo, mas ficam
+    # fora dos resumos mensais e, portanto, dos relatórios
+    transferencia = models.ForeignKey(
+        'Transferencia', on_delete=models.CASCADE, blank=True, null=True,
+        editable=False, related_name='pernas',
+    )
     
     def __str__(self):
         return f'{self.descricao} - R$ {self.valor} ({self.data})'
@@ -47,13 +112,228 @@ class Transacao(models.Model):
     class Meta:
         verbose_name = 'Transação'
         verbose_name_plural = 'Transações'
-        ordering = ['-data']
+        ordering = ['-data', '-id']
+        indexes = [
+            # Filtros por período do dashboard, relatórios e listagem
+            models.Index(fields=['usuario', 'data'], name='transacao_usuario_data_idx'),
+            # Filtros por categoria dentro do período
+            models.Index(fields=['usuario', 'categoria', 'data'], name='transacao_usr_cat_data_idx'),
+            # Extrato por conta
+            models.Index(fields=['conta', 'data'], name='transacao_conta_data_idx'),
+        ]
+        constraints = [
+            # hash_importacao na frente para as buscas por lote de hashes
+            models.UniqueConstraint(
+                fields=['hash_importacao', 'usuario'],
+                name='transacao_hash_importacao_unico',
+            ),
+        ]
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia.guardar_estado_original()
+        return instancia
+    
+    def guardar_estado_original(self):
+        # Guarda os valores persistidos para calcular diferenças em edições
+        self._original = {
+            campo: self.__dict__.get(campo)
+            for campo in ('valor', 'data', 'categoria_id', 'conta_id', 'usuario_id')
+        }
         
     def save(self, *args, **kwargs):
-        # Atualiza o saldo da conta ao salvar uma transação
-        if self.categoria.tipo == 'R':
-            self.conta.saldo += self.valor
-        else:
-            self.conta.saldo -= self.valor
-        self.conta.save()
+        # Atualiza o saldo da conta ao salvar uma transação. As leituras
+        # (tipo das categorias) vêm antes da transação do banco, que começa
+        # direto pelas escritas.
+        movimentos = defaultdict(int)
+        original = None if self._state.adding else getattr(self, '_original', None)
+        if original:
+            if original['categoria_id'] == self.categoria_id:
+                tipo_original = self.categoria.tipo
+            else:
+                tipo_original = Categoria.objects.values_list('tipo', flat=True).get(pk=original['categoria_id'])
+            movimentos[original['conta_id']] -= sinal_do_tipo(tipo_original) * original['valor']
+        movimentos[self.conta_id] += sinal_do_tipo(self.categoria.tipo) * self.valor
+        
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            Conta.aplicar_movimentos(movimentos)
+        # Só depois dos receptores de post_save, que ainda usam os valores antigos
+        self.guardar_estado_original()
+    
+    def reverter_saldo(self):
+        # Desfaz o efeito desta transação no saldo (usado ao excluir) e
+        # retorna o valor aplicado
+        original = getattr(self, '_original', None) or self.__dict__
+        tipo = Categoria.objects.values_list('tipo', flat=True).get(pk=original['categoria_id'])
+        movimento = -sinal_do_tipo(tipo) * original['valor']
+        Conta.aplicar_movimentos({original['conta_id']: movimento})
+        return movimento
+
+class Transferencia(models.Model):
+    # Movimento entre duas contas do usuário, gravado como duas transações
+    # (despesa na origem e receita no destino) na mesma transação do banco
+    descricao = models.CharField(max_length=200)
+    valor = models.DecimalField(max_digits=10, decimal_places=2)
+    data = models.DateField(default=timezone.now)
+    origem = models.ForeignKey(Conta, on_delete=models.CASCADE, related_name='transferencias_enviadas')
+    destino = models.ForeignKey(Conta, on_delete=models.CASCADE, related_name='transferencias_recebidas')
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE)
+    
+    def __str__(self):
+        return f'{self.descricao} - R$ {self.valor} ({self.data})'
+    
+    class Meta:
+        verbose_name = 'Transferência'
+        verbose_name_plural = 'Transferências'
+        ordering = ['-data', '-id']
+        indexes = [
+            models.Index(fields=['usuario', 'data'], name='transferencia_usr_data_idx'),
+        ]
+
+class ResumoMensalCategoria(models.Model):
+    # Totais materializados por (usuário, ano, mês, categoria), mantidos
+    # incrementalmente pelos sinais de Transacao (ver controle/resumos.py)
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE)
+    ano = models.PositiveSmallIntegerField()
+    mes = models.PositiveSmallIntegerField()
+    categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE, related_name='resumos')
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    quantidade = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f'{self.categoria.nome} {self.mes:02d}/{self.ano} - R$ {self.total}'
+    
+    class Meta:
+        verbose_name = 'Resumo Mensal por Categoria'
+        verbose_name_plural = 'Resumos Mensais por Categoria'
+        ordering = ['-ano', '-mes']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['usuario', 'ano', 'mes', 'categoria'],
+                name='resumo_mensal_categoria_unico',
+            ),
+        ]
+
+class SaldoMensalConta(models.Model):
+    # Movimento de cada conta por mês e o acumulado até o fim do mês,
+    # mantidos pelos sinais de Transacao (ver controle/saldos.py). O saldo
+    # no início de qualquer mês é saldo_inicial + o acumulado da última
+    # linha anterior a ele, sem somar o histórico.
+    conta = models.ForeignKey(Conta, on_delete=models.CASCADE, related_name='saldos_mensais')
+    ano = models.PositiveSmallIntegerField()
+    mes = models.PositiveSmallIntegerField()
+    movimento = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    acumulado = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f'{self.conta.nome} {self.mes:02d}/{self.ano} - R$ {self.acumulado}'
+
+    class Meta:
+        verbose_name = 'Saldo Mensal da Conta'
+        verbose_name_plural = 'Saldos Mensais das Contas'
+        ordering = ['-ano', '-mes']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['conta', 'ano', 'mes'],
+                name='saldo_mensal_conta_unico',
+            ),
+        ]
+
+class ResumoArquivado(models.Model):
+    # Totais das transações movidas para o arquivo (ver
+    # controle/arquivamento.py), por conta, categoria e mês do ano
+    # arquivado. Substituem as transações nos recálculos de saldos e
+    # resumos; conta e categoria não podem ser excluídas enquanto houver
+    # anos arquivados com elas.
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    conta = models.ForeignKey(Conta, on_delete=models.RESTRICT, related_name='resumos_arquivados')
+    categoria = models.ForeignKey(Categoria, on_delete=models.RESTRICT, related_name='resumos_arquivados')
+    ano = models.PositiveSmallIntegerField()
+    mes = models.PositiveSmallIntegerField()
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    quantidade = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.categoria.nome} / {self.conta.nome} {self.mes:02d}/{self.ano} - R$ {self.total}'
+
+    class Meta:
+        verbose_name = 'Resumo Arquivado'
+        verbose_name_plural = 'Resumos Arquivados'
+        ordering = ['-ano', '-mes']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['usuario', 'ano', 'mes', 'conta', 'categoria'],
+                name='resumo_arquivado_unico',
+            ),
+        ]
+
+class Recorrencia(models.Model):
+    # Lançamento que se repete (aluguel, salário, assinaturas). As
+    # ocorrências vencidas viram transações pelo comando
+    # materializar_recorrencias (ver controle/recorrencias.py)
+    FREQUENCIA_CHOICES = (
+        ('D', 'Diária'),
+        ('S', 'Semanal'),
+        ('M', 'Mensal'),
+        ('A', 'Anual'),
+    )
+    descricao = models.CharField(max_length=200)
+    valor = models.DecimalField(max_digits=10, decimal_places=2)
+    categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE)
+    conta = models.ForeignKey(Conta, on_delete=models.CASCADE)
+    frequencia = models.CharField(max_length=1, choices=FREQUENCIA_CHOICES, default='M')
+    intervalo = models.PositiveSmallIntegerField(default=1, help_text='A cada quantos períodos a transação se repete.')
+    data_inicio = models.DateField(default=timezone.now)
+    data_fim = models.DateField(blank=True, null=True)
+    # Data da próxima ocorrência ainda não lançada
+    proxima_data = models.DateField(editable=False)
+    ativa = models.BooleanField(default=True)
+    observacao = models.TextField(blank=True, null=True)
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE)
+    
+    def __str__(self):
+        return f'{self.descricao} - R$ {self.valor} ({self.get_frequencia_display()})'
+    
+    class Meta:
+        verbose_name = 'Recorrência'
+        verbose_name_plural = 'Recorrências'
+        ordering = ['proxima_data', 'descricao']
+        indexes = [
+            # Busca das ocorrências vencidas pelo comando agendado
+            models.Index(fields=['ativa', 'proxima_data'], name='recorrencia_pendentes_idx'),
+        ]
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._data_inicio_original = instancia.__dict__.get('data_inicio')
+        return instancia
+    
+    def save(self, *args, **kwargs):
+        data_inicio_original = getattr(self, '_data_inicio_original', None)
+        if self.proxima_data is None or self.proxima_data == data_inicio_original:
+            # Nada lançado ainda: a primeira ocorrência acompanha data_inicio
+            self.proxima_data = self.data_inicio
+        elif self.proxima_data < self.data_inicio:
+            self.proxima_data = self.data_inicio
         super().save(*args, **kwargs)
+        self._data_inicio_original = self.data_inicio
+
+class Orcamento(models.Model):
+    # Limite mensal de gastos de uma categoria de despesa. O consumo vem
+    # dos resumos mensais (ver controle/orcamentos.py)
+    categoria = models.OneToOneField(Categoria, on_delete=models.CASCADE, related_name='orcamento')
+    limite = models.DecimalField(max_digits=10, decimal_places=2)
+    # Percentual do limite a partir do qual o dashboard mostra um alerta
+    alerta = models.PositiveSmallIntegerField(default=80, help_text='Percentual do limite que dispara o alerta.')
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE)
+    
+    def __str__(self):
+        return f'{self.categoria.nome} - R$ {self.limite}'
+    
+    class Meta:
+        verbose_name = 'Orçamento'
+        verbose_name_plural = 'Orçamentos'
+        ordering = ['categoria__nome']
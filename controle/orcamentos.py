@@ -0,0 +1,68 @@
+"""
+Orçamentos mensais por categoria e o consumo de cada um no mês.
+
+O gasto de cada categoria vem de ResumoMensalCategoria, que os sinais de
+Transacao já mantêm com F(): o consumo de todos os orçamentos do usuário
+é uma única consulta (os orçamentos com uma subconsulta indexada no
+resumo do mês), qualquer que seja o número de categorias. O resultado
+fica no cache do dashboard como a parte "orcamentos" (ver cache.py).
+"""
+from django.db.models import DecimalField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Orcamento, ResumoMensalCategoria
+
+SITUACOES = ('ok', 'alerta', 'excedido')
+
+
+def _orcamentos_com_gasto(usuario, ano, mes):
+    gasto = ResumoMensalCategoria.objects.filter(
+        usuario=OuterRef('usuario'), ano=ano, mes=mes, categoria=OuterRef('categoria'),
+    ).values('total')[:1]
+    return Orcamento.objects.filter(usuario=usuario, categoria__tipo='D').select_related('categoria').annotate(
+        gasto=Coalesce(Subquery(gasto), Value(0), output_field=DecimalField(max_digits=14, decimal_places=2)),
+    )
+
+
+def situacao(gasto, limite, alerta):
+    """'excedido' acima do limite, 'alerta' a partir de `alerta`% dele e 'ok' abaixo."""
+    if gasto > limite:
+        return 'excedido'
+    if limite and gasto * 100 >= limite * alerta:
+        return 'alerta'
+    return 'ok'
+
+
+def _montar(orcamentos):
+    itens = [
+        {
+            'orcamento_id': orcamento.pk,
+            'categoria_id': orcamento.categoria_id,
+            'categoria': orcamento.categoria.nome,
+            'limite': orcamento.limite,
+            'gasto': orcamento.gasto,
+            'restante': orcamento.limite - orcamento.gasto,
+            'percentual': float(orcamento.gasto / orcamento.limite * 100) if orcamento.limite else None,
+            'situacao': situacao(orcamento.gasto, orcamento.limite, orcamento.alerta),
+        }
+        for orcamento in orcamentos
+    ]
+    return {
+        'orcamentos': itens,
+        # Os mais consumidos primeiro
+        'alertas_orcamento': sorted(
+            (item for item in itens if item['situacao'] != 'ok'),
+            key=lambda item: item['percentual'] or 0,
+            reverse=True,
+        ),
+    }
+
+
+def consumo(usuario, ano, mes):
+    """Orçamentos do usuário com o gasto do mês e os que pedem alerta."""
+    return _montar(_orcamentos_com_gasto(usuario, ano, mes))
+
+
+async def aconsumo(usuario, ano, mes):
+    """Versão assíncrona de consumo."""
+    return _montar([orcamento async for orcamento in _orcamentos_com_gasto(usuario, ano, mes)])
@@ -0,0 +1,64 @@
+"""
+Paginação por cursor (keyset) sobre (data, id).
+
+Em vez de OFFSET, cada página começa logo após a última linha da página
+anterior, então o custo de uma página não cresce com a profundidade.
+"""
+import base64
+from datetime import date
+
+from django.db.models import Q
+
+TAMANHO_PAGINA = 50
+
+
+def codificar_cursor(transacao):
+    bruto = f'{transacao.data.isoformat()}|{transacao.pk}'
+    return base64.urlsafe_b64encode(bruto.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """Retorna (data, id) do cursor ou None se ele for inválido."""
+    try:
+        preenchimento = '=' * (-len(cursor) % 4)
+        bruto = base64.urlsafe_b64decode(cursor + preenchimento).decode()
+        data, pk = bruto.split('|')
+        return date.fromisoformat(data), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def paginar(queryset, depois=None, antes=None, tamanho=TAMANHO_PAGINA):
+    """
+    Retorna uma página de `queryset` em ordem (-data, -id).
+
+    `depois` avança a partir do cursor informado e `antes` volta para a
+    página anterior a ele. O resultado traz os itens e os cursores para as
+    páginas vizinhas (None quando não houver).
+    """
+    posicao_depois = decodificar_cursor(depois) if depois else None
+    posicao_antes = decodificar_cursor(antes) if antes else None
+
+    if posicao_antes:
+        data, pk = posicao_antes
+        itens = list(
+            queryset.filter(Q(data__gt=data) | Q(data=data, pk__gt=pk))
+            .order_by('data', 'id')[:tamanho + 1]
+        )
+        tem_mais = len(itens) > tamanho
+        itens = itens[:tamanho][::-1]
+        tem_anterior, tem_proxima = tem_mais, True
+    else:
+        if posicao_depois:
+            data, pk = posicao_depois
+            queryset = queryset.filter(Q(data__lt=data) | Q(data=data, pk__lt=pk))
+        itens = list(queryset.order_by('-data', '-id')[:tamanho + 1])
+        tem_proxima = len(itens) > tamanho
+        itens = itens[:tamanho]
+        tem_anterior = posicao_depois is not None
+
+    return {
+        'itens': itens,
+        'cursor_proximo': codificar_cursor(itens[-1]) if itens and tem_proxima else None,
+        'cursor_anterior': codificar_cursor(itens[0]) if itens and tem_anterior else None,
+    }
@@ -0,0 +1,141 @@
+"""
+Materialização e projeção de transações recorrentes.
+
+materializar() transforma as ocorrências vencidas de todas as
+recorrências ativas em transações, em lotes: cada lote de recorrências
+grava suas transações com lancamentos.inserir_em_lote (um UPDATE de
+saldo por conta) e avança proxima_data na mesma transação do banco.
+Cada transação gerada leva um hash de (recorrência, data) em
+hash_importacao, de modo que rodar o comando de novo, mesmo depois de
+uma falha no meio, não duplica lançamentos.
+
+totais_diarios_projetados() calcula as ocorrências futuras sem gravar
+nada, para as projeções de saldo dos relatórios.
+"""
+import calendar
+import hashlib
+from datetime import date, timedelta
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from .lancamentos import inserir_em_lote
+from .models import Recorrencia, Transacao
+
+TAMANHO_LOTE = 500
+# Limite de ocorrências lançadas por recorrência em uma execução
+MAXIMO_OCORRENCIAS = 1000
+
+
+def _somar_meses(data, meses, dia):
+    indice = data.year * 12 + (data.month - 1) + meses
+    ano, mes = indice // 12, indice % 12 + 1
+    return date(ano, mes, min(dia, calendar.monthrange(ano, mes)[1]))
+
+
+def proxima_ocorrencia(recorrencia, data):
+    """
+    Data da ocorrência seguinte a `data`. Ocorrências mensais e anuais
+    mantêm o dia de data_inicio (31 vira 30 ou 28 só nos meses curtos).
+    """
+    if recorrencia.frequencia == 'D':
+        return data + timedelta(days=recorrencia.intervalo)
+    if recorrencia.frequencia == 'S':
+        return data + timedelta(weeks=recorrencia.intervalo)
+    meses = recorrencia.intervalo * (12 if recorrencia.frequencia == 'A' else 1)
+    return _somar_meses(data, meses, recorrencia.data_inicio.day)
+
+
+def ocorrencias(recorrencia, ate, limite=MAXIMO_OCORRENCIAS):
+    """Datas das ocorrências pendentes, de proxima_data até `ate` (inclusive)."""
+    data = recorrencia.proxima_data
+    fim = min(ate, recorrencia.data_fim) if recorrencia.data_fim else ate
+    while data <= fim and limite > 0:
+        yield data
+        data = proxima_ocorrencia(recorrencia, data)
+        limite -= 1
+
+
+def hash_ocorrencia(recorrencia_id, data):
+    return hashlib.sha256(f'recorrencia|{recorrencia_id}|{data.isoformat()}'.encode()).hexdigest()
+
+
+def _materializar_lote(recorrencias, ate):
+    transacoes = []
+    for recorrencia in recorrencias:
+        data = None
+        for data in ocorrencias(recorrencia, ate):
+            transacoes.append(Transacao(
+                descricao=recorrencia.descricao,
+                valor=recorrencia.valor,
+                data=data,
+                categoria=recorrencia.categoria,
+                conta_id=recorrencia.conta_id,
+                observacao=recorrencia.observacao,
+                usuario_id=recorrencia.usuario_id,
+                hash_importacao=hash_ocorrencia(recorrencia.pk, data),
+            ))
+        if data is not None:
+            recorrencia.proxima_data = proxima_ocorrencia(recorrencia, data)
+        if recorrencia.data_fim and recorrencia.proxima_data > recorrencia.data_fim:
+            recorrencia.ativa = False
+
+    # Ocorrências já lançadas por uma execução anterior são ignoradas
+    existentes = set(Transacao.objects.filter(
+        hash_importacao__in=[t.hash_importacao for t in transacoes],
+    ).values_list('hash_importacao', flat=True))
+    criadas = inserir_em_lote(t for t in transacoes if t.hash_importacao not in existentes)
+    Recorrencia.objects.bulk_update(recorrencias, ['proxima_data', 'ativa'])
+    return len(criadas)
+
+
+def materializar(ate=None, usuario=None, tamanho_lote=TAMANHO_LOTE):
+    """
+    Lança as ocorrências vencidas até `ate` (padrão: hoje) de todas as
+    recorrências ativas, ou só das do `usuario`. Hoje é a data local
+    (TIME_ZONE), não a do relógio do servidor. Retorna um dicionário
+    com o número de recorrências processadas e de transações criadas.
+    """
+    ate = ate or timezone.localdate()
+    pendentes = Recorrencia.objects.filter(ativa=True, proxima_data__lte=ate).select_related('categoria')
+    if usuario is not None:
+        pendentes = pendentes.filter(usuario=usuario)
+
+    resultado = {'recorrencias': 0, 'transacoes': 0}
+    ultimo = 0
+    while True:
+        with transaction.atomic():
+            lote = list(
+                pendentes.filter(pk__gt=ultimo).order_by('pk').select_for_update(of=('self',))[:tamanho_lote]
+            )
+            if not lote:
+                break
+            resultado['transacoes'] += _materializar_lote(lote, ate)
+        resultado['recorrencias'] += len(lote)
+        ultimo = lote[-1].pk
+    return resultado
+
+
+def totais_diarios_projetados(usuario, inicio, fim):
+    """
+    Receitas e despesas (arrays int64 em centavos, um item por dia de
+    `inicio` a `fim`) das ocorrências ainda não lançadas das recorrências
+    ativas do usuário, no mesmo formato de relatorios.totais_diarios.
+    """
+    dias = (fim - inicio).days + 1
+    receitas = np.zeros(dias, dtype=np.int64)
+    despesas = np.zeros(dias, dtype=np.int64)
+
+    recorrencias = Recorrencia.objects.filter(
+        usuario=usuario, ativa=True, proxima_data__lte=fim,
+    ).select_related('categoria')
+    for recorrencia in recorrencias:
+        centavos = int(recorrencia.valor * 100)
+        destino = receitas if recorrencia.categoria.tipo == 'R' else despesas
+        # No máximo uma ocorrência por dia entre proxima_data e fim
+        limite = (fim - recorrencia.proxima_data).days + 1
+        for data in ocorrencias(recorrencia, fim, limite=limite):
+            if data >= inicio:
+                destino[(data - inicio).days] += centavos
+    return receitas, despesas
@@ -0,0 +1,323 @@
+"""
+Motores de cálculo usados pelos relatórios.
+
+As funções daqui recebem o usuário e o intervalo de datas e devolvem
+estruturas prontas para as views (HTML ou JSON), sempre com um número
+constante de consultas, independente do tamanho do período.
+"""
+from datetime import date, timedelta
+
+import numpy as np
+from django.db.models import Q, Sum
+
+from . import arquivamento, recorrencias, saldos
+from .models import ResumoMensalCategoria, Transacao
+
+PERIODOS = ('semana', 'mes', 'trimestre', 'ano')
+MAXIMO_MESES = 120
+NOMES_MESES = (
+    'Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
+    'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro',
+)
+
+
+def intervalo_periodo(periodo, referencia):
+    """Retorna (inicio, fim) da janela `periodo` que contém a data `referencia`."""
+    if periodo == 'semana':
+        inicio = referencia - timedelta(days=referencia.weekday())
+        return inicio, inicio + timedelta(days=6)
+    if periodo == 'mes':
+        inicio = referencia.replace(day=1)
+        fim = (inicio + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        return inicio, fim
+    if periodo == 'trimestre':
+        mes_inicio = 3 * ((referencia.month - 1) // 3) + 1
+        inicio = date(referencia.year, mes_inicio, 1)
+        if mes_inicio == 10:
+            fim = date(referencia.year, 12, 31)
+        else:
+            fim = date(referencia.year, mes_inicio + 3, 1) - timedelta(days=1)
+        return inicio, fim
+    if periodo == 'ano':
+        return date(referencia.year, 1, 1), date(referencia.year, 12, 31)
+    raise ValueError(f'Período inválido: {periodo}')
+
+
+def saldo_anterior(usuario, data):
+    """
+    Saldo acumulado (receitas - despesas) de todas as transações antes de
+    `data`, lido dos saldos mensais das contas (saldos.movimento_antes):
+    o custo não cresce com o histórico e as transações arquivadas de
+    meses anteriores continuam contando.
+    """
+    return saldos.movimento_antes(usuario, data)
+
+
+def totais_diarios(usuario, inicio, fim):
+    """
+    Receitas e despesas por dia no intervalo, em uma única consulta agrupada.
+
+    Retorna dois vetores NumPy (em centavos) com um elemento por dia entre
+    `inicio` e `fim`; os dias sem movimentação ficam zerados. Nos anos
+    arquivados, as transações do arquivo entram nos dias delas.
+    """
+    dias = (fim - inicio).days + 1
+    receitas = np.zeros(dias, dtype=np.int64)
+    despesas = np.zeros(dias, dtype=np.int64)
+
+    linhas = Transacao.objects.filter(
+        usuario=usuario,
+        data__range=[inicio, fim],
+    ).values('data').annotate(
+        # As pernas das transferências se anulam no saldo e não são
+        # receita nem despesa (como em resumos.deltas_de_transacoes)
+        receitas=Sum('valor', filter=Q(categoria__tipo='R', transferencia__isnull=True)),
+        despesas=Sum('valor', filter=Q(categoria__tipo='D', transferencia__isnull=True)),
+    ).order_by('data')
+
+    for linha in linhas:
+        indice = (linha['data'] - inicio).days
+        receitas[indice] = int((linha['receitas'] or 0) * 100)
+        despesas[indice] = int((linha['despesas'] or 0) * 100)
+
+    for linha in arquivamento.transacoes_arquivadas(usuario.pk, inicio, fim):
+        totais = receitas if linha['tipo'] == 'R' else despesas
+        totais[(linha['data'] - inicio).days] += int(linha['valor'] * 100)
+
+    return receitas, despesas
+
+
+def serie_saldo(usuario, inicio, fim, projetar=False):
+    """
+    Série diária do saldo acumulado entre `inicio` e `fim` (inclusive).
+
+    Usa duas consultas: o saldo anterior ao período e os totais agrupados
+    por dia. O acumulado é calculado de forma vetorizada. Com `projetar`,
+    uma terceira consulta soma as ocorrências ainda não lançadas das
+    recorrências (chave 'projecao'), sem gravar transações.
+    """
+    saldo_inicial = int(saldo_anterior(usuario, inicio) * 100)
+    receitas, despesas = totais_diarios(usuario, inicio, fim)
+    saldos = saldo_inicial + np.cumsum(receitas - despesas)
+
+    datas = [inicio + timedelta(days=i) for i in range(len(saldos))]
+    serie = {
+        'inicio': inicio,
+        'fim': fim,
+        'datas': datas,
+        'saldo_inicial': saldo_inicial / 100,
+        'receitas': (receitas / 100).tolist(),
+        'despesas': (despesas / 100).tolist(),
+        'saldos': (saldos / 100).tolist(),
+    }
+    if projetar:
+        receitas_futuras, despesas_futuras = recorrencias.totais_diarios_projetados(usuario, inicio, fim)
+        if receitas_futuras.any() or despesas_futuras.any():
+            serie['projecao'] = ((saldos + np.cumsum(receitas_futuras - despesas_futuras)) / 100).tolist()
+    return serie
+
+
+def dados_grafico_evolucao(serie):
+    """Monta o dicionário do Chart.js para o gráfico de evolução do saldo."""
+    dados = {
+        'labels': [d.strftime('%d/%m') for d in serie['datas']],
+        'datasets': [{
+            'label': 'Saldo Acumulado',
+            'data': serie['saldos'],
+            'borderColor': '#4BC0C0',
+            'backgroundColor': 'rgba(75, 192, 192, 0.2)',
+            'borderWidth': 2,
+            'fill': True,
+            'tension': 0.4,
+            'pointRadius': 4,
+            'pointBackgroundColor': '#4BC0C0',
+            'pointHoverRadius': 6,
+            'pointHoverBackgroundColor': '#36A2EB',
+            'pointHoverBorderColor': '#fff',
+            'pointHoverBorderWidth': 2
+        }]
+    }
+    if 'projecao' in serie:
+        dados['datasets'].append({
+            'label': 'Projeção com Recorrências',
+            'data': serie['projecao'],
+            'borderColor': '#9966FF',
+            'borderDash': [6, 4],
+            'borderWidth': 2,
+            'fill': False,
+            'tension': 0.4,
+            'pointRadius': 0,
+        })
+    return dados
+
+
+def somar_meses(ano, mes, quantidade):
+    """(ano, mes) deslocado de `quantidade` meses (negativa para trás)."""
+    indice = ano * 12 + (mes - 1) + quantidade
+    return indice // 12, indice % 12 + 1
+
+
+def meses_do_intervalo(inicio, fim):
+    """Lista de (ano, mes) de `inicio` a `fim`, ambos (ano, mes) e inclusive."""
+    total = (fim[0] * 12 + fim[1]) - (inicio[0] * 12 + inicio[1]) + 1
+    return [somar_meses(*inicio, i) for i in range(max(total, 0))]
+
+
+def _anos_com_movimento(usuario):
+    return ResumoMensalCategoria.objects.filter(
+        usuario=usuario, quantidade__gt=0,
+    ).values_list('ano', flat=True).distinct().order_by()
+
+
+def anos_disponiveis(usuario, hoje=None):
+    """Anos com movimento nos resumos do usuário, sempre incluindo o atual."""
+    hoje = hoje or date.today()
+    anos = set(_anos_com_movimento(usuario))
+    anos.add(hoje.year)
+    return sorted(anos, reverse=True)
+
+
+async def aanos_disponiveis(usuario, hoje=None):
+    """Versão assíncrona de anos_disponiveis."""
+    hoje = hoje or date.today()
+    anos = {ano async for ano in _anos_com_movimento(usuario)}
+    anos.add(hoje.year)
+    return sorted(anos, reverse=True)
+
+
+def variacao(atual, anterior):
+    """Diferença absoluta e percentual (None quando não há base de comparação)."""
+    diferenca = atual - anterior
+    percentual = float(diferenca / abs(anterior) * 100) if anterior else None
+    return {'diferenca': diferenca, 'percentual': percentual}
+
+
+def totais_mensais(usuario, inicio, fim):
+    """
+    Totais por mês e categoria entre `inicio` e `fim` ((ano, mes), inclusive).
+
+    Lê os resumos mensais em uma única consulta agrupada. Os 12 meses
+    anteriores ao intervalo também são carregados, para que o primeiro mês
+    tenha base de comparação mensal e anual. Retorna um dicionário com:
+
+    - meses: lista de (ano, mes) do intervalo;
+    - receitas, despesas, saldos: listas de Decimal alinhadas com `meses`;
+    - categorias: lista de dicionários (id, nome, tipo, valores, total),
+      ordenada por tipo e total decrescente;
+    - variacao_mensal e variacao_anual: por mês, a variação de receitas,
+      despesas e saldo contra o mês anterior e o mesmo mês do ano anterior.
+    """
+    meses, linhas = _consulta_totais_mensais(usuario, inicio, fim)
+    return _montar_totais_mensais(meses, inicio, linhas)
+
+
+async def atotais_mensais(usuario, inicio, fim):
+    """Versão assíncrona de totais_mensais."""
+    meses, linhas = _consulta_totais_mensais(usuario, inicio, fim)
+    return _montar_totais_mensais(meses, inicio, [linha async for linha in linhas])
+
+
+def totais_do_mes_por_usuario(usuario_ids, ano, mes):
+    """
+    totais_mensais de um único mês para vários usuários, em uma única
+    consulta agrupada: {usuario_id: totais}. Só o mês anterior e o mesmo
+    mês do ano anterior são carregados, como base das variações.
+    """
+    anterior = somar_meses(ano, mes, -1)
+    linhas = ResumoMensalCategoria.objects.filter(
+        Q(ano=ano, mes=mes) | Q(ano=anterior[0], mes=anterior[1]) | Q(ano=ano - 1, mes=mes),
+        usuario_id__in=usuario_ids,
+    ).values(
+        'usuario_id', 'ano', 'mes', 'categoria_id', 'categoria__nome', 'categoria__tipo',
+    ).annotate(soma=Sum('total')).order_by()
+
+    por_usuario = {usuario_id: [] for usuario_id in usuario_ids}
+    for linha in linhas:
+        por_usuario[linha['usuario_id']].append(linha)
+    return {
+        usuario_id: _montar_totais_mensais([(ano, mes)], (ano, mes), linhas_usuario)
+        for usuario_id, linhas_usuario in por_usuario.items()
+    }
+
+
+def _consulta_totais_mensais(usuario, inicio, fim):
+    meses = meses_do_intervalo(inicio, fim)
+    if not meses:
+        raise ValueError('Intervalo de meses vazio')
+    if len(meses) > MAXIMO_MESES:
+        raise ValueError(f'Intervalo maior que {MAXIMO_MESES} meses')
+
+    carregar_de = somar_meses(*inicio, -12)
+    linhas = ResumoMensalCategoria.objects.filter(
+        Q(ano__gt=carregar_de[0]) | Q(ano=carregar_de[0], mes__gte=carregar_de[1]),
+        Q(ano__lt=fim[0]) | Q(ano=fim[0], mes__lte=fim[1]),
+        usuario=usuario,
+        ano__range=(carregar_de[0], fim[0]),
+    ).values(
+        'ano', 'mes', 'categoria_id', 'categoria__nome', 'categoria__tipo',
+    ).annotate(soma=Sum('total')).order_by()
+    return meses, linhas
+
+
+def _montar_totais_mensais(meses, inicio, linhas):
+    por_tipo = {'R': {}, 'D': {}}
+    categorias = {}
+    for linha in linhas:
+        chave = (linha['ano'], linha['mes'])
+        tipo = linha['categoria__tipo']
+        por_tipo[tipo][chave] = por_tipo[tipo].get(chave, 0) + linha['soma']
+        if chave < inicio:
+            continue
+        categoria = categorias.setdefault(linha['categoria_id'], {
+            'id': linha['categoria_id'],
+            'nome': linha['categoria__nome'],
+            'tipo': tipo,
+            'valores': dict.fromkeys(meses, 0),
+        })
+        categoria['valores'][chave] += linha['soma']
+
+    def totais(chave):
+        receitas = por_tipo['R'].get(chave, 0)
+        despesas = por_tipo['D'].get(chave, 0)
+        return {'receitas': receitas, 'despesas': despesas, 'saldo': receitas - despesas}
+
+    def comparar(chave, deslocamento):
+        atual, anterior = totais(chave), totais(somar_meses(*chave, deslocamento))
+        return {campo: variacao(atual[campo], anterior[campo]) for campo in atual}
+
+    for categoria in categorias.values():
+        categoria['valores'] = [categoria['valores'][chave] for chave in meses]
+        categoria['total'] = sum(categoria['valores'])
+
+    return {
+        'meses': meses,
+        'receitas': [totais(chave)['receitas'] for chave in meses],
+        'despesas': [totais(chave)['despesas'] for chave in meses],
+        'saldos': [totais(chave)['saldo'] for chave in meses],
+        'categorias': sorted(
+            (c for c in categorias.values() if c['total']),
+            key=lambda c: (c['tipo'] != 'R', -c['total']),
+        ),
+        'variacao_mensal': [comparar(chave, -1) for chave in meses],
+        'variacao_anual': [comparar(chave, -12) for chave in meses],
+    }
+
+
+def relatorio_anual(usuario, ano):
+    """Totais mensais do `ano` e a comparação do ano inteiro com o anterior."""
+    return _montar_relatorio_anual(ano, totais_mensais(usuario, (ano, 1), (ano, 12)))
+
+
+async def arelatorio_anual(usuario, ano):
+    """Versão assíncrona de relatorio_anual."""
+    return _montar_relatorio_anual(ano, await atotais_mensais(usuario, (ano, 1), (ano, 12)))
+
+
+def _montar_relatorio_anual(ano, totais):
+    resumo = {}
+    for campo, variacao_campo in (('receitas', 'receitas'), ('despesas', 'despesas'), ('saldos', 'saldo')):
+        total = sum(totais[campo])
+        # O ano anterior já veio na mesma consulta, como base da variação anual
+        anterior = total - sum(v[variacao_campo]['diferenca'] for v in totais['variacao_anual'])
+        resumo[campo] = {'total': total, 'anterior': anterior, **variacao(total, anterior)}
+    return {'ano': ano, 'totais': totais, 'resumo': resumo}
@@ -0,0 +1,169 @@
+"""
+Manutenção e leitura dos resumos mensais por categoria.
+
+Os totais de ResumoMensalCategoria são atualizados com F() a cada
+transação criada, editada ou excluída (ver controle/signals.py), de modo
+que o dashboard e os relatórios não precisam varrer Transacao. As pernas
+de transferências entre contas não entram nos resumos.
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+from .models import Categoria, ResumoArquivado, ResumoMensalCategoria, Transacao
+
+_campo_data = Transacao._meta.get_field('data')
+
+
+def ano_mes(data):
+    # Normaliza datetimes (default=timezone.now) para a data local gravada no banco
+    data = _campo_data.to_python(data)
+    return data.year, data.month
+
+
+def registrar_movimento(usuario_id, data, categoria_id, valor, quantidade):
+    """Soma `valor` e `quantidade` ao resumo do mês de `data` para a categoria."""
+    ano, mes = ano_mes(data)
+    aplicar_deltas({(usuario_id, ano, mes, categoria_id): (valor, quantidade)})
+
+
+def aplicar_deltas(deltas):
+    """
+    Aplica um lote de diferenças no formato
+    {(usuario_id, ano, mes, categoria_id): (valor, quantidade)}.
+
+    Cada chave custa um UPDATE; as linhas que ainda não existem são criadas.
+    Remoções sem linha correspondente são ignoradas: o resumo já foi
+    excluído junto com a categoria (exclusão em cascata).
+    """
+    for (usuario_id, ano, mes, categoria_id), (valor, quantidade) in deltas.items():
+        filtro = dict(usuario_id=usuario_id, ano=ano, mes=mes, categoria_id=categoria_id)
+        atualizados = ResumoMensalCategoria.objects.filter(**filtro).update(
+            total=F('total') + valor,
+            quantidade=F('quantidade') + quantidade,
+        )
+        if atualizados or quantidade < 0:
+            continue
+        try:
+            with transaction.atomic():
+                ResumoMensalCategoria.objects.create(total=valor, quantidade=quantidade, **filtro)
+        except IntegrityError:
+            # Outro processo criou a linha entre o UPDATE e o INSERT
+            ResumoMensalCategoria.objects.filter(**filtro).update(
+                total=F('total') + valor,
+                quantidade=F('quantidade') + quantidade,
+            )
+
+
+def deltas_de_transacoes(transacoes, sinal=1):
+    """Agrupa transações (ainda não persistidas ou já excluídas) em deltas de resumo."""
+    deltas = defaultdict(lambda: [0, 0])
+    for transacao in transacoes:
+        if transacao.transferencia_id:
+            continue
+        ano, mes = ano_mes(transacao.data)
+        chave = (transacao.usuario_id, ano, mes, transacao.categoria_id)
+        deltas[chave][0] += sinal * transacao.valor
+        deltas[chave][1] += sinal
+    return {chave: tuple(valores) for chave, valores in deltas.items()}
+
+
+@transaction.atomic
+def reconstruir(usuario=None):
+    """
+    Recalcula todos os resumos (de um usuário ou de todos) a partir de
+    Transacao e dos totais das transações arquivadas.
+    """
+    resumos = ResumoMensalCategoria.objects.all()
+    transacoes = Transacao.objects.filter(transferencia__isnull=True)
+    arquivados = ResumoArquivado.objects.all()
+    if usuario is not None:
+        resumos = resumos.filter(usuario=usuario)
+        transacoes = transacoes.filter(usuario=usuario)
+        arquivados = arquivados.filter(usuario=usuario)
+    usuarios = set(resumos.values_list('usuario_id', flat=True))
+    resumos.delete()
+
+    totais = defaultdict(lambda: [0, 0])
+    for linhas in (
+        transacoes.annotate(ano=ExtractYear('data'), mes=ExtractMonth('data')).values(
+            'usuario_id', 'ano', 'mes', 'categoria_id',
+        ).annotate(total=Sum('valor'), quantidade=Count('id')),
+        arquivados.values('usuario_id', 'ano', 'mes', 'categoria_id').annotate(
+            total=Sum('total'), quantidade=Sum('quantidade'),
+        ),
+    ):
+        for linha in linhas.order_by().iterator():
+            chave = (linha['usuario_id'], linha['ano'], linha['mes'], linha['categoria_id'])
+            totais[chave][0] += linha['total']
+            totais[chave][1] += linha['quantidade']
+
+    novos = [
+        ResumoMensalCategoria(
+            usuario_id=usuario_id, ano=ano, mes=mes, categoria_id=categoria_id,
+            total=total, quantidade=quantidade,
+        )
+        for (usuario_id, ano, mes, categoria_id), (total, quantidade) in totais.items()
+    ]
+    ResumoMensalCategoria.objects.bulk_create(novos, batch_size=1000)
+
+    # Importado aqui porque o cache do dashboard depende deste módulo
+    from . import cache
+    for usuario_id in usuarios | {usuario_id for usuario_id, _, _, _ in totais}:
+        cache.invalidar_meses_do_usuario(usuario_id)
+    return len(novos)
+
+
+def _somas_por_tipo():
+    return {
+        'receitas': Sum('total', filter=Q(categoria__tipo='R')),
+        'despesas': Sum('total', filter=Q(categoria__tipo='D')),
+    }
+
+
+def totais_mes(usuario, ano, mes):
+    """Total de receitas e despesas do mês, lido dos resumos."""
+    totais = ResumoMensalCategoria.objects.filter(
+        usuario=usuario, ano=ano, mes=mes,
+    ).aggregate(**_somas_por_tipo())
+    return totais['receitas'] or 0, totais['despesas'] or 0
+
+
+async def atotais_mes(usuario, ano, mes):
+    """Versão assíncrona de totais_mes."""
+    totais = await ResumoMensalCategoria.objects.filter(
+        usuario=usuario, ano=ano, mes=mes,
+    ).aaggregate(**_somas_por_tipo())
+    return totais['receitas'] or 0, totais['despesas'] or 0
+
+
+def _totais_e_categorias(usuario, ano, mes, tipo):
+    totais = ResumoMensalCategoria.objects.filter(
+        usuario=usuario, ano=ano, mes=mes, categoria__tipo=tipo,
+    ).values_list('categoria_id', 'total')
+    return totais, Categoria.objects.filter(usuario=usuario, tipo=tipo, transferencia=False)
+
+
+def totais_por_categoria(usuario, ano, mes, tipo='D', incluir_zeradas=False):
+    """
+    Lista de (categoria, total) do mês para as categorias do `tipo`.
+
+    Com `incluir_zeradas`, as categorias sem movimento no mês entram com
+    total zero; a ordem segue a da Categoria (nome).
+    """
+    consulta_totais, categorias = _totais_e_categorias(usuario, ano, mes, tipo)
+    totais = dict(consulta_totais)
+    if not incluir_zeradas:
+        categorias = categorias.filter(pk__in=[pk for pk, total in totais.items() if total])
+    return [(categoria, totais.get(categoria.pk, 0)) for categoria in categorias]
+
+
+async def atotais_por_categoria(usuario, ano, mes, tipo='D', incluir_zeradas=False):
+    """Versão assíncrona de totais_por_categoria."""
+    consulta_totais, categorias = _totais_e_categorias(usuario, ano, mes, tipo)
+    totais = {pk: total async for pk, total in consulta_totais}
+    if not incluir_zeradas:
+        categorias = categorias.filter(pk__in=[pk for pk, total in totais.items() if total])
+    return [(categoria, totais.get(categoria.pk, 0)) async for categoria in categorias]
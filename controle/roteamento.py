@@ -0,0 +1,137 @@
+"""
+Roteamento de leituras para a réplica (opcional) do banco.
+
+Com settings.BANCO_REPLICA definido (ver DATABASES em settings), as
+views de relatórios e listas decoradas com @leitura_replica fazem suas
+leituras na réplica; todo o resto, inclusive escritas e leituras de
+outras views, continua no banco principal.
+
+Leitura das próprias escritas: o roteador registra qualquer escrita
+feita durante a requisição e LeituraPosEscritaMiddleware grava o horário
+na sessão. Por BANCO_REPLICA_ATRASO_MAXIMO segundos depois disso, as
+views daquela sessão leem do principal, então uma transação recém-salva
+aparece mesmo que a réplica ainda não a tenha recebido.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+CHAVE_SESSAO = 'controle_ultima_escrita'
+# Apps cujas escritas não contam como escrita do usuário (a própria sessão)
+APPS_IGNORADOS = frozenset({'sessions'})
+
+_ler_da_replica = ContextVar('ler_da_replica', default=False)
+# Dicionário da requisição atual; mutável para que escritas feitas em
+# outra thread (sync_to_async copia o contexto) também sejam vistas
+_escritas = ContextVar('escritas', default=None)
+
+
+def replica():
+    """Alias da réplica ou None quando não houver réplica configurada."""
+    return getattr(settings, 'BANCO_REPLICA', None)
+
+
+@contextmanager
+def ler_da_replica():
+    """Envia as leituras do bloco para a réplica, se houver."""
+    token = _ler_da_replica.set(True)
+    try:
+        yield
+    finally:
+        _ler_da_replica.reset(token)
+
+
+class RoteadorReplica:
+    def db_for_read(self, model, **hints):
+        if _ler_da_replica.get():
+            return replica()
+        return None
+
+    def db_for_write(self, model, **hints):
+        escritas = _escritas.get()
+        if escritas is not None and model._meta.app_label not in APPS_IGNORADOS:
+            escritas['houve'] = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Réplica e principal têm os mesmos dados
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # A réplica recebe o esquema do principal, não as migrações
+        if db == replica():
+            return False
+        return None
+
+
+def _recente(ultima):
+    return ultima is not None and time.time() - ultima < settings.BANCO_REPLICA_ATRASO_MAXIMO
+
+
+def escrita_recente(request):
+    session = getattr(request, 'session', None)
+    return _recente(session.get(CHAVE_SESSAO) if session is not None else None)
+
+
+async def aescrita_recente(request):
+    session = getattr(request, 'session', None)
+    return _recente(await session.aget(CHAVE_SESSAO) if session is not None else None)
+
+
+def leitura_replica(view):
+    """Lê da réplica, exceto logo após uma escrita da mesma sessão."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper_async(request, *args, **kwargs):
+            if not replica() or await aescrita_recente(request):
+                return await view(request, *args, **kwargs)
+            with ler_da_replica():
+                return await view(request, *args, **kwargs)
+        return wrapper_async
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not replica() or escrita_recente(request):
+            return view(request, *args, **kwargs)
+        with ler_da_replica():
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class LeituraPosEscritaMiddleware:
+    """Registra na sessão o horário da última requisição com escritas."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        escritas = {'houve': False}
+        token = _escritas.set(escritas)
+        try:
+            response = self.get_response(request)
+        finally:
+            _escritas.reset(token)
+        if escritas['houve'] and replica() and hasattr(request, 'session'):
+            request.session[CHAVE_SESSAO] = time.time()
+        return response
+
+    async def __acall__(self, request):
+        escritas = {'houve': False}
+        token = _escritas.set(escritas)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _escritas.reset(token)
+        if escritas['houve'] and replica() and hasattr(request, 'session'):
+            await request.session.aset(CHAVE_SESSAO, time.time())
+        return response
@@ -0,0 +1,281 @@
+"""
+Saldos das contas: recálculo a partir do histórico, saldos mensais e
+extrato com saldo corrido.
+
+SaldoMensalConta guarda, por conta e mês, o movimento do mês e o
+acumulado até o fim dele. Os sinais de Transacao mantêm essas linhas com
+F(), como os resumos por categoria, então o saldo no início de qualquer
+data custa uma busca indexada mais a soma dos dias anteriores do próprio
+mês, e não uma soma do histórico inteiro.
+
+As transações arquivadas (ver arquivamento.py) continuam contando nos
+recálculos pelos seus totais em ResumoArquivado. A soma dos dias
+anteriores do próprio mês também inclui as do arquivo, quando o ano tem
+um.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, DecimalField, F, OuterRef, Q, Subquery, Sum, Value, When, Window
+from django.db.models.functions import Coalesce, ExtractMonth, ExtractYear
+
+from . import cache, paginacao, resumos
+from .models import Conta, ResumoArquivado, SaldoMensalConta, Transacao, sinal_do_tipo
+
+_DECIMAL = DecimalField(max_digits=14, decimal_places=2)
+
+
+def movimento(campo='valor'):
+    """Valor da transação com sinal: receitas somam e despesas subtraem."""
+    return Case(
+        When(categoria__tipo='R', then=F(campo)),
+        default=-F(campo),
+        output_field=_DECIMAL,
+    )
+
+
+def movimento_por_conta():
+    """Subconsulta com o total (receitas - despesas) da conta externa."""
+    return Transacao.objects.filter(conta=OuterRef('pk')).order_by().values('conta').annotate(
+        movimento=Sum(movimento())
+    ).values('movimento')
+
+
+def movimento_arquivado_por_conta():
+    """Como movimento_por_conta, para os totais arquivados da conta externa."""
+    return ResumoArquivado.objects.filter(conta=OuterRef('pk')).order_by().values('conta').annotate(
+        movimento=Sum(movimento('total'))
+    ).values('movimento')
+
+
+def recalcular(contas=None):
+    """
+    Reescreve o saldo das contas como saldo_inicial + movimentos (das
+    transações e dos totais arquivados), em um único UPDATE com
+    subconsultas agrupadas, e reconstrói os saldos mensais delas. Retorna
+    o número de contas.
+    """
+    if contas is None:
+        contas = Conta.objects.all()
+    with transaction.atomic():
+        usuarios = set(contas.values_list('usuario_id', flat=True))
+        total = contas.update(
+            saldo=F('saldo_inicial') + Coalesce(
+                Subquery(movimento_por_conta()),
+                Value(0),
+                output_field=_DECIMAL,
+            ) + Coalesce(
+                Subquery(movimento_arquivado_por_conta()),
+                Value(0),
+                output_field=_DECIMAL,
+            )
+        )
+        reconstruir_mensais(contas)
+        for usuario_id in usuarios:
+            cache.invalidar(usuario_id, partes=('saldo',))
+            cache.invalidar_meses_do_usuario(usuario_id)
+    return total
+
+
+@transaction.atomic
+def reconstruir_mensais(contas=None):
+    """
+    Recalcula os saldos mensais (de todas as contas ou das `contas`) a
+    partir de Transacao e dos totais arquivados.
+    """
+    existentes = SaldoMensalConta.objects.all()
+    transacoes = Transacao.objects.all()
+    arquivados = ResumoArquivado.objects.all()
+    if contas is not None:
+        existentes = existentes.filter(conta__in=contas)
+        transacoes = transacoes.filter(conta__in=contas)
+        arquivados = arquivados.filter(conta__in=contas)
+    existentes.delete()
+
+    movimentos = defaultdict(int)
+    for linhas in (
+        transacoes.annotate(ano=ExtractYear('data'), mes=ExtractMonth('data')).values(
+            'conta_id', 'ano', 'mes',
+        ).annotate(movimento=Sum(movimento())),
+        arquivados.values('conta_id', 'ano', 'mes').annotate(movimento=Sum(movimento('total'))),
+    ):
+        for linha in linhas.order_by().iterator():
+            movimentos[(linha['conta_id'], linha['ano'], linha['mes'])] += linha['movimento']
+
+    novos = []
+    conta_anterior, acumulado = None, 0
+    for (conta_id, ano, mes), valor in sorted(movimentos.items()):
+        if conta_id != conta_anterior:
+            conta_anterior, acumulado = conta_id, 0
+        acumulado += valor
+        novos.append(SaldoMensalConta(conta_id=conta_id, ano=ano, mes=mes, movimento=valor, acumulado=acumulado))
+    SaldoMensalConta.objects.bulk_create(novos, batch_size=1000)
+    return len(novos)
+
+
+def _antes_de(ano, mes):
+    return Q(ano__lt=ano) | Q(ano=ano, mes__lt=mes)
+
+
+def _depois_de(ano, mes):
+    return Q(ano__gt=ano) | Q(ano=ano, mes__gt=mes)
+
+
+def acumulado_antes(conta_id, ano, mes):
+    """Movimento acumulado da conta até o fim do mês anterior a `ano`/`mes`."""
+    acumulado = SaldoMensalConta.objects.filter(
+        _antes_de(ano, mes), conta_id=conta_id,
+    ).order_by('-ano', '-mes').values_list('acumulado', flat=True).first()
+    return acumulado or 0
+
+
+def aplicar_deltas_mensais(deltas, criar=True):
+    """
+    Soma cada valor de {(conta_id, ano, mes): valor} ao movimento do mês e
+    ao acumulado do mês e dos meses seguintes.
+
+    Um mês sem linha é criado a partir do acumulado do mês anterior. Com
+    `criar` falso (remoções), meses sem linha são ignorados: a linha foi
+    excluída junto com a conta.
+    """
+    for (conta_id, ano, mes), valor in deltas.items():
+        if not valor:
+            continue
+        SaldoMensalConta.objects.filter(_depois_de(ano, mes), conta_id=conta_id).update(
+            acumulado=F('acumulado') + valor,
+        )
+        filtro = dict(conta_id=conta_id, ano=ano, mes=mes)
+        somar = dict(movimento=F('movimento') + valor, acumulado=F('acumulado') + valor)
+        if SaldoMensalConta.objects.filter(**filtro).update(**somar) or not criar:
+            continue
+        try:
+            with transaction.atomic():
+                SaldoMensalConta.objects.create(
+                    movimento=valor, acumulado=acumulado_antes(conta_id, ano, mes) + valor, **filtro,
+                )
+        except IntegrityError:
+            # Outro processo criou a linha entre o UPDATE e o INSERT
+            SaldoMensalConta.objects.filter(**filtro).update(**somar)
+
+
+def registrar_movimento(conta_id, data, valor, criar=True):
+    """Soma `valor` (com sinal) ao saldo mensal da conta no mês de `data`."""
+    ano, mes = resumos.ano_mes(data)
+    aplicar_deltas_mensais({(conta_id, ano, mes): valor}, criar=criar)
+
+
+def deltas_de_transacoes(transacoes):
+    """Agrupa transações em deltas de saldo mensal; exige `categoria` já carregada."""
+    deltas = defaultdict(int)
+    for transacao in transacoes:
+        ano, mes = resumos.ano_mes(transacao.data)
+        deltas[(transacao.conta_id, ano, mes)] += sinal_do_tipo(transacao.categoria.tipo) * transacao.valor
+    return deltas
+
+
+def inverter_categoria(categoria):
+    """Ajusta os saldos mensais depois que a categoria trocou de tipo."""
+    deltas = defaultdict(int)
+    for linhas in (
+        Transacao.objects.filter(categoria=categoria).annotate(
+            ano=ExtractYear('data'),
+            mes=ExtractMonth('data'),
+        ).values('conta_id', 'ano', 'mes').annotate(total=Sum('valor')),
+        ResumoArquivado.objects.filter(categoria=categoria).values('conta_id', 'ano', 'mes').annotate(
+            total=Sum('total'),
+        ),
+    ):
+        for linha in linhas.order_by():
+            deltas[(linha['conta_id'], linha['ano'], linha['mes'])] += 2 * sinal_do_tipo(categoria.tipo) * linha['total']
+    aplicar_deltas_mensais(deltas)
+
+
+def _arquivadas(usuario_id, inicio, fim, conta_id=None):
+    # [((data, id), movimento)] das transações arquivadas no intervalo.
+    # Importado aqui: arquivamento depende de lancamentos, que depende dos sinais
+    from . import arquivamento
+    if fim < inicio:
+        return []
+    return [
+        ((linha['data'], linha['id']), sinal_do_tipo(linha['tipo']) * linha['valor'])
+        for linha in arquivamento.transacoes_arquivadas(usuario_id, inicio, fim, conta_id)
+    ]
+
+
+def movimento_antes(usuario, data):
+    """
+    Movimento acumulado (receitas - despesas) de todas as contas do
+    usuário antes de `data`, em uma consulta: para cada conta, o
+    acumulado mensal anterior mais os dias anteriores do próprio mês. Não
+    depende do tamanho do histórico nem das transações arquivadas de
+    meses anteriores.
+    """
+    acumulado = SaldoMensalConta.objects.filter(
+        _antes_de(data.year, data.month), conta=OuterRef('pk'),
+    ).order_by('-ano', '-mes').values('acumulado')[:1]
+    no_mes = Transacao.objects.filter(
+        conta=OuterRef('pk'), data__gte=data.replace(day=1), data__lt=data,
+    ).order_by().values('conta').annotate(movimento=Sum(movimento())).values('movimento')
+    total = Conta.objects.filter(usuario=usuario).aggregate(total=Sum(
+        Coalesce(Subquery(acumulado), Value(0), output_field=_DECIMAL)
+        + Coalesce(Subquery(no_mes), Value(0), output_field=_DECIMAL)
+    ))['total']
+    arquivado = sum(valor for _, valor in _arquivadas(usuario.pk, data.replace(day=1), data - timedelta(days=1)))
+    return (total or 0) + arquivado
+
+
+def saldo_em(conta, data):
+    """Saldo da conta no início de `data`, antes das transações do dia."""
+    anteriores_no_mes = Transacao.objects.filter(
+        conta=conta, data__gte=data.replace(day=1), data__lt=data,
+    ).aggregate(total=Sum(movimento()))['total']
+    arquivado = sum(valor for _, valor in _arquivadas(conta.usuario_id, data.replace(day=1), data - timedelta(days=1), conta.pk))
+    return conta.saldo_inicial + acumulado_antes(conta.pk, data.year, data.month) + (anteriores_no_mes or 0) + arquivado
+
+
+def extrato(conta, inicio=None, fim=None, depois=None, antes=None, tamanho=paginacao.TAMANHO_PAGINA):
+    """
+    Página do extrato da conta entre `inicio` e `fim` (inclusive), da
+    transação mais recente para a mais antiga, com paginação por cursor
+    (ver paginacao.paginar). Cada transação recebe `saldo`, o saldo da
+    conta logo depois dela.
+
+    O saldo corrido vem de um Window(Sum) sobre as transações do início
+    do mês da mais antiga da página até a mais recente, somado ao saldo
+    mensal anterior: o custo depende do tamanho de um mês, não do
+    histórico. O resultado também traz os saldos de abertura e de
+    fechamento do período.
+    """
+    transacoes = Transacao.objects.filter(conta=conta).select_related('categoria')
+    if inicio:
+        transacoes = transacoes.filter(data__gte=inicio)
+    if fim:
+        transacoes = transacoes.filter(data__lte=fim)
+    pagina = paginacao.paginar(transacoes, depois=depois, antes=antes, tamanho=tamanho)
+
+    itens = pagina['itens']
+    if itens:
+        mais_antiga, mais_recente = itens[-1], itens[0]
+        inicio_mes = mais_antiga.data.replace(day=1)
+        parciais = dict(
+            Transacao.objects.filter(
+                Q(data__lt=mais_recente.data) | Q(data=mais_recente.data, pk__lte=mais_recente.pk),
+                conta=conta,
+                data__gte=inicio_mes,
+            ).annotate(
+                parcial=Window(Sum(movimento()), order_by=[F('data').asc(), F('id').asc()]),
+            ).values_list('pk', 'parcial')
+        )
+        abertura_mes = conta.saldo_inicial + acumulado_antes(conta.pk, inicio_mes.year, inicio_mes.month)
+        # Em meses arquivados, a tabela só tem o que foi lançado depois
+        arquivadas = _arquivadas(conta.usuario_id, inicio_mes, mais_recente.data, conta.pk)
+        for transacao in itens:
+            posicao = (transacao.data, transacao.pk)
+            transacao.saldo = abertura_mes + parciais[transacao.pk] + sum(
+                valor for chave, valor in arquivadas if chave <= posicao
+            )
+
+    pagina['saldo_abertura'] = saldo_em(conta, inicio) if inicio else conta.saldo_inicial
+    pagina['saldo_fechamento'] = saldo_em(conta, fim + timedelta(days=1)) if fim else conta.saldo
+    return pagina
@@ -0,0 +1,131 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from . import cache, resumos, saldos
+from .models import Categoria, Conta, Orcamento, Recorrencia, Transacao, sinal_do_tipo
+
+# Enviado depois de uma inserção com bulk_create (que não dispara post_save),
+# com o argumento `transacoes`. Saldos e resumos já estão atualizados.
+transacoes_em_lote = Signal()
+
+
+@receiver(post_save, sender=Transacao)
+def atualizar_resumo_ao_salvar(sender, instance, created, raw=False, **kwargs):
+    # Pernas de transferência ficam fora dos resumos (ver resumos.py)
+    if raw or instance.transferencia_id:
+        return
+    original = getattr(instance, '_original', None)
+    if not created and original:
+        # Edição: retira o valor antigo antes de somar o novo
+        resumos.registrar_movimento(
+            original['usuario_id'], original['data'], original['categoria_id'],
+            -original['valor'], -1,
+        )
+    resumos.registrar_movimento(
+        instance.usuario_id, instance.data, instance.categoria_id, instance.valor, 1,
+    )
+
+
+@receiver(post_delete, sender=Transacao)
+def atualizar_resumo_ao_excluir(sender, instance, **kwargs):
+    if instance.transferencia_id:
+        return
+    original = getattr(instance, '_original', None) or instance.__dict__
+    resumos.registrar_movimento(
+        original['usuario_id'], original['data'], original['categoria_id'],
+        -original['valor'], -1,
+    )
+
+
+@receiver(post_delete, sender=Transacao)
+def reverter_saldo_ao_excluir(sender, instance, **kwargs):
+    # Também cobre exclusões em cascata (de uma Categoria, por exemplo)
+    movimento = instance.reverter_saldo()
+    original = getattr(instance, '_original', None) or instance.__dict__
+    saldos.registrar_movimento(original['conta_id'], original['data'], movimento, criar=False)
+
+
+# Saldos mensais das contas
+
+@receiver(post_save, sender=Transacao)
+def atualizar_saldo_mensal_ao_salvar(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    original = getattr(instance, '_original', None)
+    if not created and original:
+        if original['categoria_id'] == instance.categoria_id:
+            tipo_original = instance.categoria.tipo
+        else:
+            tipo_original = Categoria.objects.values_list('tipo', flat=True).get(pk=original['categoria_id'])
+        saldos.registrar_movimento(
+            original['conta_id'], original['data'],
+            -sinal_do_tipo(tipo_original) * original['valor'], criar=False,
+        )
+    saldos.registrar_movimento(
+        instance.conta_id, instance.data, sinal_do_tipo(instance.categoria.tipo) * instance.valor,
+    )
+
+
+@receiver(transacoes_em_lote, sender=Transacao)
+def atualizar_saldo_mensal_lote(sender, transacoes, **kwargs):
+    saldos.aplicar_deltas_mensais(saldos.deltas_de_transacoes(transacoes))
+
+
+@receiver(post_save, sender=Categoria)
+def atualizar_saldo_mensal_categoria(sender, instance, created, raw=False, **kwargs):
+    # Categoria.save só atualiza _tipo_original depois do post_save
+    tipo_original = getattr(instance, '_tipo_original', None)
+    if not raw and not created and tipo_original and tipo_original != instance.tipo:
+        saldos.inverter_categoria(instance)
+
+
+# Invalidação do cache do dashboard
+
+@receiver(post_save, sender=Transacao)
+@receiver(post_delete, sender=Transacao)
+def invalidar_cache_transacao(sender, instance, **kwargs):
+    meses = [resumos.ano_mes(instance.data)]
+    original = getattr(instance, '_original', None)
+    if original and original['data']:
+        meses.append(resumos.ano_mes(original['data']))
+    cache.invalidar(instance.usuario_id, partes=('saldo', 'recentes'), meses=meses)
+
+
+@receiver(transacoes_em_lote, sender=Transacao)
+def invalidar_cache_lote(sender, transacoes, **kwargs):
+    meses_por_usuario = {}
+    for transacao in transacoes:
+        meses_por_usuario.setdefault(transacao.usuario_id, set()).add(resumos.ano_mes(transacao.data))
+    for usuario_id, meses in meses_por_usuario.items():
+        cache.invalidar(usuario_id, partes=('saldo', 'recentes'), meses=meses)
+
+
+@receiver(post_save, sender=Conta)
+@receiver(post_delete, sender=Conta)
+def invalidar_cache_conta(sender, instance, **kwargs):
+    cache.invalidar(instance.usuario_id, partes=('saldo',))
+
+
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+def invalidar_cache_categoria(sender, instance, **kwargs):
+    # Nome e tipo aparecem nos gráficos de todos os meses, na lista de recentes e
+    # nos selects dos formulários;
+    # a troca de tipo também altera os saldos
+    cache.invalidar(instance.usuario_id, partes=('saldo', 'recentes', 'escolhas'))
+    cache.invalidar_meses_do_usuario(instance.usuario_id)
+
+
+@receiver(post_save, sender=Orcamento)
+@receiver(post_delete, sender=Orcamento)
+def invalidar_cache_orcamento(sender, instance, **kwargs):
+    # O limite vale para todos os meses
+    cache.invalidar_meses_do_usuario(instance.usuario_id)
+
+
+@receiver(post_save, sender=Recorrencia)
+@receiver(post_delete, sender=Recorrencia)
+def invalidar_cache_recorrencia(sender, instance, **kwargs):
+    # Nenhuma parte do dashboard usa recorrências, mas a projeção de saldo
+    # da API muda; invalidar sem partes só registra a alteração (ETag)
+    cache.invalidar(instance.usuario_id)
@@ -0,0 +1,116 @@
+"""
+Geração de dados sintéticos para medir o desempenho em escala.
+
+As transações são sorteadas de forma vetorizada (numpy) e gravadas com
+bulk_create, sem sinais nem Transacao.save. Ao final, os saldos das
+contas e os resumos mensais do usuário são recalculados de uma vez.
+
+A assimetria controla o quanto os dados se concentram: com 0, datas e
+categorias são uniformes; valores maiores aproximam as datas de hoje e
+concentram as transações nas primeiras categorias (pesos de Zipf).
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+
+from . import cache, resumos, saldos
+from .models import Categoria, Conta, Transacao
+
+TAMANHO_LOTE = 5000
+
+NOMES_RECEITAS = ('Salário', 'Freelance', 'Rendimentos', 'Reembolsos', 'Vendas')
+NOMES_DESPESAS = (
+    'Mercado', 'Aluguel', 'Transporte', 'Restaurantes', 'Saúde', 'Lazer',
+    'Educação', 'Contas de casa', 'Vestuário', 'Assinaturas', 'Presentes', 'Viagens',
+)
+NOMES_CONTAS = ('Conta Corrente', 'Poupança', 'Cartão', 'Carteira', 'Investimentos')
+DESCRICOES = (
+    'Compra', 'Pagamento', 'Transferência', 'Débito automático', 'Pix',
+    'Boleto', 'Assinatura mensal', 'Depósito', 'Saque', 'Estorno',
+)
+
+
+def _pesos_zipf(quantidade, assimetria):
+    pesos = 1 / np.arange(1, quantidade + 1) ** assimetria
+    return pesos / pesos.sum()
+
+
+def _nomes(base, quantidade):
+    return [base[i % len(base)] + (f' {i // len(base) + 1}' if i >= len(base) else '') for i in range(quantidade)]
+
+
+def preparar_usuario(username, categorias=12, contas=3):
+    """Usuário com `categorias` categorias (1/4 de receitas) e `contas` contas."""
+    usuario, _ = User.objects.get_or_create(username=username)
+    if not Categoria.objects.filter(usuario=usuario).exists():
+        receitas = max(1, categorias // 4)
+        Categoria.objects.bulk_create(
+            [Categoria(nome=nome, tipo='R', usuario=usuario) for nome in _nomes(NOMES_RECEITAS, receitas)]
+            + [Categoria(nome=nome, tipo='D', usuario=usuario) for nome in _nomes(NOMES_DESPESAS, max(1, categorias - receitas))]
+        )
+    if not Conta.objects.filter(usuario=usuario).exists():
+        Conta.objects.bulk_create([Conta(nome=nome, usuario=usuario) for nome in _nomes(NOMES_CONTAS, contas)])
+    return usuario
+
+
+def gerar_transacoes(usuario, quantidade, dias=3 * 365, assimetria=1.0, fim=None,
+                     semente=None, tamanho_lote=TAMANHO_LOTE):
+    """
+    Grava `quantidade` transações do `usuario` nos `dias` anteriores a
+    `fim` (padrão: hoje) e recalcula saldos e resumos. Retorna o número
+    de transações criadas.
+    """
+    fim = fim or date.today()
+    gerador = np.random.default_rng(semente)
+    receitas = list(Categoria.objects.filter(usuario=usuario, tipo='R'))
+    despesas = list(Categoria.objects.filter(usuario=usuario, tipo='D'))
+    contas = list(Conta.objects.filter(usuario=usuario))
+    if not receitas or not despesas or not contas:
+        raise ValueError('O usuário precisa de categorias de receita, de despesa e de contas.')
+
+    pesos_receitas = _pesos_zipf(len(receitas), assimetria)
+    pesos_despesas = _pesos_zipf(len(despesas), assimetria)
+    pesos_contas = _pesos_zipf(len(contas), assimetria)
+
+    criadas = 0
+    with transaction.atomic():
+        while criadas < quantidade:
+            tamanho = min(tamanho_lote, quantidade - criadas)
+            # Potência de uma uniforme: com assimetria > 0, mais datas perto de `fim`
+            dias_atras = (gerador.random(tamanho) ** (1 + assimetria) * dias).astype(int)
+            eh_receita = gerador.random(tamanho) < 0.2
+            indice_receita = gerador.choice(len(receitas), tamanho, p=pesos_receitas)
+            indice_despesa = gerador.choice(len(despesas), tamanho, p=pesos_despesas)
+            indice_conta = gerador.choice(len(contas), tamanho, p=pesos_contas)
+            centavos = np.where(
+                eh_receita,
+                gerador.lognormal(11.5, 0.6, tamanho),
+                gerador.lognormal(8.5, 1.0, tamanho),
+            ).astype(np.int64).clip(1, 9_999_999_99)
+            indice_descricao = gerador.integers(0, len(DESCRICOES), tamanho)
+
+            Transacao.objects.bulk_create([
+                Transacao(
+                    descricao=f'{DESCRICOES[indice_descricao[i]]} #{criadas + i + 1}',
+                    valor=Decimal(int(centavos[i])).scaleb(-2),
+                    data=fim - timedelta(days=int(dias_atras[i])),
+                    categoria=receitas[indice_receita[i]] if eh_receita[i] else despesas[indice_despesa[i]],
+                    conta=contas[indice_conta[i]],
+                    usuario=usuario,
+                )
+                for i in range(tamanho)
+            ], batch_size=1000)
+            criadas += tamanho
+
+        saldos.recalcular(Conta.objects.filter(usuario=usuario))
+        resumos.reconstruir(usuario)
+        cache.invalidar(usuario.pk, partes=('recentes',))
+
+    # Estatísticas atualizadas para o planejador depois da carga em massa;
+    # sem elas o SQLite subestima o custo de varrer o índice por usuário
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    return criadas
@@ -1,3 +1,2003 @@
-from django.test import TestCase
+import base64
+import csv
+import json
+import os
+import re
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, router
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import arquivamento, benchmark, busca, carga, demonstrativos, exportacao, graficos, importacao, lancamentos, orcamentos, paginacao, recorrencias, roteamento, relatorios, resumos, saldos, sinteticos, transferencias
+from . import cache as cache_dashboard
+from .instrumentacao import medir
+from .models import Categoria, Conta, Orcamento, Recorrencia, ResumoArquivado, ResumoMensalCategoria, SaldoMensalConta, Transacao, Transferencia
+
+
+class DadosBasicosMixin:
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('teste', password='senha')
+        cls.receita = Categoria.objects.create(nome='Salário', tipo='R', usuario=cls.usuario)
+        cls.despesa = Categoria.objects.create(nome='Mercado', tipo='D', usuario=cls.usuario)
+        cls.conta = Conta.objects.create(nome='Corrente', usuario=cls.usuario)
+        inicio = date.today().replace(day=1) - timedelta(days=90)
+        for i in range(120):
+            Transacao.objects.create(
+                descricao=f'Lançamento {i}',
+                valor=Decimal('10.00'),
+                data=inicio + timedelta(days=i),
+                categoria=cls.receita if i % 4 == 0 else cls.despesa,
+                conta=cls.conta,
+                usuario=cls.usuario,
+            )
+
+
+class PlanoConsultasTests(DadosBasicosMixin, TestCase):
+    """
+    Roda EXPLAIN QUERY PLAN sobre as consultas das views mais acessadas e
+    falha se alguma delas fizer varredura completa de controle_transacao
+    ou precisar ordenar o resultado fora do índice.
+    """
+    TABELA = 'controle_transacao'
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Os planos verificados aqui são os do SQLite.')
+        # Com o dashboard em cache as consultas nem chegariam ao banco
+        cache.clear()
+        self.client.force_login(self.usuario)
+
+    def consultas_da_view(self, url):
+        with CaptureQueriesContext(connection) as contexto:
+            resposta = self.client.get(url)
+        self.assertEqual(resposta.status_code, 200)
+        return [q['sql'] for q in contexto.captured_queries if self.TABELA in q['sql'] and q['sql'].startswith('SELECT')]
+
+    def problemas_no_plano(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            plano = [linha[-1] for linha in cursor.fetchall()]
+        # "SCAN tabela" sem índice é uma leitura da tabela inteira e o
+        # B-tree temporário indica uma ordenação que o índice não cobriu
+        return [
+            passo for passo in plano
+            if re.fullmatch(rf'SCAN {self.TABELA}( AS \w+)?', passo)
+            or passo == 'USE TEMP B-TREE FOR ORDER BY'
+        ]
+
+    def assertSemVarreduraCompleta(self, url):
+        consultas = self.consultas_da_view(url)
+        self.assertTrue(consultas, f'Nenhuma consulta em {self.TABELA} para {url}')
+        for sql in consultas:
+            self.assertEqual(self.problemas_no_plano(sql), [], sql)
+
+    def test_dashboard(self):
+        self.assertSemVarreduraCompleta(reverse('controle:dashboard'))
+
+    def test_lista_transacoes(self):
+        self.assertSemVarreduraCompleta(reverse('controle:lista_transacoes'))
+
+    def test_lista_transacoes_filtrada(self):
+        url = reverse('controle:lista_transacoes')
+        inicio = (date.today() - timedelta(days=60)).isoformat()
+        self.assertSemVarreduraCompleta(f'{url}?data_inicio={inicio}&tipo=D')
+        self.assertSemVarreduraCompleta(f'{url}?categoria={self.despesa.pk}')
+        self.assertSemVarreduraCompleta(f'{url}?conta={self.conta.pk}&q=Lan')
+
+    def test_lista_transacoes_pagina_seguinte(self):
+        url = reverse('controle:lista_transacoes')
+        resposta = self.client.get(url)
+        self.assertSemVarreduraCompleta(f"{url}?depois={resposta.context['cursor_proximo']}")
+
+    def test_api_widgets(self):
+        self.assertSemVarreduraCompleta(reverse('controle:api_evolucao_saldo'))
+        self.assertSemVarreduraCompleta(reverse('controle:api_transacoes_recentes'))
+
+    def test_serie_saldo(self):
+        self.assertSemVarreduraCompleta(reverse('controle:serie_saldo_json') + '?periodo=trimestre')
+
+
+class SaldoContaTests(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('saldo', password='senha')
+        self.receita = Categoria.objects.create(nome='Salário', tipo='R', usuario=self.usuario)
+        self.despesa = Categoria.objects.create(nome='Mercado', tipo='D', usuario=self.usuario)
+        self.conta = Conta.objects.create(nome='Corrente', saldo=100, saldo_inicial=100, usuario=self.usuario)
+        self.poupanca = Conta.objects.create(nome='Poupança', usuario=self.usuario)
+
+    def criar(self, valor, categoria, conta=None):
+        return Transacao.objects.create(
+            descricao='Teste', valor=Decimal(valor), categoria=categoria,
+            conta=conta or self.conta, usuario=self.usuario,
+        )
+
+    def saldo(self, conta):
+        conta.refresh_from_db()
+        return conta.saldo
+
+    def test_criacao_edicao_e_exclusao(self):
+        transacao = self.criar('50.00', self.despesa)
+        self.assertEqual(self.saldo(self.conta), Decimal('50.00'))
+
+        transacao = Transacao.objects.get(pk=transacao.pk)
+        transacao.valor = Decimal('30.00')
+        transacao.save()
+        self.assertEqual(self.saldo(self.conta), Decimal('70.00'))
+
+        transacao.categoria = self.receita
+        transacao.conta = self.poupanca
+        transacao.save()
+        self.assertEqual(self.saldo(self.conta), Decimal('100.00'))
+        self.assertEqual(self.saldo(self.poupanca), Decimal('30.00'))
+
+        transacao.delete()
+        self.assertEqual(self.saldo(self.poupanca), Decimal('0.00'))
+
+    def test_troca_de_tipo_da_categoria(self):
+        self.criar('20.00', self.despesa)
+        categoria = Categoria.objects.get(pk=self.despesa.pk)
+        categoria.tipo = 'R'
+        categoria.save()
+        self.assertEqual(self.saldo(self.conta), Decimal('120.00'))
+
+    def test_exclusao_em_cascata_da_categoria(self):
+        self.criar('20.00', self.despesa)
+        self.criar('5.00', self.despesa, self.poupanca)
+        self.despesa.delete()
+        self.assertEqual(self.saldo(self.conta), Decimal('100.00'))
+        self.assertEqual(self.saldo(self.poupanca), Decimal('0.00'))
+
+    def test_recalcular_saldos(self):
+        self.criar('40.00', self.receita)
+        self.criar('15.00', self.despesa, self.poupanca)
+        Conta.objects.update(saldo=0)
+        call_command('recalcular_saldos', stdout=StringIO())
+        self.assertEqual(self.saldo(self.conta), Decimal('140.00'))
+        self.assertEqual(self.saldo(self.poupanca), Decimal('-15.00'))
+
+
+class SaldoConcorrenteTests(TransactionTestCase):
+    THREADS = 8
+    POR_THREAD = 25
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Requer um banco de testes em arquivo para conexões concorrentes.')
+        self.usuario = User.objects.create_user('concorrente', password='senha')
+        self.receita = Categoria.objects.create(nome='Salário', tipo='R', usuario=self.usuario)
+        self.despesa = Categoria.objects.create(nome='Mercado', tipo='D', usuario=self.usuario)
+        self.conta = Conta.objects.create(nome='Corrente', usuario=self.usuario)
+
+    def lancar(self, indice):
+        try:
+            categoria = Categoria.objects.get(pk=self.receita.pk if indice % 2 else self.despesa.pk)
+            conta = Conta.objects.get(pk=self.conta.pk)
+            for _ in range(self.POR_THREAD):
+                transacao = Transacao.objects.create(
+                    descricao='Concorrente', valor=Decimal('2.00'),
+                    categoria=categoria, conta=conta, usuario=self.usuario,
+                )
+                # Edição que só muda o valor: deve aplicar apenas a diferença
+                transacao.valor = Decimal('3.00')
+                transacao.save()
+        finally:
+            connections.close_all()
+
+    def test_escritas_concorrentes_nao_se_perdem(self):
+        with ThreadPoolExecutor(max_workers=self.THREADS) as executor:
+            list(executor.map(self.lancar, range(self.THREADS)))
+
+        receitas = self.THREADS // 2 * self.POR_THREAD * Decimal('3.00')
+        despesas = (self.THREADS - self.THREADS // 2) * self.POR_THREAD * Decimal('3.00')
+        self.conta.refresh_from_db()
+        self.assertEqual(Transacao.objects.count(), self.THREADS * self.POR_THREAD)
+        self.assertEqual(self.conta.saldo, receitas - despesas)
+
+
+class ExtratoContaTests(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('extrato', password='senha')
+        self.receita = Categoria.objects.create(nome='Salário', tipo='R', usuario=self.usuario)
+        self.despesa = Categoria.objects.create(nome='Mercado', tipo='D', usuario=self.usuario)
+        self.conta = Conta.objects.create(nome='Corrente', saldo=50, saldo_inicial=50, usuario=self.usuario)
+        inicio = date(2024, 1, 1)
+        for i in range(90):
+            Transacao.objects.create(
+                descricao=f'Lançamento {i}', valor=Decimal(10 + i),
+                data=inicio + timedelta(days=i * 3),
+                categoria=self.receita if i % 3 == 0 else self.despesa,
+                conta=self.conta, usuario=self.usuario,
+            )
+
+    def saldos_esperados(self):
+        # Saldo após cada transação, somando o histórico em Python
+        saldo, esperado = self.conta.saldo_inicial, {}
+        for transacao in Transacao.objects.filter(conta=self.conta).select_related('categoria').order_by('data', 'id'):
+            saldo += transacao.valor if transacao.categoria.tipo == 'R' else -transacao.valor
+            esperado[transacao.pk] = saldo
+        return esperado
+
+    def mensais(self):
+        return list(SaldoMensalConta.objects.order_by('conta_id', 'ano', 'mes').values_list(
+            'conta_id', 'ano', 'mes', 'movimento', 'acumulado',
+        ))
+
+    def assertMensaisConsistentes(self):
+        mantidos = self.mensais()
+        saldos.reconstruir_mensais()
+        # Meses que ficaram zerados continuam como linhas com movimento 0
+        self.assertEqual([linha for linha in mantidos if linha[3]], [linha for linha in self.mensais() if linha[3]])
+
+    def test_saldo_corrido_em_todas_as_paginas(self):
+        esperado = self.saldos_esperados()
+        self.conta.refresh_from_db()
+        vistos, cursor = 0, None
+        while True:
+            pagina = saldos.extrato(self.conta, depois=cursor, tamanho=20)
+            for transacao in pagina['itens']:
+                self.assertEqual(transacao.saldo, esperado[transacao.pk])
+            vistos += len(pagina['itens'])
+            cursor = pagina['cursor_proximo']
+            if not cursor:
+                break
+        self.assertEqual(vistos, 90)
+        self.assertEqual(pagina['saldo_fechamento'], self.conta.saldo)
+
+    def test_periodo_e_saldos_de_abertura_e_fechamento(self):
+        esperado = self.saldos_esperados()
+        pagina = saldos.extrato(self.conta, date(2024, 3, 10), date(2024, 5, 20))
+        datas = [t.data for t in pagina['itens']]
+        self.assertTrue(all(date(2024, 3, 10) <= d <= date(2024, 5, 20) for d in datas))
+        self.assertEqual(pagina['saldo_fechamento'], esperado[pagina['itens'][0].pk])
+        mais_antiga = pagina['itens'][-1]
+        movimento = mais_antiga.valor if mais_antiga.categoria.tipo == 'R' else -mais_antiga.valor
+        self.assertEqual(pagina['saldo_abertura'], esperado[mais_antiga.pk] - movimento)
+
+    def test_consultas_nao_dependem_da_profundidade(self):
+        primeira = saldos.extrato(self.conta, tamanho=10)
+        with CaptureQueriesContext(connection) as rasa:
+            saldos.extrato(self.conta, depois=primeira['cursor_proximo'], tamanho=10)
+        antiga = Transacao.objects.filter(conta=self.conta).order_by('data', 'id')[15]
+        cursor = paginacao.codificar_cursor(antiga)
+        with CaptureQueriesContext(connection) as profunda:
+            saldos.extrato(self.conta, depois=cursor, tamanho=10)
+        self.assertEqual(len(rasa), len(profunda))
+
+    def test_saldos_mensais_acompanham_as_alteracoes(self):
+        self.assertMensaisConsistentes()
+        transacao = Transacao.objects.filter(conta=self.conta).order_by('data')[5]
+        transacao.valor = Decimal('999.00')
+        transacao.data = date(2024, 7, 15)
+        transacao.save()
+        self.assertMensaisConsistentes()
+
+        Transacao.objects.filter(conta=self.conta).order_by('data')[10].delete()
+        self.assertMensaisConsistentes()
+
+        categoria = Categoria.objects.get(pk=self.despesa.pk)
+        categoria.tipo = 'R'
+        categoria.save()
+        self.assertMensaisConsistentes()
+
+        lancamentos.inserir_em_lote(
+            Transacao(descricao='Lote', valor=Decimal('7.00'), data=date(2023, 12, 1) + timedelta(days=i * 40),
+                      categoria=categoria, conta=self.conta, usuario=self.usuario)
+            for i in range(5)
+        )
+        self.assertMensaisConsistentes()
+
+        self.conta.refresh_from_db()
+        self.assertEqual(saldos.saldo_em(self.conta, date(2030, 1, 1)), self.conta.saldo)
+
+    def test_saldo_em(self):
+        esperado = self.saldos_esperados()
+        anterior = Transacao.objects.filter(conta=self.conta, data__lt=date(2024, 4, 15)).order_by('-data', '-id').first()
+        self.assertEqual(saldos.saldo_em(self.conta, date(2024, 4, 15)), esperado[anterior.pk])
+        self.assertEqual(saldos.saldo_em(self.conta, date(2023, 1, 1)), self.conta.saldo_inicial)
+
+    def test_view_do_extrato(self):
+        self.client.force_login(self.usuario)
+        resposta = self.client.get(reverse('controle:extrato_conta', args=[self.conta.pk]), {
+            'data_inicio': '2024-02-01', 'data_fim': '2024-02-29',
+        })
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(all(t.data.month == 2 for t in resposta.context['transacoes']))
+        self.assertIn('data_inicio=2024-02-01', resposta.context['parametros'])
+
+        outro = User.objects.create_user('outro', password='senha')
+        self.client.force_login(outro)
+        resposta = self.client.get(reverse('controle:extrato_conta', args=[self.conta.pk]))
+        self.assertEqual(resposta.status_code, 404)
+
+
+class EscolhasFormularioTests(DadosBasicosMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.usuario)
+        self.outro = User.objects.create_user('outro', password='senha')
+        self.alheia = Categoria.objects.create(nome='Alheia', tipo='D', usuario=self.outro)
+
+    def opcoes(self, resposta, campo):
+        return [str(valor) for valor, _ in resposta.context['form'].fields[campo].choices if valor != '']
+
+    def test_segunda_renderizacao_nao_consulta_categorias_e_contas(self):
+        url = reverse('controle:nova_transacao')
+        with CaptureQueriesContext(connection) as primeira:
+            self.client.get(url)
+        with CaptureQueriesContext(connection) as segunda:
+            resposta = self.client.get(url)
+        tabelas = ('controle_categoria', 'controle_conta')
+        self.assertTrue(any(t in q['sql'] for q in primeira.captured_queries for t in tabelas))
+        self.assertFalse(any(t in q['sql'] for q in segunda.captured_queries for t in tabelas))
+        self.assertEqual(self.opcoes(resposta, 'categoria'), [str(self.despesa.pk), str(self.receita.pk)])
+        self.assertContains(resposta, 'Mercado (Despesa)')
+
+    def test_post_invalido_mostra_so_as_opcoes_do_usuario(self):
+        resposta = self.client.post(reverse('controle:nova_transacao'), {
+            'descricao': 'Teste', 'valor': '10.00', 'data': date.today().isoformat(),
+            'categoria': self.alheia.pk, 'conta': self.conta.pk,
+        })
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn('categoria', resposta.context['form'].errors)
+        self.assertNotIn(str(self.alheia.pk), self.opcoes(resposta, 'categoria'))
+        self.assertNotContains(resposta, 'Alheia')
+
+        transacao = Transacao.objects.filter(usuario=self.usuario).first()
+        resposta = self.client.post(reverse('controle:editar_transacao', args=[transacao.pk]), {
+            'descricao': '', 'valor': '10.00', 'data': transacao.data.isoformat(),
+            'categoria': self.receita.pk, 'conta': self.conta.pk,
+        })
+        self.assertEqual(self.opcoes(resposta, 'conta'), [str(self.conta.pk)])
+        self.assertContains(resposta, f'<option value="{self.receita.pk}" selected>')
+
+    def test_escritas_invalidam_as_opcoes(self):
+        url = reverse('controle:nova_transacao')
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            nova = Categoria.objects.create(nome='Lazer', tipo='D', usuario=self.usuario)
+        self.assertIn(str(nova.pk), self.opcoes(self.client.get(url), 'categoria'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.conta.nome = 'Conta Principal'
+            self.conta.save()
+        self.assertContains(self.client.get(url), 'Conta Principal')
+
+        # O rótulo da conta traz o saldo, que acompanha transações avulsas e em lote
+        with self.captureOnCommitCallbacks(execute=True):
+            Transacao.objects.create(
+                descricao='Nova', valor=Decimal('1.00'), categoria=nova, conta=self.conta, usuario=self.usuario,
+            )
+        self.assertContains(self.client.get(url), str(Conta.objects.get(pk=self.conta.pk)))
+        with self.captureOnCommitCallbacks(execute=True):
+            lancamentos.inserir_em_lote([
+                Transacao(descricao='Lote', valor=Decimal('2.50'), data=date.today(), categoria=nova,
+                          conta=self.conta, usuario=self.usuario),
+            ])
+        self.assertContains(self.client.get(url), str(Conta.objects.get(pk=self.conta.pk)))
+        with CaptureQueriesContext(connection) as contexto:
+            self.client.get(url)
+        self.assertFalse(any('controle_categoria' in q['sql'] for q in contexto.captured_queries))
+
+    def test_formulario_apos_lancamento_consulta_so_as_contas(self):
+        url = reverse('controle:nova_transacao')
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.post(url, {
+                'descricao': 'Rápida', 'valor': '3.00', 'data': date.today().isoformat(),
+                'categoria': self.despesa.pk, 'conta': self.conta.pk,
+            })
+        self.assertEqual(resposta.status_code, 302)
+        with CaptureQueriesContext(connection) as contexto:
+            resposta = self.client.get(url)
+        sql = [q['sql'] for q in contexto.captured_queries]
+        # As categorias continuam no cache; as contas vêm com o saldo novo
+        self.assertEqual(len([q for q in sql if 'FROM "controle_categoria"' in q]), 0)
+        self.assertEqual(len([q for q in sql if 'FROM "controle_conta"' in q]), 1)
+        self.assertContains(resposta, str(Conta.objects.get(pk=self.conta.pk)))
+
+
+class ImportacaoTests(TestCase):
+    CSV = (
+        'Data;Histórico;Valor;Categoria\n'
+        '05/03/2024;Supermercado;-1.234,56;Mercado\n'
+        '06/03/2024;Salário;5.000,00;\n'
+        '06/03/2024;Padaria;-10,00;\n'
+        '06/03/2024;Padaria;-10,00;\n'
+    )
+    OFX = (
+        'OFXHEADER:100\nDATA:OFXSGML\nCHARSET:1252\n\n<OFX><BANKTRANLIST>'
+        '<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20240310120000<TRNAMT>-45.90<FITID>A1<MEMO>Farmácia</STMTTRN>'
+        '<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20240311<TRNAMT>100.00<FITID>A2<NAME>Pix recebido</STMTTRN>'
+        '</BANKTRANLIST></OFX>'
+    )
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user('importa', password='senha')
+        self.mercado = Categoria.objects.create(nome='Mercado', tipo='D', usuario=self.usuario)
+        self.outras = Categoria.objects.create(nome='Outras', tipo='D', usuario=self.usuario)
+        self.receita = Categoria.objects.create(nome='Salário', tipo='R', usuario=self.usuario)
+        self.conta = Conta.objects.create(nome='Corrente', usuario=self.usuario)
+        self.padrao = {'conta': self.conta, 'categoria_receita': self.receita, 'categoria_despesa': self.outras}
+
+    def importar(self, conteudo, formato, encoding='utf-8-sig', **opcoes):
+        with self.captureOnCommitCallbacks(execute=True):
+            return importacao.importar_arquivo(
+                self.usuario, BytesIO(conteudo.encode(encoding)), formato, **{**self.padrao, **opcoes},
+            )
+
+    def saldo(self):
+        return Conta.objects.get(pk=self.conta.pk).saldo
+
+    def test_csv_e_reimportacao_sem_duplicar(self):
+        resultado = self.importar(self.CSV, 'csv')
+        self.assertEqual(
+            {chave: resultado[chave] for chave in ('lidas', 'importadas', 'duplicadas', 'com_erro')},
+            {'lidas': 4, 'importadas': 4, 'duplicadas': 0, 'com_erro': 0},
+        )
+        supermercado = Transacao.objects.get(descricao='Supermercado')
+        self.assertEqual((supermercado.valor, supermercado.data, supermercado.categoria), (Decimal('1234.56'), date(2024, 3, 5), self.mercado))
+        # Sem categoria na linha, vale a padrão do sinal do valor
+        self.assertEqual(Transacao.objects.get(descricao='Salário').categoria, self.receita)
+        self.assertEqual(Transacao.objects.filter(descricao='Padaria', categoria=self.outras).count(), 2)
+        self.assertEqual(self.saldo(), Decimal('3745.44'))
+
+        resultado = self.importar(self.CSV, 'csv')
+        self.assertEqual((resultado['importadas'], resultado['duplicadas']), (0, 4))
+        self.assertEqual(Transacao.objects.count(), 4)
+        self.assertEqual(self.saldo(), Decimal('3745.44'))
+
+    def test_ofx_usa_o_fitid(self):
+        resultado = self.importar(self.OFX, 'ofx', encoding='cp1252')
+        self.assertEqual((resultado['importadas'], resultado['com_erro']), (2, 0))
+        farmacia = Transacao.objects.get(valor=Decimal('45.90'))
+        self.assertEqual((farmacia.descricao, farmacia.data, farmacia.categoria), ('Farmácia', date(2024, 3, 10), self.outras))
+        self.assertEqual(Transacao.objects.get(valor=100).descricao, 'Pix recebido')
+
+        # O mesmo FITID com outra descrição continua sendo a mesma transação
+        resultado = self.importar(self.OFX.replace('Farmácia', 'Drogaria'), 'ofx', encoding='cp1252')
+        self.assertEqual((resultado['importadas'], resultado['duplicadas']), (0, 2))
+        self.assertEqual(self.saldo(), Decimal('54.10'))
+
+    def test_saldos_e_resumos_atualizados_por_lote(self):
+        linhas = ''.join(f'2024-03-{dia:02d},Compra {dia},-10.00\n' for dia in range(1, 6))
+        with CaptureQueriesContext(connection) as contexto:
+            resultado = self.importar('data,descricao,valor\n' + linhas, 'csv', tamanho_lote=2)
+        self.assertEqual(resultado['importadas'], 5)
+        sql = [q['sql'] for q in contexto.captured_queries]
+        # Um INSERT e um UPDATE da conta por lote de duas linhas, não por linha
+        self.assertEqual(len([q for q in sql if q.startswith('INSERT INTO "controle_transacao"')]), 3)
+        self.assertEqual(len([q for q in sql if q.startswith('UPDATE "controle_conta"')]), 3)
+        self.assertEqual(self.saldo(), Decimal('-50.00'))
+        self.assertEqual(resumos.totais_mes(self.usuario, 2024, 3), (Decimal('0'), Decimal('50.00')))
+        self.assertEqual(SaldoMensalConta.objects.get(conta=self.conta, ano=2024, mes=3).acumulado, Decimal('-50.00'))
+
+    def test_linhas_com_erro_sao_relatadas(self):
+        resultado = self.importar(
+            'data,descricao,valor\n'
+            '2024-03-01,Válida,-10.00\n'
+            '2024-03-02,Sem número,NaN\n'
+            '2024-03-03,Infinito,-Infinity\n'
+            '31/02/2024,Data ruim,-5.00\n'
+            '2024-03-04,Grande demais,100000000.00\n'
+            '2024-03-05,Zero,0\n',
+            'csv',
+        )
+        self.assertEqual((resultado['lidas'], resultado['importadas'], resultado['com_erro']), (6, 1, 5))
+        self.assertEqual([erro.split(':')[0] for erro in resultado['erros']], [f'Linha {n}' for n in range(3, 8)])
+        self.assertEqual(self.saldo(), Decimal('-10.00'))
+
+        with self.assertRaisesMessage(importacao.ErroLinha, 'Colunas obrigatórias ausentes: valor'):
+            self.importar('data,descricao\n2024-03-01,Sem valor\n', 'csv')
+        # Um erro do leitor de CSV vira erro de importação, não erro 500
+        with self.assertRaisesMessage(importacao.ErroLinha, 'Linha 2: CSV inválido'):
+            self.importar('data,descricao,valor\n2024-03-01,' + 'x' * 200000 + ',-1.00\n', 'csv')
+
+    def test_erro_de_leitura_depois_de_um_lote_relata_o_parcial(self):
+        conteudo = (
+            'data,descricao,valor\n' + ''.join(f'2024-03-0{dia},Compra {dia},-10.00\n' for dia in range(1, 4))
+            + '2024-03-05,' + 'x' * 200000 + ',-1.00\n2024-03-06,Depois,-1.00\n'
+        )
+        resultado = self.importar(conteudo, 'csv', tamanho_lote=2)
+        self.assertEqual((resultado['lidas'], resultado['importadas']), (3, 3))
+        self.assertIn('Linha 5: CSV inválido', resultado['interrompida'])
+        self.assertEqual(self.saldo(), Decimal('-30.00'))
+
+        self.client.force_login(self.usuario)
+        with self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.post(reverse('controle:importar_transacoes'), {
+                'arquivo': SimpleUploadedFile('extrato.csv', conteudo.encode()), 'conta': self.conta.pk,
+                'categoria_receita': self.receita.pk, 'categoria_despesa': self.outras.pk,
+            })
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn('Importação interrompida: Linha 5', resposta.context['form'].errors['arquivo'][0])
+        self.assertContains(resposta, '0 transações importadas, 3 duplicadas ignoradas')
+        self.assertEqual(self.saldo(), Decimal('-30.00'))
+
+    def test_importacao_simultanea_do_mesmo_arquivo(self):
+        conteudo = 'data,descricao,valor\n2024-03-01,Feira,-10.00\n2024-03-02,Padaria,-5.00\n'
+        inserir = lancamentos.inserir_em_lote
+        concorrente = []
+
+        def inserir_depois_de_outra_importacao(transacoes, **opcoes):
+            # Outra importação do mesmo arquivo termina entre a checagem de
+            # duplicatas e o INSERT deste lote
+            if not concorrente:
+                concorrente.append(None)
+                with mock.patch.object(importacao, 'inserir_em_lote', inserir):
+                    concorrente[0] = importacao.importar_arquivo(
+                        self.usuario, BytesIO(conteudo.encode()), 'csv', **self.padrao,
+                    )
+            return inserir(transacoes, **opcoes)
+
+        with mock.patch.object(importacao, 'inserir_em_lote', inserir_depois_de_outra_importacao):
+            resultado = self.importar(conteudo, 'csv')
+        self.assertEqual(concorrente[0]['importadas'], 2)
+        self.assertEqual((resultado['importadas'], resultado['duplicadas']), (0, 2))
+        self.assertEqual(Transacao.objects.count(), 2)
+        self.assertEqual(self.saldo(), Decimal('-15.00'))
+
+
+class ExportacaoTests(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('exporta', password='senha')
+        self.despesa = Categoria.objects.create(nome='Mercado', tipo='D', usuario=self.usuario)
+        self.receita = Categoria.objects.create(nome='Salário', tipo='R', usuario=self.usuario)
+        self.conta = Conta.objects.create(nome='Corrente', usuario=self.usuario)
+        self.criar('Feira', '30.00', self.despesa, date(2024, 3, 2), observacao='=HYPERLINK("http://x")')
+        self.criar('+55 pix', '1500.00', self.receita, date(2024, 3, 1))
+        self.criar('Padaria', '5.50', self.despesa, date(2024, 2, 20))
+        alheio = User.objects.create_user('alheio', password='senha')
+        self.criar(
+            'Alheia', '99.00', Categoria.objects.create(nome='Outra', tipo='D', usuario=alheio), date(2024, 3, 3),
+            conta=Conta.objects.create(nome='Outra', usuario=alheio), usuario=alheio,
+        )
+        self.client.force_login(self.usuario)
+
+    def criar(self, descricao, valor, categoria, data, conta=None, usuario=None, observacao=None):
+        Transacao.objects.create(
+            descricao=descricao, valor=Decimal(valor), data=data, categoria=categoria,
+            conta=conta or self.conta, usuario=usuario or self.usuario, observacao=observacao,
+        )
+
+    def exportar(self, formato, **filtros):
+        resposta = self.client.get(reverse('controle:exportar_transacoes'), {'formato': formato, **filtros})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn(f'.{exportacao.FORMATOS[formato][1]}"', resposta['Content-Disposition'])
+        return b''.join(resposta.streaming_content)
+
+    def test_csv(self):
+        texto = self.exportar('csv').decode('utf-8')
+        self.assertTrue(texto.startswith('\ufeff'))
+        linhas = list(csv.reader(StringIO(texto[1:]), delimiter=';'))
+        self.assertEqual(linhas[0], list(exportacao.CABECALHO))
+        # Só as do usuário, das mais recentes para as mais antigas, com
+        # o texto que começaria uma fórmula neutralizado
+        self.assertEqual(linhas[1:], [
+            ['02/03/2024', 'Feira', '30,00', 'D', 'Mercado', 'Corrente', '\'=HYPERLINK("http://x")'],
+            ['01/03/2024', "'+55 pix", '1500,00', 'R', 'Salário', 'Corrente', ''],
+            ['20/02/2024', 'Padaria', '5,50', 'D', 'Mercado', 'Corrente', ''],
+        ])
+
+    def test_jsonl_respeita_os_filtros(self):
+        linhas = [json.loads(linha) for linha in self.exportar('jsonl', tipo='D', data_inicio='2024-03-01').decode().splitlines()]
+        self.assertEqual(linhas, [{
+            'data': '2024-03-02', 'descricao': 'Feira', 'valor': '30.00', 'tipo': 'D',
+            'categoria': 'Mercado', 'conta': 'Corrente', 'observacao': '=HYPERLINK("http://x")',
+        }])
+
+    def test_xlsx(self):
+        with zipfile.ZipFile(BytesIO(self.exportar('xlsx', categoria=self.despesa.pk))) as arquivo:
+            self.assertIsNone(arquivo.testzip())
+            self.assertIn('xl/workbook.xml', arquivo.namelist())
+            planilha = arquivo.read('xl/worksheets/sheet1.xml').decode()
+        linhas = re.findall('<row>(.*?)</row>', planilha)
+        self.assertEqual(len(linhas), 3)
+        textos = [re.findall('<t xml:space="preserve">(.*?)</t>', linha) for linha in linhas[1:]]
+        self.assertEqual(textos, [
+            ['Feira', 'D', 'Mercado', 'Corrente', '\'=HYPERLINK("http://x")'],
+            ['Padaria', 'D', 'Mercado', 'Corrente', ''],
+        ])
+        # Data como número de série do Excel e valor numérico
+        self.assertIn(f'<c s="1"><v>{(date(2024, 3, 2) - date(1899, 12, 30)).days}</v></c>', linhas[1])
+        self.assertIn('<c s="2"><v>30.00</v></c>', linhas[1])
+
+
+class AdminSomenteLeituraTests(DadosBasicosMixin, TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='senha'))
+
+    def assertSomenteLeitura(self, modelo):
+        nome = f'admin:controle_{modelo._meta.model_name}'
+        objeto = modelo.objects.first()
+        self.assertEqual(self.client.get(reverse(f'{nome}_changelist')).status_code, 200)
+        resposta = self.client.get(reverse(f'{nome}_change', args=[objeto.pk]))
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotContains(resposta, 'name="_save"')
+        self.assertEqual(self.client.post(reverse(f'{nome}_change', args=[objeto.pk]), {}).status_code, 403)
+        self.assertEqual(self.client.get(reverse(f'{nome}_add')).status_code, 403)
+        self.assertEqual(self.client.get(reverse(f'{nome}_delete', args=[objeto.pk])).status_code, 403)
+        self.assertTrue(modelo.objects.filter(pk=objeto.pk).exists())
+
+    def test_resumos_mensais(self):
+        self.assertSomenteLeitura(ResumoMensalCategoria)
+
+    def test_saldos_mensais(self):
+        self.assertSomenteLeitura(SaldoMensalConta)
+
+
+class ListaTransacoesTests(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('lista', password='senha')
+        self.despesa = Categoria.objects.create(nome='Mercado', tipo='D', usuario=self.usuario)
+        self.receita = Categoria.objects.create(nome='Salário', tipo='R', usuario=self.usuario)
+        self.conta = Conta.objects.create(nome='Corrente', usuario=self.usuario)
+        # Sete transações no mesmo dia, para páginas que cortam o empate
+        datas = [date(2024, 3, 1)] * 3 + [date(2024, 3, 5)] * 7 + [date(2024, 3, 9)] * 2
+        for i, data in enumerate(datas):
+            Transacao.objects.create(
+                descricao=f'Item {i}', valor=Decimal('10.00'), data=data,
+                categoria=self.receita if i % 3 == 0 else self.despesa, conta=self.conta, usuario=self.usuario,
+            )
+        self.ordem = list(Transacao.objects.order_by('-data', '-id').values_list('pk', flat=True))
+        self.client.force_login(self.usuario)
+
+    def test_avanca_e_volta_pelas_paginas(self):
+        paginas = [paginacao.paginar(Transacao.objects.all(), tamanho=5)]
+        while paginas[-1]['cursor_proximo']:
+            paginas.append(paginacao.paginar(Transacao.objects.all(), depois=paginas[-1]['cursor_proximo'], tamanho=5))
+        self.assertEqual([t.pk for pagina in paginas for t in pagina['itens']], self.ordem)
+        self.assertEqual([len(pagina['itens']) for pagina in paginas], [5, 5, 2])
+        self.assertIsNone(paginas[0]['cursor_anterior'])
+
+        # Voltar a partir de cada página devolve exatamente a anterior
+        for anterior, pagina in zip(paginas, paginas[1:]):
+            voltou = paginacao.paginar(Transacao.objects.all(), antes=pagina['cursor_anterior'], tamanho=5)
+            self.assertEqual([t.pk for t in voltou['itens']], [t.pk for t in anterior['itens']])
+            self.assertEqual(voltou['cursor_proximo'], anterior['cursor_proximo'])
+        self.assertIsNone(paginacao.paginar(Transacao.objects.all(), antes=paginas[1]['cursor_anterior'], tamanho=5)['cursor_anterior'])
+
+    def test_cursor_adulterado_volta_para_a_primeira_pagina(self):
+        url = reverse('controle:lista_transacoes')
+        primeira = [t.pk for t in self.client.get(url).context['transacoes']]
+        self.assertEqual(primeira, self.ordem)
+        for cursor in ('xyz', 'é', base64.urlsafe_b64encode(b'2024-03-05|x').decode(),
+                       base64.urlsafe_b64encode(b'\xff\xfe').decode(), base64.urlsafe_b64encode(b'ontem|1').decode()):
+            self.assertIsNone(paginacao.decodificar_cursor(cursor))
+            resposta = self.client.get(url, {'depois': cursor})
+            self.assertEqual(resposta.status_code, 200)
+            self.assertEqual([t.pk for t in resposta.context['transacoes']], primeira)
+
+    def test_filtro_invalido_nao_descarta_os_validos(self):
+        resposta = self.client.get(reverse('controle:lista_transacoes'), {'tipo': 'D', 'data_inicio': 'amanhã'})
+        transacoes = resposta.context['transacoes']
+        self.assertEqual(len(transacoes), 8)
+        self.assertTrue(all(t.categoria.tipo == 'D' for t in transacoes))
+        self.assertIn('data_inicio', resposta.context['filtro'].errors)
+
+
+class LancamentoLoteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user('lote', password='senha')
+        self.despesa = Categoria.objects.create(nome='Mercado', tipo='D', usuario=self.usuario)
+        self.receita = Categoria.objects.create(nome='Salário', tipo='R', usuario=self.usuario)
+        self.corrente = Conta.objects.create(nome='Corrente', saldo=100, saldo_inicial=100, usuario=self.usuario)
+        self.carteira = Conta.objects.create(nome='Carteira', usuario=self.usuario)
+        self.hoje = timezone.localdate()
+        self.client.force_login(self.usuario)
+
+    def saldos(self):
+        return [Conta.objects.get(pk=conta.pk).saldo for conta in (self.corrente, self.carteira)]
+
+    def linhas(self, *linhas, extra=0):
+        dados = {'form-TOTAL_FORMS': len(linhas) + extra, 'form-INITIAL_FORMS': 0}
+        for indice, (descricao, valor, categoria, conta) in enumerate(linhas):
+            dados.update({
+                f'form-{indice}-descricao': descricao, f'form-{indice}-valor': valor,
+                f'form-{indice}-data': self.hoje.isoformat(),
+                f'form-{indice}-categoria': categoria.pk, f'form-{indice}-conta': conta.pk,
+            })
+        for indice in range(len(linhas), len(linhas) + extra):
+            # Como o navegador envia as linhas em branco: a data e a inicial oculta
+            dados[f'form-{indice}-data'] = dados[f'initial-form-{indice}-data'] = self.hoje.isoformat()
+        return dados
+
+    def test_pagina_grava_o_lote_com_um_update_por_conta(self):
+        url = reverse('controle:lancar_em_lote')
+        self.assertEqual(len(self.client.get(url).context['formset'].forms), 5)
+        dados = self.linhas(
+            ('Feira', '30.00', self.despesa, self.corrente),
+            ('Padaria', '5.50', self.despesa, self.carteira),
+            ('Freela', '200.00', self.receita, self.corrente),
+            ('Café', '4.50', self.despesa, self.carteira),
+            extra=2,
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as contexto:
+                resposta = self.client.post(url, dados)
+        # Lidas antes do assertRedirects, cuja requisição limpa o log de consultas
+        sql = [q['sql'] for q in contexto.captured_queries]
+        self.assertRedirects(resposta, url)
+        self.assertEqual(Transacao.objects.filter(usuario=self.usuario).count(), 4)
+        self.assertEqual(self.saldos(), [Decimal('270.00'), Decimal('-10.00')])
+        self.assertEqual(len([q for q in sql if q.startswith('UPDATE "controle_conta"')]), 2)
+        self.assertEqual(len([q for q in sql if q.startswith('INSERT INTO "controle_transacao"')]), 1)
+        # Categorias e contas lidas uma vez para o lote, não uma por linha
+        self.assertEqual(len([q for q in sql if 'FROM "controle_categoria"' in q]), 1)
+        self.assertEqual(len([q for q in sql if 'FROM "controle_conta"' in q]), 1)
+
+        # Resumos, saldos mensais e dashboard acompanham o lote
+        self.assertEqual(resumos.totais_mes(self.usuario, self.hoje.year, self.hoje.month), (Decimal('200.00'), Decimal('40.00')))
+        self.assertEqual(SaldoMensalConta.objects.get(conta=self.carteira).acumulado, Decimal('-10.00'))
+        self.assertEqual(self.client.get(reverse('controle:dashboard')).context['saldo_total'], Decimal('260.00'))
+
+    def test_linha_invalida_nao_grava_nada(self):
+        alheia = Conta.objects.create(nome='Alheia', usuario=User.objects.create_user('alheio', password='senha'))
+        resposta = self.client.post(reverse('controle:lancar_em_lote'), self.linhas(
+            ('Feira', '30.00', self.despesa, self.corrente),
+            ('Padaria', 'x', self.despesa, self.carteira),
+            ('Café', '4.50', self.despesa, alheia),
+        ))
+        self.assertEqual(resposta.status_code, 200)
+        formset = resposta.context['formset']
+        self.assertEqual([list(form.errors) for form in formset.forms], [[], ['valor'], ['conta']])
+        self.assertFalse(Transacao.objects.exists())
+        self.assertEqual(self.saldos(), [Decimal('100.00'), Decimal('0.00')])
+
+        resposta = self.client.post(reverse('controle:lancar_em_lote'), self.linhas(extra=3))
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(resposta.context['formset'].non_form_errors())
+
+    def test_editar_transacao_criada_em_lote(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            transacao, = lancamentos.inserir_em_lote([Transacao(
+                descricao='Feira', valor=10, data=self.hoje, categoria=self.despesa,
+                conta=self.carteira, usuario=self.usuario,
+            )])
+        with self.captureOnCommitCallbacks(execute=True):
+            transacao.valor = Decimal('12.00')
+            transacao.save()
+        self.assertEqual(self.saldos()[1], Decimal('-12.00'))
+        self.assertEqual(resumos.totais_mes(self.usuario, self.hoje.year, self.hoje.month), (Decimal('0'), Decimal('12.00')))
+        self.assertEqual(SaldoMensalConta.objects.get(conta=self.carteira).acumulado, Decimal('-12.00'))
+
+    def test_endpoint_ajax(self):
+        url = reverse('controle:ajax_lancar_transacoes')
+        xhr = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+        itens = [
+            {'descricao': 'Feira', 'valor': 30, 'data': self.hoje.isoformat(),
+             'categoria': self.despesa.pk, 'conta': self.corrente.pk},
+            {'descricao': 'Padaria', 'valor': '5.50', 'data': self.hoje.isoformat(),
+             'categoria': self.despesa.pk, 'conta': self.carteira.pk, 'observacao': 'Pão'},
+        ]
+        resposta = self.client.post(url, {'transacoes': itens}, content_type='application/json', **xhr)
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual(len(resposta.json()['transacoes']), 2)
+        self.assertEqual(self.saldos(), [Decimal('70.00'), Decimal('-5.50')])
+
+        # Linhas vazias contam como erro e nada do lote é gravado
+        resposta = self.client.post(url, {'transacoes': [itens[0], {}, {**itens[1], 'categoria': 0}]},
+                                    content_type='application/json', **xhr)
+        self.assertEqual(resposta.status_code, 400)
+        erros = resposta.json()['erros']
+        self.assertEqual([erro['indice'] for erro in erros], [1, 2])
+        self.assertEqual(list(erros[1]['erros']), ['categoria'])
+        self.assertEqual(Transacao.objects.count(), 2)
+
+        self.assertEqual(self.client.post(url, 'x', content_type='application/json', **xhr).status_code, 400)
+        self.assertEqual(self.client.post(url, {'transacoes': []}, content_type='application/json', **xhr).status_code, 400)
+        self.assertFalse(self.client.post(url, {'transacoes': itens}, content_type='application/json').json()['success'])
+
+
+class TransferenciaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user('transfere', password='senha')
+        self.despesa = Categoria.objects.create(nome='Mercado', tipo='D', usuario=self.usuario)
+        self.corrente = Conta.objects.create(nome='Corrente', saldo=500, saldo_inicial=500, usuario=self.usuario)
+        self.poupanca = Conta.objects.create(nome='Poupança', usuario=self.usuario)
+        self.hoje = date.today()
+        Transacao.objects.create(
+            descricao='Feira', valor=Decimal('40.00'), data=self.hoje,
+            categoria=self.despesa, conta=self.corrente, usuario=self.usuario,
+        )
+        self.client.force_login(self.usuario)
+
+    def saldos(self):
+        return [Conta.objects.get(pk=conta.pk).saldo for conta in (self.corrente, self.poupanca)]
+
+    def test_transferencias_fora_das_receitas_e_despesas_diarias(self):
+        antes = relatorios.serie_saldo(self.usuario, self.hoje, self.hoje)
+        transferencias.transferir(self.usuario, self.corrente, self.poupanca, Decimal('100.00'), self.hoje)
+        serie = relatorios.serie_saldo(self.usuario, self.hoje, self.hoje)
+        self.assertEqual((serie['receitas'], serie['despesas']), ([0.0], [40.0]))
+        # As pernas se anulam no saldo
+        self.assertEqual(serie['saldos'], antes['saldos'])
+        dados = self.client.get(reverse('controle:serie_saldo_json'), {'periodo': 'mes', 'data': self.hoje.isoformat()}).json()
+        self.assertEqual(sum(dados['receitas']), 0)
+        self.assertEqual(sum(dados['despesas']), 40.0)
+
+    def test_transferir_move_saldos_sem_entrar_nos_relatorios(self):
+        transferencia = transferencias.transferir(self.usuario, self.corrente, self.poupanca, Decimal('100.00'))
+        self.assertEqual(self.saldos(), [Decimal('360.00'), Decimal('100.00')])
+        self.assertEqual(transferencia.pernas.count(), 2)
+
+        self.assertEqual(resumos.totais_mes(self.usuario, self.hoje.year, self.hoje.month), (0, Decimal('40.00')))
+        contexto = self.client.get(reverse('controle:dashboard')).context
+        self.assertEqual(contexto['receitas_mes'], 0)
+        self.assertEqual(contexto['despesas_mes'], Decimal('40.00'))
+        relatorio = self.client.get(reverse('controle:relatorio_mensal')).context
+        self.assertEqual(relatorio['total_despesas'], Decimal('40.00'))
+        self.assertEqual([c['categoria'] for c in relatorio['despesas_por_categoria']], ['Mercado'])
+
+        # O resumo reconstruído também deixa as pernas de fora
+        mantidos = list(ResumoMensalCategoria.objects.values_list('categoria_id', 'total'))
+        resumos.reconstruir(self.usuario)
+        self.assertEqual(list(ResumoMensalCategoria.objects.values_list('categoria_id', 'total')), mantidos)
+
+        # As pernas aparecem no extrato e na busca como qualquer transação
+        self.poupanca.refresh_from_db()
+        self.assertEqual(saldos.extrato(self.poupanca)['itens'][0].saldo, Decimal('100.00'))
+        self.assertEqual(len(busca.buscar(self.usuario, 'Transferência')), 2)
+
+    def test_falha_nas_pernas_desfaz_tudo(self):
+        with mock.patch.object(lancamentos, 'inserir_em_lote', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                transferencias.transferir(self.usuario, self.corrente, self.poupanca, Decimal('100.00'))
+        self.assertFalse(Transferencia.objects.exists())
+        self.assertEqual(self.saldos(), [Decimal('460.00'), Decimal('0.00')])
+
+    def test_validacao(self):
+        for origem, destino, valor in (
+            (self.corrente, self.corrente, '10.00'),
+            (self.corrente, self.poupanca, '0'),
+        ):
+            with self.assertRaises(transferencias.ErroTransferencia):
+                transferencias.transferir(self.usuario, origem, destino, Decimal(valor))
+        resposta = self.client.post(reverse('controle:nova_transferencia'), {
+            'origem': self.corrente.pk, 'destino': self.corrente.pk, 'valor': '10.00', 'data': self.hoje.isoformat(),
+        })
+        self.assertEqual(resposta.status_code, 200)
+        self.assertFalse(Transferencia.objects.exists())
+
+    def test_endpoint_em_lote(self):
+        url = reverse('controle:api_transferencias')
+        itens = [
+            {'origem': self.corrente.pk, 'destino': self.poupanca.pk, 'valor': '10.50', 'data': '2024-03-01'},
+            {'origem': self.poupanca.pk, 'destino': self.corrente.pk, 'valor': 2},
+            {'origem': self.corrente.pk, 'destino': self.poupanca.pk, 'valor': '30', 'descricao': 'Reserva'},
+        ]
+        with CaptureQueriesContext(connection) as contexto:
+            resposta = self.client.post(url, {'transferencias': itens}, content_type='application/json')
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual(len(resposta.json()['transferencias']), 3)
+        self.assertEqual(self.saldos(), [Decimal('421.50'), Decimal('38.50')])
+        # Uma atualização de saldo por conta, não por transferência
+        atualizacoes = [q for q in contexto.captured_queries if q['sql'].startswith('UPDATE "controle_conta"')]
+        self.assertEqual(len(atualizacoes), 2)
+
+        outro = Conta.objects.create(nome='Alheia', usuario=User.objects.create_user('alheio', password='senha'))
+        resposta = self.client.post(url, {'transferencias': [
+            {'origem': self.corrente.pk, 'destino': self.poupanca.pk, 'valor': '1.00'},
+            {'origem': self.corrente.pk, 'destino': outro.pk, 'valor': '1.00'},
+            {'origem': self.corrente.pk, 'destino': self.poupanca.pk, 'valor': 'x'},
+        ]}, content_type='application/json')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual([erro['indice'] for erro in resposta.json()['erros']], [1, 2])
+        self.assertEqual(Transferencia.objects.count(), 3)
+        self.assertEqual(self.client.post(url, 'x', content_type='application/json').status_code, 400)
+
+    def test_exclusao_desfaz_as_duas_pernas(self):
+        transferencia = transferencias.transferir(self.usuario, self.corrente, self.poupanca, Decimal('100.00'))
+        perna = transferencia.pernas.first()
+        resposta = self.client.get(reverse('controle:editar_transacao', args=[perna.pk]))
+        self.assertRedirects(resposta, reverse('controle:lista_transferencias'))
+        resposta = self.client.post(reverse('controle:excluir_transacao', args=[perna.pk]))
+        self.assertRedirects(resposta, reverse('controle:excluir_transferencia', args=[transferencia.pk]))
+
+        self.client.post(reverse('controle:excluir_transferencia', args=[transferencia.pk]))
+        self.assertFalse(Transacao.objects.filter(transferencia__isnull=False).exists())
+        self.assertEqual(self.saldos(), [Decimal('460.00'), Decimal('0.00')])
+        self.assertEqual(SaldoMensalConta.objects.get(conta=self.poupanca).acumulado, 0)
+
+    def test_categorias_internas_ficam_ocultas(self):
+        transferencias.transferir(self.usuario, self.corrente, self.poupanca, Decimal('1.00'))
+        resposta = self.client.get(reverse('controle:lista_categorias'))
+        self.assertEqual(list(resposta.context['categorias']), [self.despesa])
+        resposta = self.client.get(reverse('controle:nova_transacao'))
+        self.assertEqual(list(resposta.context['form'].fields['categoria'].queryset), [self.despesa])
+        # Uma segunda transferência reaproveita as mesmas categorias
+        transferencias.transferir(self.usuario, self.poupanca, self.corrente, Decimal('1.00'))
+        self.assertEqual(Categoria.objects.filter(usuario=self.usuario, transferencia=True).count(), 2)
+
+
+class ArquivamentoTests(TestCase):
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        configuracao = override_settings(ARQUIVO_TRANSACOES_DIR=diretorio.name, ARQUIVO_TRANSACOES_ANOS=2)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        cache.clear()
+
+        self.usuario = User.objects.create_user('arquiva', password='senha')
+        self.despesa = Categoria.objects.create(nome='Mercado', tipo='D', usuario=self.usuario)
+        self.receita = Categoria.objects.create(nome='Salário', tipo='R', usuario=self.usuario)
+        self.corrente = Conta.objects.create(nome='Corrente', saldo=100, saldo_inicial=100, usuario=self.usuario)
+        self.poupanca = Conta.objects.create(nome='Poupança', usuario=self.usuario)
+        self.hoje = timezone.localdate()
+        self.antigo = self.hoje.year - 4
+        for ano in (self.antigo, self.antigo + 1, self.hoje.year):
+            for mes in (1, 6, 11):
+                for categoria, conta, valor in (
+                    (self.receita, self.corrente, '300.00'),
+                    (self.despesa, self.corrente, '45.10'),
+                    (self.despesa, self.poupanca, '12.35'),
+                ):
+                    Transacao.objects.create(
+                        descricao=f'{categoria.nome} {mes}/{ano}', valor=Decimal(valor), data=date(ano, mes, 10),
+                        categoria=categoria, conta=conta, usuario=self.usuario, observacao='nota',
+                    )
+        # Pernas de transferência ficam na tabela
+        transferencias.transferir(self.usuario, self.corrente, self.poupanca, Decimal('50.00'), date(self.antigo, 3, 1))
+        self.client.force_login(self.usuario)
+
+    def estado(self):
+        return {
+            'saldos': list(Conta.objects.filter(usuario=self.usuario).order_by('pk').values_list('saldo', flat=True)),
+            'mensais': list(SaldoMensalConta.objects.filter(conta__usuario=self.usuario).order_by(
+                'conta', 'ano', 'mes').values_list('conta_id', 'ano', 'mes', 'movimento', 'acumulado')),
+            'resumos': list(ResumoMensalCategoria.objects.filter(usuario=self.usuario).order_by(
+                'categoria', 'ano', 'mes').values_list('categoria_id', 'ano', 'mes', 'total', 'quantidade')),
+            'anual': relatorios.relatorio_anual(self.usuario, self.antigo + 1)['resumo'],
+            'saldo_anterior': relatorios.saldo_anterior(self.usuario, date(self.hoje.year, 6, 15)),
+        }
+
+    def transacoes(self):
+        return list(Transacao.objects.filter(usuario=self.usuario).order_by('pk').values_list(
+            'pk', 'descricao', 'valor', 'data', 'categoria_id', 'conta_id', 'observacao', 'transferencia_id'))
+
+    def test_arquivar_mantem_saldos_e_relatorios(self):
+        antes, todas = self.estado(), self.transacoes()
+        resultado = arquivamento.arquivar()
+        self.assertEqual(resultado, {'anos': 2, 'transacoes': 18})
+        self.assertEqual(self.estado(), antes)
+
+        # Na tabela ficam o ano atual, os mantidos pelo horizonte e as pernas
+        restantes = Transacao.objects.filter(usuario=self.usuario)
+        self.assertFalse(restantes.filter(data__year=self.antigo + 1).exists())
+        self.assertEqual(restantes.filter(data__year=self.antigo).count(), 2)
+        self.assertEqual(arquivamento.anos_arquivados(self.usuario.pk), [self.antigo, self.antigo + 1])
+        self.assertEqual(len(arquivamento.ler(self.usuario.pk, self.antigo)), 9)
+        self.assertEqual(len(busca.buscar(self.usuario, 'Salário')), 3)
+
+        # Os recálculos somam os totais arquivados e chegam aos mesmos números
+        saldos.recalcular(Conta.objects.filter(usuario=self.usuario))
+        resumos.reconstruir(self.usuario)
+        self.assertEqual(self.estado(), antes)
+
+        # Rodar de novo não encontra nada a arquivar
+        self.assertEqual(arquivamento.arquivar(), {'anos': 0, 'transacoes': 0})
+
+        for ano in (self.antigo, self.antigo + 1):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(arquivamento.restaurar_ano(self.usuario.pk, ano), 9)
+            self.assertFalse(arquivamento.caminho(self.usuario.pk, ano).exists())
+        self.assertEqual(self.transacoes(), todas)
+        self.assertEqual(self.estado(), antes)
+        self.assertFalse(ResumoArquivado.objects.exists())
+        self.assertEqual(len(busca.buscar(self.usuario, 'Salário')), 9)
+
+    def test_saldos_conferem_com_o_recalculo_antes_e_depois(self):
+        def conferir():
+            atual = self.estado()
+            for conta in Conta.objects.filter(usuario=self.usuario):
+                self.assertEqual(conta.saldos_mensais.order_by('ano', 'mes').last().acumulado, conta.saldo - conta.saldo_inicial)
+            saldos.recalcular(Conta.objects.filter(usuario=self.usuario))
+            self.assertEqual(self.estado(), atual)
+            return atual
+
+        antes = conferir()
+        with CaptureQueriesContext(connection) as contexto:
+            arquivamento.arquivar()
+        self.assertEqual(len([q for q in contexto.captured_queries if q['sql'].startswith('DELETE FROM "controle_transacao"')]), 2)
+        self.assertEqual(conferir(), antes)
+        for ano in (self.antigo, self.antigo + 1):
+            arquivamento.restaurar_ano(self.usuario.pk, ano)
+        self.assertEqual(conferir(), antes)
+
+    def test_series_diarias_e_extrato_de_anos_arquivados(self):
+        inicio, fim = date(self.antigo, 1, 1), date(self.antigo + 1, 12, 31)
+        def consultar():
+            return {
+                'serie': relatorios.serie_saldo(self.usuario, inicio, fim),
+                # Começando no meio de um mês, depois das transações do dia 10
+                'serie_meio_do_mes': relatorios.serie_saldo(self.usuario, date(self.antigo + 1, 6, 20), fim),
+                'extrato': [
+                    (pagina['saldo_abertura'], pagina['saldo_fechamento'])
+                    for pagina in (
+                        saldos.extrato(conta, date(self.antigo, 6, 15), date(self.antigo, 11, 20))
+                        for conta in (self.corrente, self.poupanca)
+                    )
+                ],
+            }
+
+        antes = consultar()
+        self.assertTrue(any(antes['serie']['despesas']))
+        arquivamento.arquivar()
+        self.assertEqual(consultar(), antes)
+
+        # Lançada depois do arquivamento em um mês arquivado: o saldo corrido
+        # conta as arquivadas do mesmo mês, como depois de restaurar
+        with self.captureOnCommitCallbacks(execute=True):
+            atrasada = Transacao.objects.create(
+                descricao='Atrasada', valor=Decimal('7.00'), data=date(self.antigo, 6, 15),
+                categoria=self.despesa, conta=self.corrente, usuario=self.usuario,
+            )
+        def saldo_da_atrasada():
+            itens = saldos.extrato(self.corrente, date(self.antigo, 6, 1), date(self.antigo, 6, 30))['itens']
+            return next(t.saldo for t in itens if t.pk == atrasada.pk)
+        arquivado = saldo_da_atrasada()
+        with self.captureOnCommitCallbacks(execute=True):
+            arquivamento.restaurar_ano(self.usuario.pk, self.antigo)
+        self.assertEqual(saldo_da_atrasada(), arquivado)
+
+    def test_ano_arquivado_recebe_transacoes_novas(self):
+        arquivamento.arquivar()
+        with self.captureOnCommitCallbacks(execute=True):
+            Transacao.objects.create(
+                descricao='Atrasada', valor=Decimal('7.00'), data=date(self.antigo, 12, 31),
+                categoria=self.despesa, conta=self.poupanca, usuario=self.usuario,
+            )
+        antes = self.estado()
+        self.assertEqual(arquivamento.arquivar(), {'anos': 1, 'transacoes': 1})
+        self.assertEqual(len(arquivamento.ler(self.usuario.pk, self.antigo)), 10)
+        self.assertEqual(self.estado(), antes)
+        self.assertEqual(arquivamento.restaurar_ano(self.usuario.pk, self.antigo), 10)
+        self.assertEqual(self.estado(), antes)
+
+    def test_troca_de_tipo_e_exclusao_com_anos_arquivados(self):
+        arquivamento.arquivar()
+        self.despesa.tipo = 'R'
+        self.despesa.save()
+        esperado = self.estado()
+        saldos.recalcular(Conta.objects.filter(usuario=self.usuario))
+        self.assertEqual(self.estado(), esperado)
+
+        resposta = self.client.post(reverse('controle:excluir_categoria', args=[self.despesa.pk]), follow=True)
+        self.assertContains(resposta, 'restaure os anos arquivados')
+        self.assertTrue(Categoria.objects.filter(pk=self.despesa.pk).exists())
+        self.client.post(reverse('controle:excluir_conta', args=[self.poupanca.pk]))
+        self.assertTrue(Conta.objects.filter(pk=self.poupanca.pk).exists())
+
+    def test_arquivo_inconsistente_nao_restaura(self):
+        arquivamento.arquivar()
+        arquivamento.caminho(self.usuario.pk, self.antigo).unlink()
+        with self.assertRaises(arquivamento.ErroArquivo):
+            arquivamento.restaurar_ano(self.usuario.pk, self.antigo)
+        self.assertTrue(ResumoArquivado.objects.filter(ano=self.antigo).exists())
+
+    def test_comando(self):
+        saida = StringIO()
+        call_command('arquivar_transacoes', '--anos', '3', stdout=saida)
+        self.assertIn('9 transações de 1 anos arquivadas', saida.getvalue())
+        call_command('arquivar_transacoes', '--usuario', 'arquiva', '--restaurar', str(self.antigo), stdout=saida)
+        self.assertIn('9 transações', saida.getvalue())
+        self.assertFalse(ResumoArquivado.objects.exists())
+        with self.assertRaises(CommandError):
+            call_command('arquivar_transacoes', '--restaurar', str(self.antigo))
+
+
+class CacheDashboardTests(DadosBasicosMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.usuario)
+
+    def consultas_dashboard(self):
+        with CaptureQueriesContext(connection) as contexto:
+            resposta = self.client.get(reverse('controle:dashboard'))
+        return len(contexto.captured_queries), resposta.context
+
+    def test_segunda_visita_nao_consulta_o_banco(self):
+        primeira, _ = self.consultas_dashboard()
+        segunda, _ = self.consultas_dashboard()
+        # Restam apenas a sessão e o usuário
+        self.assertEqual(segunda, 2)
+        self.assertLess(segunda, primeira)
+
+    def test_transacao_invalida_o_mes_e_o_saldo(self):
+        _, antes = self.consultas_dashboard()
+        with self.captureOnCommitCallbacks(execute=True):
+            Transacao.objects.create(
+                descricao='Nova', valor=Decimal('7.00'), data=date.today(),
+                categoria=self.despesa, conta=self.conta, usuario=self.usuario,
+            )
+        _, depois = self.consultas_dashboard()
+        self.assertEqual(depois['despesas_mes'], antes['despesas_mes'] + Decimal('7.00'))
+        self.assertEqual(depois['saldo_total'], antes['saldo_total'] - Decimal('7.00'))
+
+    def test_categoria_invalida_todos_os_meses(self):
+        self.consultas_dashboard()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.despesa.nome = 'Supermercado'
+            self.despesa.save()
+        _, contexto = self.consultas_dashboard()
+        self.assertIn('Supermercado', contexto['dados_categorias']['labels'])
+
+    def test_recalculos_invalidam_o_dashboard(self):
+        _, antes = self.consultas_dashboard()
+        # Saldo inicial e transação gravados sem passar pelos sinais
+        hoje = date.today()
+        Conta.objects.filter(pk=self.conta.pk).update(saldo_inicial=Decimal('100.00'))
+        Transacao.objects.filter(pk=Transacao.objects.filter(
+            usuario=self.usuario, categoria=self.despesa, data__year=hoje.year, data__month=hoje.month,
+        ).first().pk).update(valor=Decimal('17.00'))
+        alterado_em = cache_dashboard.ultima_alteracao(self.usuario.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('recalcular_saldos', usuario='teste', stdout=StringIO())
+        _, depois = self.consultas_dashboard()
+        self.assertEqual(depois['saldo_total'], Conta.objects.get(pk=self.conta.pk).saldo)
+        self.assertNotEqual(depois['saldo_total'], antes['saldo_total'])
+        self.assertGreater(cache_dashboard.ultima_alteracao(self.usuario.pk), alterado_em)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('reconstruir_resumos', stdout=StringIO())
+        _, depois = self.consultas_dashboard()
+        self.assertEqual(
+            (depois['receitas_mes'], depois['despesas_mes']),
+            resumos.totais_mes(self.usuario, hoje.year, hoje.month),
+        )
+        self.assertNotEqual((depois['receitas_mes'], depois['despesas_mes']), (antes['receitas_mes'], antes['despesas_mes']))
+
+
+class ApiWidgetsTests(DadosBasicosMixin, TestCase):
+    URLS = ('api_resumo', 'api_categorias', 'api_evolucao_saldo', 'api_transacoes_recentes')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.usuario)
+
+    def test_respostas_e_validadores(self):
+        for nome in self.URLS:
+            resposta = self.client.get(reverse(f'controle:{nome}'))
+            self.assertEqual(resposta.status_code, 200, nome)
+            self.assertTrue(resposta.json()['success'])
+            self.assertIn('ETag', resposta)
+            self.assertIn('Last-Modified', resposta)
+
+    def test_get_condicional(self):
+        url = reverse('controle:api_resumo')
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as contexto:
+            resposta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 304)
+        self.assertFalse(any('controle_' in q['sql'] for q in contexto.captured_queries))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Transacao.objects.create(
+                descricao='Nova', valor=Decimal('7.00'), data=date.today(),
+                categoria=self.despesa, conta=self.conta, usuario=self.usuario,
+            )
+        resposta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta['ETag'], etag)
+
+    def test_etag_depende_dos_parametros(self):
+        url = reverse('controle:api_categorias')
+        etag = self.client.get(url)['ETag']
+        resposta = self.client.get(f'{url}?tipo=R', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+
+    def test_parametros_invalidos(self):
+        self.assertEqual(self.client.get(reverse('controle:api_resumo') + '?mes=13').status_code, 400)
+        self.assertEqual(self.client.get(reverse('controle:api_categorias') + '?tipo=X').status_code, 400)
+        self.assertEqual(self.client.get(reverse('controle:api_evolucao_saldo') + '?periodo=x').status_code, 400)
+        self.assertEqual(self.client.get(reverse('controle:api_evolucao_saldo') + '?data=ontem').json()['error'], 'Data inválida')
+
+    def test_endereco_antigo_da_serie_de_saldo(self):
+        parametros = {'periodo': 'trimestre', 'data': date.today().isoformat()}
+        api = self.client.get(reverse('controle:api_evolucao_saldo'), parametros).json()
+        self.assertEqual(self.client.get(reverse('controle:serie_saldo_json'), parametros).json(), api)
+        self.assertEqual(len(api['receitas']), len(api['datas']))
+        self.assertEqual(self.client.get(reverse('controle:serie_saldo_json'), {'periodo': 'x'}).status_code, 400)
+
+
+class RelatorioPeriodoTests(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('relatorio', password='senha')
+        self.receita = Categoria.objects.create(nome='Salário', tipo='R', usuario=self.usuario)
+        self.despesa = Categoria.objects.create(nome='Mercado', tipo='D', usuario=self.usuario)
+        self.conta = Conta.objects.create(nome='Corrente', usuario=self.usuario)
+        for ano, mes, valor, categoria in (
+            (2023, 12, '100.00', self.despesa),
+            (2024, 1, '50.00', self.despesa),
+            (2024, 1, '1000.00', self.receita),
+            (2024, 12, '150.00', self.despesa),
+            (2025, 1, '80.00', self.despesa),
+        ):
+            Transacao.objects.create(
+                descricao='Teste', valor=Decimal(valor), data=date(ano, mes, 10),
+                categoria=categoria, conta=self.conta, usuario=self.usuario,
+            )
+
+    def test_totais_e_variacoes(self):
+        totais = relatorios.totais_mensais(self.usuario, (2024, 12), (2025, 1))
+        self.assertEqual(totais['meses'], [(2024, 12), (2025, 1)])
+        self.assertEqual(totais['despesas'], [Decimal('150.00'), Decimal('80.00')])
+        self.assertEqual(totais['receitas'], [0, 0])
+
+        mensal = totais['variacao_mensal'][1]['despesas']
+        self.assertEqual(mensal['diferenca'], Decimal('-70.00'))
+        self.assertAlmostEqual(mensal['percentual'], -46.67, places=2)
+        anual = totais['variacao_anual'][1]['despesas']
+        self.assertEqual(anual['diferenca'], Decimal('30.00'))
+        self.assertIsNone(totais['variacao_anual'][0]['receitas']['percentual'])
+
+        self.assertEqual([c['nome'] for c in totais['categorias']], ['Mercado'])
+        self.assertEqual(totais['categorias'][0]['valores'], [Decimal('150.00'), Decimal('80.00')])
+
+    def test_consultas_constantes(self):
+        for inicio in ((2024, 1), (2022, 2)):
+            with self.assertNumQueries(1):
+                relatorios.totais_mensais(self.usuario, inicio, (2025, 1))
+
+    def test_relatorio_anual(self):
+        relatorio = relatorios.relatorio_anual(self.usuario, 2024)
+        self.assertEqual(relatorio['resumo']['despesas']['total'], Decimal('200.00'))
+        self.assertEqual(relatorio['resumo']['despesas']['anterior'], Decimal('100.00'))
+        self.assertEqual(relatorio['resumo']['despesas']['percentual'], 100.0)
+
+    def test_anos_disponiveis(self):
+        self.assertEqual(relatorios.anos_disponiveis(self.usuario, date(2026, 5, 1)), [2026, 2025, 2024, 2023])
+
+    def test_serie_saldo_diaria_confere_com_a_conta_a_mao(self):
+        carteira = Conta.objects.create(nome='Carteira', usuario=self.usuario)
+        for data, valor, categoria, conta in (
+            (date(2023, 12, 31), '20.00', self.despesa, self.conta),
+            (date(2024, 1, 5), '200.00', self.receita, self.conta),
+            (date(2024, 1, 10), '19.99', self.despesa, carteira),
+            (date(2024, 1, 12), '0.01', self.receita, self.conta),
+            (date(2024, 1, 12), '0.30', self.despesa, carteira),
+        ):
+            Transacao.objects.create(
+                descricao='Teste', valor=Decimal(valor), data=data,
+                categoria=categoria, conta=conta, usuario=self.usuario,
+            )
+        inicio, fim = date(2024, 1, 9), date(2024, 1, 12)
+
+        receitas, despesas = relatorios.totais_diarios(self.usuario, inicio, fim)
+        self.assertEqual(receitas.tolist(), [0, 100000, 0, 1])
+        self.assertEqual(despesas.tolist(), [0, 6999, 0, 30])
+
+        serie = relatorios.serie_saldo(self.usuario, inicio, fim)
+        # Antes do dia 9: -100,00 - 20,00 + 200,00
+        self.assertEqual(serie['saldo_inicial'], 80.0)
+        # Dia 10: +1000,00 - 50,00 - 19,99; dia 12: +0,01 - 0,30
+        self.assertEqual(serie['saldos'], [80.0, 1010.01, 1010.01, 1009.72])
+        self.assertEqual(serie['datas'], [date(2024, 1, d) for d in range(9, 13)])
+
+    def test_views(self):
+        self.client.force_login(self.usuario)
+        resposta = self.client.get(reverse('controle:relatorio_mensal') + '?ano=2024&mes=1')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn(2023, resposta.context['anos_disponiveis'])
+        self.assertEqual(resposta.context['total_receitas'], Decimal('1000.00'))
+
+        resposta = self.client.get(reverse('controle:relatorio_anual') + '?ano=2024')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(len(resposta.context['linhas']), 12)
+
+        resposta = self.client.get(reverse('controle:api_totais_mensais') + '?inicio=2022-02&fim=2025-01')
+        self.assertEqual(len(resposta.json()['meses']), 36)
+        self.assertEqual(self.client.get(reverse('controle:api_totais_mensais') + '?inicio=2025-02&fim=2025-01').status_code, 400)
+
+
+class OrcamentoConsultasMixin:
+    """
+    assertOrcamentoConsultas(url, maximo) falha quando a requisição faz
+    mais consultas que o orçamento, listando as mais lentas.
+    """
+    def assertOrcamentoConsultas(self, url, maximo):
+        with medir(consultas_lentas=maximo + 5) as medicao:
+            resposta = self.client.get(url)
+            if resposta.streaming:
+                b''.join(resposta.streaming_content)
+        self.assertLess(resposta.status_code, 400, url)
+        if medicao.consultas > maximo:
+            consultas = '\n'.join(sql for sql, _ in medicao.consultas_lentas)
+            self.fail(f'{url}: {medicao.consultas} consultas, orçamento de {maximo}\n{consultas}')
+        return resposta
+
+
+class OrcamentoViewsTests(OrcamentoConsultasMixin, DadosBasicosMixin, TestCase):
+    # Consultas por view com o cache vazio, incluindo sessão e usuário
+    ORCAMENTOS = {
+        # Inclui o consumo dos orçamentos, uma consulta para todas as categorias
+        'dashboard': 8,
+        'lista_transacoes': 5,
+        'lista_categorias': 3,
+        'lista_contas': 3,
+        'nova_transacao': 4,
+        'importar_transacoes': 5,
+        'exportar_transacoes': 3,
+        'relatorio_mensal': 6,
+        'relatorio_anual': 4,
+        'serie_saldo_json': 4,
+        'api_resumo': 6,
+        'api_categorias': 4,
+        'api_evolucao_saldo': 4,
+        'api_transacoes_recentes': 3,
+        'api_totais_mensais': 3,
+        'lista_recorrencias': 3,
+        'nova_recorrencia': 4,
+        'api_busca_transacoes': 3,
+        'lista_orcamentos': 4,
+        'novo_orcamento': 3,
+        'api_orcamentos': 4,
+    }
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def test_orcamentos(self):
+        for nome, maximo in self.ORCAMENTOS.items():
+            with self.subTest(view=nome):
+                cache.clear()
+                self.assertOrcamentoConsultas(reverse(f'controle:{nome}'), maximo)
+
+    def test_orcamento_nao_cresce_com_os_dados(self):
+        # Mais categorias e contas não podem gerar consultas por item
+        for i in range(10):
+            Categoria.objects.create(nome=f'Extra {i}', tipo='D', usuario=self.usuario)
+            Conta.objects.create(nome=f'Extra {i}', usuario=self.usuario)
+        for nome in ('dashboard', 'relatorio_mensal', 'relatorio_anual', 'nova_transacao'):
+            with self.subTest(view=nome):
+                cache.clear()
+                self.assertOrcamentoConsultas(reverse(f'controle:{nome}'), self.ORCAMENTOS[nome])
+
+    def test_server_timing(self):
+        resposta = self.client.get(reverse('controle:lista_transacoes'))
+        metricas = dict(
+            re.match(r'(\w+);dur=([\d.]+)', parte.strip()).groups()
+            for parte in resposta['Server-Timing'].split(',')
+        )
+        self.assertEqual(set(metricas), {'db', 'tpl', 'total'})
+        self.assertGreater(float(metricas['tpl']), 0)
+        self.assertIn('5 consultas', resposta['Server-Timing'])
+
+    def test_log_estruturado(self):
+        with self.assertLogs('controle.instrumentacao', level='INFO') as logs:
+            self.client.get(reverse('controle:lista_contas'))
+        dados = logs.records[0].instrumentacao
+        self.assertEqual(dados['view'], 'controle:lista_contas')
+        self.assertEqual(dados['consultas'], 3)
+        self.assertLessEqual(len(dados['consultas_lentas']), 3)
+
+
+class OrcamentoCategoriaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user('orcamento', password='senha')
+        self.receita = Categoria.objects.create(nome='Salário', tipo='R', usuario=self.usuario)
+        self.mercado = Categoria.objects.create(nome='Mercado', tipo='D', usuario=self.usuario)
+        self.lazer = Categoria.objects.create(nome='Lazer', tipo='D', usuario=self.usuario)
+        self.conta = Conta.objects.create(nome='Corrente', usuario=self.usuario)
+        self.hoje = date.today()
+        self.lancar(self.mercado, '85.00')
+        self.lancar(self.lazer, '20.00')
+        # Meses vizinhos não entram no consumo do mês
+        self.lancar(self.mercado, '500.00', self.hoje.replace(day=1) - timedelta(days=1))
+        self.client.force_login(self.usuario)
+
+    def lancar(self, categoria, valor, data=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Transacao.objects.create(
+                descricao='Teste', valor=Decimal(valor), data=data or self.hoje,
+                categoria=categoria, conta=self.conta, usuario=self.usuario,
+            )
+
+    def orcar(self, categoria, limite, alerta=80):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Orcamento.objects.create(categoria=categoria, limite=Decimal(limite), alerta=alerta, usuario=self.usuario)
+
+    def test_consumo_e_situacoes(self):
+        self.orcar(self.mercado, '100.00')
+        self.orcar(self.lazer, '50.00')
+        dados = orcamentos.consumo(self.usuario, self.hoje.year, self.hoje.month)
+        por_categoria = {item['categoria']: item for item in dados['orcamentos']}
+        self.assertEqual(por_categoria['Mercado']['gasto'], Decimal('85.00'))
+        self.assertEqual(por_categoria['Mercado']['restante'], Decimal('15.00'))
+        self.assertEqual(por_categoria['Mercado']['situacao'], 'alerta')
+        self.assertEqual(por_categoria['Lazer']['situacao'], 'ok')
+        self.assertEqual([item['categoria'] for item in dados['alertas_orcamento']], ['Mercado'])
+
+        self.lancar(self.mercado, '30.00')
+        dados = orcamentos.consumo(self.usuario, self.hoje.year, self.hoje.month)
+        self.assertEqual(dados['alertas_orcamento'][0]['situacao'], 'excedido')
+
+    def test_uma_consulta_para_qualquer_numero_de_categorias(self):
+        self.orcar(self.mercado, '100.00')
+        with self.assertNumQueries(1):
+            orcamentos.consumo(self.usuario, self.hoje.year, self.hoje.month)
+        for i in range(10):
+            self.orcar(Categoria.objects.create(nome=f'Extra {i}', tipo='D', usuario=self.usuario), '10.00')
+        with self.assertNumQueries(1):
+            dados = orcamentos.consumo(self.usuario, self.hoje.year, self.hoje.month)
+        self.assertEqual(len(dados['orcamentos']), 11)
+
+    def test_api_em_cache_e_invalidacao(self):
+        orcamento = self.orcar(self.mercado, '100.00')
+        url = reverse('controle:api_orcamentos')
+        self.assertEqual(Decimal(self.client.get(url).json()['orcamentos'][0]['gasto']), Decimal('85.00'))
+        with CaptureQueriesContext(connection) as contexto:
+            self.client.get(url)
+        self.assertFalse(any('controle_orcamento' in q['sql'] for q in contexto.captured_queries))
+
+        self.lancar(self.mercado, '5.00')
+        self.assertEqual(Decimal(self.client.get(url).json()['orcamentos'][0]['gasto']), Decimal('90.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            orcamento.limite = Decimal('80.00')
+            orcamento.save()
+        self.assertEqual(self.client.get(url).json()['alertas'][0]['situacao'], 'excedido')
+        self.assertEqual(self.client.get(url + '?mes=13').status_code, 400)
+
+    def test_alerta_no_dashboard(self):
+        self.orcar(self.mercado, '100.00')
+        resposta = self.client.get(reverse('controle:dashboard'))
+        self.assertContains(resposta, 'usou 85% do orçamento')
+
+    def test_formulario_so_oferece_despesas_sem_orcamento(self):
+        self.orcar(self.mercado, '100.00')
+        resposta = self.client.get(reverse('controle:novo_orcamento'))
+        self.assertEqual(list(resposta.context['form'].fields['categoria'].queryset), [self.lazer])
+
+        resposta = self.client.post(reverse('controle:novo_orcamento'), {
+            'categoria': self.lazer.pk, 'limite': '0', 'alerta': 80,
+        })
+        self.assertEqual(resposta.status_code, 200)
+        self.assertFalse(Orcamento.objects.filter(categoria=self.lazer).exists())
+        self.client.post(reverse('controle:novo_orcamento'), {
+            'categoria': self.lazer.pk, 'limite': '60.00', 'alerta': 90,
+        })
+        self.assertEqual(Orcamento.objects.get(categoria=self.lazer).usuario, self.usuario)
+
+
+class DadosSinteticosTests(TestCase):
+    def test_saldos_e_resumos_consistentes(self):
+        usuario = sinteticos.preparar_usuario('sintetico_teste', categorias=8, contas=2)
+        criadas = sinteticos.gerar_transacoes(usuario, 2500, dias=400, semente=1, tamanho_lote=1000)
+        self.assertEqual(criadas, 2500)
+        self.assertEqual(Transacao.objects.filter(usuario=usuario).count(), 2500)
+        self.assertGreater(Transacao.objects.filter(usuario=usuario, categoria__tipo='R').count(), 0)
+
+        saldos_gerados = dict(Conta.objects.filter(usuario=usuario).values_list('id', 'saldo'))
+        resumos_gerados = sorted(ResumoMensalCategoria.objects.filter(usuario=usuario).values_list(
+            'ano', 'mes', 'categoria_id', 'total', 'quantidade'))
+        call_command('recalcular_saldos', usuario=usuario.username, stdout=StringIO())
+        resumos.reconstruir(usuario)
+        self.assertEqual(dict(Conta.objects.filter(usuario=usuario).values_list('id', 'saldo')), saldos_gerados)
+        self.assertEqual(sorted(ResumoMensalCategoria.objects.filter(usuario=usuario).values_list(
+            'ano', 'mes', 'categoria_id', 'total', 'quantidade')), resumos_gerados)
+
+    def test_semente_reproduz_os_dados(self):
+        valores = []
+        for nome in ('a', 'b'):
+            usuario = sinteticos.preparar_usuario(nome)
+            sinteticos.gerar_transacoes(usuario, 50, semente=7, fim=date(2025, 6, 30))
+            valores.append(list(Transacao.objects.filter(usuario=usuario).order_by('id').values_list('valor', 'data')))
+        self.assertEqual(valores[0], valores[1])
+
+    def test_comando(self):
+        saida = StringIO()
+        call_command('gerar_dados_sinteticos', usuarios=2, transacoes=100, semente=3, stdout=saida)
+        self.assertEqual(Transacao.objects.filter(usuario__username__startswith='sintetico_').count(), 200)
+
+
+class BenchmarkTests(TestCase):
+    def test_executar_e_comparar(self):
+        resultado = benchmark.executar(tamanhos=[300], repeticoes=2, cenarios=['dashboard', 'nova_transacao_post'])
+        self.assertEqual([r['cenario'] for r in resultado['resultados']], ['dashboard', 'nova_transacao_post'])
+        for medida in resultado['resultados']:
+            self.assertGreater(medida['p95_ms'], 0)
+            self.assertGreaterEqual(medida['p95_ms'], medida['p50_ms'])
+            self.assertGreater(medida['consultas'], 0)
+            self.assertGreater(medida['pico_memoria_kib'], 0)
+        linhas = benchmark.comparar(resultado, resultado)
+        self.assertEqual(len(linhas), 2)
+        self.assertIn('+0.0%', linhas[0])
+
+
+class RecorrenciaTests(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('recorrente', password='senha')
+        self.receita = Categoria.objects.create(nome='Salário', tipo='R', usuario=self.usuario)
+        self.despesa = Categoria.objects.create(nome='Aluguel', tipo='D', usuario=self.usuario)
+        self.conta = Conta.objects.create(nome='Corrente', usuario=self.usuario)
+        self.poupanca = Conta.objects.create(nome='Poupança', usuario=self.usuario)
+
+    def criar(self, **campos):
+        dados = {
+            'descricao': 'Aluguel', 'valor': Decimal('1000.00'), 'categoria': self.despesa,
+            'conta': self.conta, 'data_inicio': date(2025, 1, 31), 'usuario': self.usuario,
+        }
+        dados.update(campos)
+        return Recorrencia.objects.create(**dados)
+
+    def test_materializar_atualiza_saldos_e_resumos(self):
+        self.criar()
+        self.criar(descricao='Salário', valor=Decimal('3000.00'), categoria=self.receita,
+                   conta=self.poupanca, frequencia='S', intervalo=2, data_inicio=date(2025, 1, 1))
+        resultado = recorrencias.materializar(ate=date(2025, 4, 30))
+        self.assertEqual(resultado, {'recorrencias': 2, 'transacoes': 4 + 9})
+
+        self.assertEqual(Conta.objects.get(pk=self.conta.pk).saldo, Decimal('-4000.00'))
+        self.assertEqual(Conta.objects.get(pk=self.poupanca.pk).saldo, Decimal('27000.00'))
+        resumo = ResumoMensalCategoria.objects.get(usuario=self.usuario, ano=2025, mes=2, categoria=self.despesa)
+        self.assertEqual((resumo.total, resumo.quantidade), (Decimal('1000.00'), 1))
+
+    def test_dia_do_mes_e_preservado(self):
+        recorrencia = self.criar()
+        recorrencias.materializar(ate=date(2025, 5, 31))
+        datas = list(Transacao.objects.filter(usuario=self.usuario).order_by('data').values_list('data', flat=True))
+        self.assertEqual(datas, [date(2025, 1, 31), date(2025, 2, 28), date(2025, 3, 31),
+                                 date(2025, 4, 30), date(2025, 5, 31)])
+        recorrencia.refresh_from_db()
+        self.assertEqual(recorrencia.proxima_data, date(2025, 6, 30))
+
+    def test_execucao_repetida_nao_duplica(self):
+        recorrencia = self.criar()
+        recorrencias.materializar(ate=date(2025, 3, 31))
+        # Simula uma execução interrompida depois de gravar as transações
+        Recorrencia.objects.filter(pk=recorrencia.pk).update(proxima_data=date(2025, 1, 31))
+        resultado = recorrencias.materializar(ate=date(2025, 3, 31))
+        self.assertEqual(resultado['transacoes'], 0)
+        self.assertEqual(Transacao.objects.filter(usuario=self.usuario).count(), 3)
+        self.assertEqual(Conta.objects.get(pk=self.conta.pk).saldo, Decimal('-3000.00'))
+        self.assertEqual(recorrencias.materializar(ate=date(2025, 3, 31)), {'recorrencias': 0, 'transacoes': 0})
+
+    def test_hoje_e_a_data_local(self):
+        self.criar(data_inicio=date(2025, 3, 31))
+        self.criar(descricao='Salário', categoria=self.receita, data_inicio=date(2025, 4, 1))
+        # 01h de 1º de abril em UTC ainda é 31 de março em São Paulo
+        agora = datetime(2025, 4, 1, 1, 0, tzinfo=dt_timezone.utc)
+        with mock.patch('django.utils.timezone.now', return_value=agora):
+            resultado = recorrencias.materializar()
+        self.assertEqual(resultado, {'recorrencias': 1, 'transacoes': 1})
+        self.assertEqual(list(Transacao.objects.values_list('data', flat=True)), [date(2025, 3, 31)])
+
+    def test_data_fim_desativa(self):
+        recorrencia = self.criar(frequencia='D', data_inicio=date(2025, 1, 1), data_fim=date(2025, 1, 10))
+        recorrencias.materializar(ate=date(2025, 2, 1))
+        recorrencia.refresh_from_db()
+        self.assertFalse(recorrencia.ativa)
+        self.assertEqual(Transacao.objects.filter(usuario=self.usuario).count(), 10)
+
+    def test_um_update_de_saldo_por_conta(self):
+        for i in range(20):
+            self.criar(descricao=f'Conta {i}', conta=self.conta if i % 2 else self.poupanca,
+                       frequencia='D', data_inicio=date(2025, 1, 1))
+        with CaptureQueriesContext(connection) as contexto:
+            recorrencias.materializar(ate=date(2025, 1, 31))
+        updates = [q['sql'] for q in contexto.captured_queries
+                   if q['sql'].startswith('UPDATE "controle_conta"')]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(Transacao.objects.filter(usuario=self.usuario).count(), 20 * 31)
+
+    def test_projecao_nao_grava(self):
+        hoje = date.today()
+        self.criar(data_inicio=hoje + timedelta(days=1))
+        serie = relatorios.serie_saldo(self.usuario, hoje, hoje + timedelta(days=40), projetar=True)
+        self.assertIn('projecao', serie)
+        self.assertLess(serie['projecao'][-1], serie['saldos'][-1])
+        self.assertFalse(Transacao.objects.filter(usuario=self.usuario).exists())
+        self.assertNotIn('projecao', relatorios.serie_saldo(self.usuario, hoje, hoje + timedelta(days=40)))
+
+    def test_views(self):
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.client.get(reverse('controle:lista_recorrencias')).status_code, 200)
+        resposta = self.client.post(reverse('controle:nova_recorrencia'), {
+            'descricao': 'Academia', 'valor': '99.90', 'categoria': self.despesa.pk, 'conta': self.conta.pk,
+            'frequencia': 'M', 'intervalo': 1, 'data_inicio': (date.today() - timedelta(days=1)).isoformat(),
+            'ativa': 'on',
+        })
+        self.assertRedirects(resposta, reverse('controle:lista_recorrencias'))
+        recorrencia = Recorrencia.objects.get(descricao='Academia')
+        # A ocorrência vencida é lançada na hora
+        self.assertEqual(Transacao.objects.filter(descricao='Academia').count(), 1)
+        self.assertGreater(recorrencia.proxima_data, date.today() - timedelta(days=1))
+        self.assertEqual(self.client.get(reverse('controle:editar_recorrencia', args=[recorrencia.pk])).status_code, 200)
+        self.client.post(reverse('controle:excluir_recorrencia', args=[recorrencia.pk]))
+        self.assertFalse(Recorrencia.objects.filter(pk=recorrencia.pk).exists())
+
+    def test_comando(self):
+        self.criar()
+        saida = StringIO()
+        call_command('materializar_recorrencias', data='2025-03-31', usuario='recorrente', stdout=saida)
+        self.assertIn('3 transações lançadas de 1 recorrências', saida.getvalue())
+
+
+class BuscaTests(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('busca', password='senha')
+        self.outro = User.objects.create_user('outro', password='senha')
+        self.categoria = Categoria.objects.create(nome='Saúde', tipo='D', usuario=self.usuario)
+        self.conta = Conta.objects.create(nome='Corrente', usuario=self.usuario)
+        self.farmacia = self.criar('Farmácia São João', observacao='remédio de pressão')
+        self.mercado = self.criar('Mercado Central')
+        self.mercado_farmacia = self.criar('Mercado', observacao='itens de farmácia')
+        categoria = Categoria.objects.create(nome='Saúde', tipo='D', usuario=self.outro)
+        conta = Conta.objects.create(nome='Corrente', usuario=self.outro)
+        Transacao.objects.create(descricao='Farmácia do outro', valor=Decimal('5.00'), data=date(2025, 1, 1),
+                                 categoria=categoria, conta=conta, usuario=self.outro)
+
+    def criar(self, descricao, observacao=None):
+        return Transacao.objects.create(descricao=descricao, observacao=observacao, valor=Decimal('10.00'),
+                                        data=date(2025, 1, 1), categoria=self.categoria, conta=self.conta,
+                                        usuario=self.usuario)
+
+    def encontrados(self, texto):
+        return set(busca.filtrar(Transacao.objects.filter(usuario=self.usuario), texto))
+
+    def test_prefixo_acentos_e_todas_as_palavras(self):
+        self.assertEqual(self.encontrados('farm'), {self.farmacia, self.mercado_farmacia})
+        self.assertEqual(self.encontrados('FARMACIA'), {self.farmacia, self.mercado_farmacia})
+        self.assertEqual(self.encontrados('merc farm'), {self.mercado_farmacia})
+        self.assertEqual(self.encontrados('remedio'), {self.farmacia})
+        self.assertEqual(self.encontrados('padaria'), set())
+        # Operadores e aspas são tratados como texto
+        self.assertEqual(self.encontrados('mercado OR "farmácia'), set())
+        self.assertEqual(self.encontrados('NOT'), set())
+        self.assertEqual(len(self.encontrados('  ')), 3)
+
+    def test_indice_acompanha_as_escritas(self):
+        self.mercado.descricao = 'Padaria'
+        self.mercado.save()
+        self.assertEqual(self.encontrados('padaria'), {self.mercado})
+        self.assertEqual(self.encontrados('central'), set())
+        self.farmacia.delete()
+        self.assertEqual(self.encontrados('farm'), {self.mercado_farmacia})
+        # Escritas em lote não disparam sinais, mas os triggers indexam
+        Transacao.objects.bulk_create([Transacao(
+            descricao='Farmácia em lote', valor=Decimal('1.00'), data=date(2025, 1, 2),
+            categoria=self.categoria, conta=self.conta, usuario=self.usuario,
+        )])
+        Transacao.objects.filter(pk=self.mercado_farmacia.pk).update(observacao='nada')
+        self.assertEqual({t.descricao for t in self.encontrados('farm')}, {'Farmácia em lote'})
+
+    def test_relevancia(self):
+        resultado = busca.buscar(self.usuario, 'farmacia')
+        self.assertEqual(resultado, [self.farmacia, self.mercado_farmacia])
+        self.assertGreater(resultado[0].relevancia, resultado[1].relevancia)
+        self.assertEqual(busca.buscar(self.usuario, '!!'), [])
+
+    def test_lista_admin_e_api(self):
+        self.client.force_login(self.usuario)
+        resposta = self.client.get(reverse('controle:lista_transacoes') + '?q=farm')
+        self.assertEqual(set(resposta.context['transacoes']), {self.farmacia, self.mercado_farmacia})
+
+        resposta = self.client.get(reverse('controle:api_busca_transacoes') + '?q=farm&limite=1')
+        self.assertEqual([t['id'] for t in resposta.json()['transacoes']], [self.farmacia.pk])
+        self.assertEqual(self.client.get(reverse('controle:api_busca_transacoes') + '?limite=x').status_code, 400)
+
+        self.client.force_login(User.objects.create_superuser('admin', password='senha'))
+        with CaptureQueriesContext(connection) as contexto:
+            resposta = self.client.get(reverse('admin:controle_transacao_changelist') + '?q=farm')
+        self.assertEqual(resposta.context['cl'].result_count, 3)
+        self.assertTrue(any(busca.TABELA_FTS in q['sql'] for q in contexto.captured_queries))
+
+
+class ConfiguracaoSqliteTests(TransactionTestCase):
+    def setUp(self):
+        if connection.vendor != 'sqlite' or connection.is_in_memory_db():
+            self.skipTest('Requer um banco SQLite em arquivo.')
+
+    def test_pragmas(self):
+        configuracao = carga.configuracao_atual()
+        self.assertEqual(configuracao['journal_mode'], 'wal')
+        self.assertEqual(configuracao['synchronous'], 1)
+        self.assertEqual(configuracao['busy_timeout'], settings.SQLITE_BUSY_TIMEOUT_MS)
+        self.assertEqual(configuracao['cache_size'], -settings.SQLITE_CACHE_SIZE_KIB)
+        self.assertEqual(configuracao['transaction_mode'], 'IMMEDIATE')
+
+    def test_carga_concorrente(self):
+        usuario = sinteticos.preparar_usuario('carga', categorias=4, contas=2)
+        sinteticos.gerar_transacoes(usuario, 500, semente=1)
+        resultado = carga.executar(usuario, leitores=2, escritores=2, segundos=1)
+        self.assertEqual(resultado['outros_erros'], [])
+        self.assertEqual(resultado['erros_lock'], 0)
+        self.assertGreater(resultado['leituras'], 0)
+        self.assertGreater(resultado['escritas'], 0)
+        self.assertEqual(Transacao.objects.filter(usuario=usuario).count(), 500 + resultado['escritas'])
+
+        saldos_apos_carga = dict(Conta.objects.filter(usuario=usuario).values_list('id', 'saldo'))
+        call_command('recalcular_saldos', usuario=usuario.username, stdout=StringIO())
+        self.assertEqual(dict(Conta.objects.filter(usuario=usuario).values_list('id', 'saldo')), saldos_apos_carga)
+
+
+# A réplica aponta para o próprio banco de testes: o que se verifica é
+# para qual alias o roteador manda cada leitura
+@override_settings(BANCO_REPLICA='default')
+class ReplicaLeituraTests(DadosBasicosMixin, TestCase):
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def leituras_na_replica(self, url):
+        """Quantas leituras da requisição o roteador mandou para a réplica."""
+        rotas = []
+        original = roteamento.RoteadorReplica.db_for_read
+
+        def espiao(roteador, model, **hints):
+            rotas.append(original(roteador, model, **hints))
+            return rotas[-1]
+
+        with mock.patch.object(roteamento.RoteadorReplica, 'db_for_read', espiao):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return rotas.count('default')
+
+    def test_roteador(self):
+        self.assertEqual(router.db_for_read(Transacao), 'default')
+        with roteamento.ler_da_replica():
+            with override_settings(BANCO_REPLICA='replica'):
+                self.assertEqual(router.db_for_read(Transacao), 'replica')
+                self.assertEqual(router.db_for_write(Transacao), 'default')
+                self.assertFalse(router.allow_migrate('replica', 'controle'))
+            with override_settings(BANCO_REPLICA=None):
+                self.assertEqual(router.db_for_read(Transacao), 'default')
+
+    def test_relatorios_e_listas_leem_da_replica(self):
+        for nome in ('dashboard', 'lista_transacoes', 'relatorio_mensal', 'api_resumo',
+                     'dashboard_async', 'relatorio_mensal_async'):
+            with self.subTest(view=nome):
+                cache.clear()
+                self.assertGreater(self.leituras_na_replica(reverse(f'controle:{nome}')), 0)
+        # Views de edição continuam no principal
+        self.assertEqual(self.leituras_na_replica(reverse('controle:nova_transacao')), 0)
+
+    def test_le_as_proprias_escritas(self):
+        resposta = self.client.post(reverse('controle:nova_transacao'), {
+            'descricao': 'Recém-salva', 'valor': '10.00', 'data': date.today().isoformat(),
+            'categoria': self.despesa.pk, 'conta': self.conta.pk,
+        })
+        self.assertEqual(resposta.status_code, 302)
+        self.assertIn(roteamento.CHAVE_SESSAO, self.client.session)
+        self.assertEqual(self.leituras_na_replica(reverse('controle:lista_transacoes')), 0)
+
+        # Passado o atraso máximo, a sessão volta a ler da réplica
+        sessao = self.client.session
+        sessao[roteamento.CHAVE_SESSAO] -= settings.BANCO_REPLICA_ATRASO_MAXIMO + 1
+        sessao.save()
+        self.assertGreater(self.leituras_na_replica(reverse('controle:lista_transacoes')), 0)
+
+    def test_leitura_nao_marca_a_sessao(self):
+        self.client.get(reverse('controle:dashboard'))
+        self.assertNotIn(roteamento.CHAVE_SESSAO, self.client.session)
+
+
+class ViewsAsyncTests(DadosBasicosMixin, TestCase):
+    # Contexto que cada versão async precisa reproduzir da view síncrona
+    CHAVES = {
+        'dashboard': ('saldo_total', 'receitas_mes', 'despesas_mes',
+                      'transacoes_recentes', 'dados_categorias', 'orcamentos', 'alertas_orcamento'),
+        'relatorio_mensal': ('anos_disponiveis', 'total_receitas', 'total_despesas', 'saldo_mensal',
+                             'variacao_mensal', 'variacao_anual', 'despesas_por_categoria'),
+        'relatorio_anual': ('anos_disponiveis', 'resumo', 'linhas', 'categorias', 'dados_grafico'),
+    }
+
+    async def test_mesmo_contexto_das_views_sincronas(self):
+        await self.async_client.aforce_login(self.usuario)
+        for nome, chaves in self.CHAVES.items():
+            with self.subTest(view=nome):
+                cache.clear()
+                sincrona = await self.async_client.get(reverse(f'controle:{nome}'))
+                cache.clear()
+                assincrona = await self.async_client.get(reverse(f'controle:{nome}_async'))
+                self.assertEqual(assincrona.status_code, 200)
+                self.assertEqual(
+                    [t.name for t in assincrona.templates][:1], [t.name for t in sincrona.templates][:1],
+                )
+                for chave in chaves:
+                    self.assertEqual(assincrona.context[chave], sincrona.context[chave], chave)
+
+    async def test_contexto_dashboard(self):
+        hoje = date.today()
+        esperado = await sync_to_async(cache_dashboard.contexto_dashboard)(self.usuario, hoje)
+        cache.clear()
+        self.assertEqual(await cache_dashboard.acontexto_dashboard(self.usuario, hoje), esperado)
+        # Segunda chamada vem do cache
+        self.assertEqual(await cache_dashboard.acontexto_dashboard(self.usuario, hoje), esperado)
+
+    async def test_exige_login(self):
+        resposta = await self.async_client.get(reverse('controle:dashboard_async'))
+        self.assertEqual(resposta.status_code, 302)
+
+    async def test_instrumentacao_conta_as_consultas_no_asgi(self):
+        await self.async_client.aforce_login(self.usuario)
+        for nome in ('dashboard_async', 'relatorio_mensal_async', 'lista_contas'):
+            with self.subTest(view=nome):
+                cache.clear()
+                with self.assertLogs('controle.instrumentacao', level='INFO') as logs:
+                    resposta = await self.async_client.get(reverse(f'controle:{nome}'))
+                consultas = logs.records[0].instrumentacao['consultas']
+                # As do ORM, que rodam na thread do sync_to_async
+                self.assertGreater(consultas, 2)
+                self.assertIn(f'"{consultas} consultas"', resposta['Server-Timing'])
+
+
+class BenchmarkAsgiTests(TransactionTestCase):
+    def test_comparar_asgi_wsgi(self):
+        usuario = benchmark.preparar_dados(300)
+        resultados = benchmark.comparar_asgi_wsgi(usuario, concorrencia=2, requisicoes=2)
+        self.assertEqual(
+            [(r['view'], r['modo']) for r in resultados],
+            [(sincrona, modo) for sincrona, _ in benchmark.VIEWS_ASGI for modo in ('wsgi', 'asgi')],
+        )
+        for medida in resultados:
+            self.assertEqual(medida['requisicoes'], 4)
+            self.assertGreater(medida['requisicoes_s'], 0)
+            self.assertGreaterEqual(medida['p95_ms'], medida['p50_ms'])
+
+
+class GraficosTests(DadosBasicosMixin, TestCase):
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.diretorio = diretorio.name
+        configuracao = override_settings(GRAFICOS_CACHE_DIR=self.diretorio, GRAFICOS_PROCESSOS=0)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        self.client.force_login(self.usuario)
+
+    def arquivos(self):
+        return sorted(
+            os.path.join(raiz, nome) for raiz, _, nomes in os.walk(self.diretorio) for nome in nomes
+        )
+
+    def test_png_e_svg(self):
+        for nome in ('grafico_categorias', 'grafico_saldo'):
+            with self.subTest(view=nome):
+                png = self.client.get(reverse(f'controle:{nome}'))
+                self.assertEqual(png['Content-Type'], 'image/png')
+                self.assertTrue(png.content.startswith(b'\x89PNG'))
+                svg = self.client.get(reverse(f'controle:{nome}'), {'formato': 'svg'})
+                self.assertEqual(svg['Content-Type'], 'image/svg+xml')
+                self.assertIn(b'<svg', svg.content)
+
+    def test_parametros_invalidos(self):
+        self.assertEqual(self.client.get(reverse('controle:grafico_categorias'), {'formato': 'gif'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('controle:grafico_categorias'), {'mes': '13'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('controle:grafico_saldo'), {'periodo': 'dia'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('controle:grafico_saldo'), {'data': 'ontem'}).status_code, 400)
+
+    def test_cache_em_disco(self):
+        url = reverse('controle:grafico_categorias')
+        with mock.patch.object(graficos, 'desenhar', wraps=graficos.desenhar) as desenhar:
+            primeira = self.client.get(url).content
+            segunda = self.client.get(url).content
+        self.assertEqual(desenhar.call_count, 1)
+        self.assertEqual(primeira, segunda)
+        self.assertEqual(len(self.arquivos()), 1)
+
+        # Dados novos mudam o hash e geram outro arquivo
+        Transacao.objects.create(
+            descricao='Nova', valor=Decimal('99.00'), data=date.today(),
+            categoria=Categoria.objects.create(nome='Lazer', tipo='D', usuario=self.usuario),
+            conta=self.conta, usuario=self.usuario,
+        )
+        self.assertFalse(self.client.get(url).content == primeira)
+        self.assertEqual(len(self.arquivos()), 2)
+
+    def test_poda_lru(self):
+        dados = graficos.dados_categorias(self.usuario, date.today().year, date.today().month)
+        caminhos = [graficos.caminho(self.usuario.pk, 'categorias', f'periodo{i}', dados, 'png') for i in range(3)]
+        for i, caminho in enumerate(caminhos):
+            caminho.parent.mkdir(parents=True, exist_ok=True)
+            caminho.write_bytes(b'x' * 100)
+            os.utime(caminho, (1000 + i, 1000 + i))
+        # Ler o mais antigo o torna o mais recente
+        graficos.renderizar(self.usuario, 'categorias', 'periodo0', dados)
+
+        self.assertEqual(graficos.podar(maximo=150), 2)
+        self.assertEqual(self.arquivos(), [str(caminhos[0])])
+
+    def test_poda_so_varre_ao_passar_do_maximo(self):
+        dados = graficos.dados_categorias(self.usuario, date.today().year, date.today().month)
+        with override_settings(GRAFICOS_CACHE_MAXIMO_BYTES=250), \
+                mock.patch.object(graficos, 'desenhar', return_value=b'x' * 100), \
+                mock.patch.object(graficos, '_varrer', wraps=graficos._varrer) as varrer:
+            # A primeira gravação mede o diretório; a segunda cabe na estimativa
+            graficos.renderizar(self.usuario, 'categorias', 'periodo0', dados)
+            graficos.renderizar(self.usuario, 'categorias', 'periodo1', dados)
+            self.assertEqual(varrer.call_count, 1)
+            self.assertEqual(len(self.arquivos()), 2)
+
+            # A terceira passa do máximo: varre e poda até 80% dele
+            graficos.renderizar(self.usuario, 'categorias', 'periodo2', dados)
+            self.assertEqual(varrer.call_count, 2)
+            self.assertEqual(len(self.arquivos()), 2)
+
+            # Com a estimativa velha, varre mesmo abaixo do máximo
+            with mock.patch.object(graficos, 'INTERVALO_VARREDURA', 0):
+                graficos.renderizar(self.usuario, 'categorias', 'periodo3', dados)
+            self.assertEqual(varrer.call_count, 3)
+
+    def test_pool_de_processos(self):
+        self.addCleanup(graficos.encerrar)
+        dados = graficos.dados_saldo(self.usuario, date.today().replace(day=1), date.today())
+        with override_settings(GRAFICOS_PROCESSOS=1):
+            conteudo = graficos.renderizar(self.usuario, 'saldo', 'mes', dados)
+        self.assertEqual(conteudo, graficos.desenhar('saldo', dados, 'png'))
+        self.assertTrue(graficos.data_uri(conteudo).startswith('data:image/png;base64,iVBOR'))
+
+
+class DemonstrativosTests(DadosBasicosMixin, TestCase):
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        configuracao = override_settings(MEDIA_ROOT=diretorio.name)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        self.outro = User.objects.create_user('outro', password='senha', first_name='Outra', last_name='Pessoa')
+        self.ano, self.mes = date.today().year, date.today().month
+
+    def test_mesmos_totais_do_relatorio_mensal(self):
+        with self.assertNumQueries(1):
+            totais = relatorios.totais_do_mes_por_usuario([self.usuario.pk, self.outro.pk], self.ano, self.mes)
+        self.assertEqual(
+            totais[self.usuario.pk],
+            relatorios.totais_mensais(self.usuario, (self.ano, self.mes), (self.ano, self.mes)),
+        )
+        self.assertEqual(totais[self.outro.pk]['saldos'], [0])
+
+    def test_gerar_e_retomar(self):
+        saida = StringIO()
+        call_command('gerar_demonstrativos', mes=f'{self.ano}-{self.mes:02d}', processos=2,
+                     tamanho_lote=1, stdout=saida)
+        self.assertIn('2/2 usuários', saida.getvalue())
+
+        pasta = demonstrativos.diretorio(self.ano, self.mes)
+        html = (pasta / f'{self.usuario.pk}.html').read_text()
+        self.assertIn('Mercado', html)
+        self.assertIn('data:image/png;base64,', html)
+        self.assertIn('Outra Pessoa', (pasta / f'{self.outro.pk}.html').read_text())
+        self.assertTrue((pasta / f'{self.usuario.pk}.pdf').read_bytes().startswith(b'%PDF'))
+
+        # Interrompido no meio: só o que falta é gerado de novo
+        (pasta / f'{self.outro.pk}.pdf').unlink()
+        resultado = demonstrativos.gerar(self.ano, self.mes, processos=1)
+        self.assertEqual((resultado['pendentes'], resultado['gerados']), (1, 1))
+        self.assertEqual(demonstrativos.gerar(self.ano, self.mes, processos=1)['pendentes'], 0)
+
+        resultado = demonstrativos.gerar(self.ano, self.mes, usuarios=[self.outro], processos=1, refazer=True)
+        self.assertEqual(resultado['gerados'], 1)
+
+        # Refazer um formato não apaga os outros
+        (pasta / f'{self.usuario.pk}.pdf').write_bytes(b'%PDF anterior')
+        (pasta / f'{self.usuario.pk}.html').write_text('anterior')
+        resultado = demonstrativos.gerar(self.ano, self.mes, formatos=('html',), processos=1, refazer=True)
+        self.assertEqual(resultado['gerados'], 2)
+        self.assertIn('Mercado', (pasta / f'{self.usuario.pk}.html').read_text())
+        self.assertEqual((pasta / f'{self.usuario.pk}.pdf').read_bytes(), b'%PDF anterior')
+        self.assertTrue((pasta / f'{self.outro.pk}.pdf').exists())
+
+    def test_usuario_inexistente(self):
+        with self.assertRaises(CommandError):
+            call_command('gerar_demonstrativos', usuarios='ninguem', stdout=StringIO())
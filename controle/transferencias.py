@@ -0,0 +1,146 @@
+"""
+Transferências entre contas do mesmo usuário.
+
+Cada Transferencia é gravada com duas transações ("pernas"): uma despesa
+na conta de origem e uma receita na de destino, nas categorias internas
+de transferência do usuário. As pernas entram por
+lancamentos.inserir_em_lote, então os dois saldos mudam com F() na mesma
+transação do banco que as grava, e o extrato e a busca as enxergam como
+qualquer transação.
+
+As pernas ficam fora dos resumos mensais por categoria (ver
+resumos.deltas_de_transacoes). Como o dashboard e os relatórios leem os
+totais dos resumos, transferências não contam como receita nem despesa,
+sem nenhum filtro ou consulta a mais.
+"""
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import lancamentos
+from .models import Categoria, Conta, Transacao, Transferencia
+
+NOMES_CATEGORIAS = {'D': 'Transferência enviada', 'R': 'Transferência recebida'}
+DESCRICAO_PADRAO = 'Transferência'
+# Limite de itens por chamada do endpoint em lote
+MAXIMO_LOTE = 1000
+
+
+class ErroTransferencia(ValueError):
+    """Transferência inválida; a mensagem pode ser mostrada ao usuário."""
+
+
+def categorias(usuario):
+    """(enviada, recebida): as categorias internas do usuário, criadas na primeira vez."""
+    existentes = {
+        categoria.tipo: categoria
+        for categoria in Categoria.objects.filter(usuario=usuario, transferencia=True)
+    }
+    for tipo, nome in NOMES_CATEGORIAS.items():
+        if tipo in existentes:
+            continue
+        try:
+            with transaction.atomic():
+                existentes[tipo] = Categoria.objects.create(nome=nome, tipo=tipo, usuario=usuario, transferencia=True)
+        except IntegrityError:
+            # Criada por outra requisição entre a leitura e o INSERT
+            existentes[tipo] = Categoria.objects.get(usuario=usuario, tipo=tipo, transferencia=True)
+    return existentes['D'], existentes['R']
+
+
+def validar(transferencia):
+    """Levanta ErroTransferencia se as contas ou o valor não servem."""
+    if transferencia.origem_id == transferencia.destino_id:
+        raise ErroTransferencia('A conta de destino deve ser diferente da de origem.')
+    if transferencia.valor is None or transferencia.valor <= 0:
+        raise ErroTransferencia('Informe um valor maior que zero.')
+
+
+def _pernas(transferencia, enviada, recebida):
+    comum = dict(
+        descricao=transferencia.descricao,
+        valor=transferencia.valor,
+        data=transferencia.data,
+        usuario_id=transferencia.usuario_id,
+        transferencia=transferencia,
+    )
+    return [
+        Transacao(categoria=enviada, conta_id=transferencia.origem_id, **comum),
+        Transacao(categoria=recebida, conta_id=transferencia.destino_id, **comum),
+    ]
+
+
+def transferir_em_lote(usuario, transferencias):
+    """
+    Grava `transferencias` (instâncias não salvas, do `usuario`) e as
+    pernas de cada uma em uma única transação do banco: ou todas entram,
+    ou nenhuma. Retorna a lista de transferências criadas.
+    """
+    transferencias = list(transferencias)
+    if not transferencias:
+        return []
+    for transferencia in transferencias:
+        transferencia.usuario = usuario
+        validar(transferencia)
+
+    enviada, recebida = categorias(usuario)
+    with transaction.atomic():
+        criadas = Transferencia.objects.bulk_create(transferencias)
+        lancamentos.inserir_em_lote(
+            perna for transferencia in criadas for perna in _pernas(transferencia, enviada, recebida)
+        )
+    return criadas
+
+
+def transferir(usuario, origem, destino, valor, data=None, descricao=DESCRICAO_PADRAO):
+    """Move `valor` da conta `origem` para a `destino`; retorna a Transferencia."""
+    transferencia = Transferencia(
+        origem=origem, destino=destino, valor=valor,
+        data=data or timezone.now().date(), descricao=descricao or DESCRICAO_PADRAO,
+    )
+    return transferir_em_lote(usuario, [transferencia])[0]
+
+
+def _converter(item, contas):
+    try:
+        origem = contas[int(item['origem'])]
+        destino = contas[int(item['destino'])]
+    except (KeyError, TypeError, ValueError):
+        raise ErroTransferencia('Conta de origem ou de destino não encontrada.')
+    try:
+        valor = Decimal(str(item.get('valor')))
+        if not valor.is_finite() or valor != round(valor, 2) or abs(valor) >= 10 ** 8:
+            raise InvalidOperation
+    except InvalidOperation:
+        raise ErroTransferencia(f"Valor inválido: {item.get('valor')!r}")
+    try:
+        data = date.fromisoformat(item['data']) if item.get('data') else timezone.now().date()
+    except (TypeError, ValueError):
+        raise ErroTransferencia(f"Data inválida: {item.get('data')!r}")
+    transferencia = Transferencia(
+        origem=origem, destino=destino, valor=valor, data=data,
+        descricao=str(item.get('descricao') or DESCRICAO_PADRAO)[:200],
+    )
+    validar(transferencia)
+    return transferencia
+
+
+def converter_lote(usuario, itens):
+    """
+    Converte os dicionários recebidos pela API ({origem, destino, valor,
+    data, descricao}) em transferências não salvas. Retorna
+    (transferencias, erros), com erros no formato [{indice, erro}]; as
+    contas do usuário são lidas uma vez para o lote inteiro.
+    """
+    contas = {conta.pk: conta for conta in Conta.objects.filter(usuario=usuario)}
+    transferencias, erros = [], []
+    for indice, item in enumerate(itens):
+        try:
+            if not isinstance(item, dict):
+                raise ErroTransferencia('Cada item deve ser um objeto.')
+            transferencias.append(_converter(item, contas))
+        except ErroTransferencia as erro:
+            erros.append({'indice': indice, 'erro': str(erro)})
+    return transferencias, erros
@@ -5,6 +5,7 @@ app_name = 'controle'
 
 urlpatterns = [
     path('', views.dashboard, name='dashboard'),
+    path('async/', views.dashboard_async, name='dashboard_async'),
     path('registro/', views.registro_usuario, name='registro'),
     
     # Categorias
@@ -18,17 +19,59 @@ urlpatterns = [
     path('contas/nova/', views.nova_conta, name='nova_conta'),
     path('contas/editar/<int:pk>/', views.editar_conta, name='editar_conta'),
     path('contas/excluir/<int:pk>/', views.excluir_conta, name='excluir_conta'),
+    path('contas/<int:pk>/extrato/', views.extrato_conta, name='extrato_conta'),
     
     # Transações
     path('transacoes/', views.lista_transacoes, name='lista_transacoes'),
     path('transacoes/nova/', views.nova_transacao, name='nova_transacao'),
     path('transacoes/editar/<int:pk>/', views.editar_transacao, name='editar_transacao'),
     path('transacoes/excluir/<int:pk>/', views.excluir_transacao, name='excluir_transacao'),
+    path('transacoes/lote/', views.lancar_em_lote, name='lancar_em_lote'),
+    path('transacoes/importar/', views.importar_transacoes, name='importar_transacoes'),
+    path('transacoes/exportar/', views.exportar_transacoes, name='exportar_transacoes'),
+    
+    # Recorrências
+    path('recorrencias/', views.lista_recorrencias, name='lista_recorrencias'),
+    path('recorrencias/nova/', views.nova_recorrencia, name='nova_recorrencia'),
+    path('recorrencias/editar/<int:pk>/', views.editar_recorrencia, name='editar_recorrencia'),
+    path('recorrencias/excluir/<int:pk>/', views.excluir_recorrencia, name='excluir_recorrencia'),
+    
+    # Transferências
+    path('transferencias/', views.lista_transferencias, name='lista_transferencias'),
+    path('transferencias/nova/', views.nova_transferencia, name='nova_transferencia'),
+    path('transferencias/excluir/<int:pk>/', views.excluir_transferencia, name='excluir_transferencia'),
+    
+    # Orçamentos
+    path('orcamentos/', views.lista_orcamentos, name='lista_orcamentos'),
+    path('orcamentos/novo/', views.novo_orcamento, name='novo_orcamento'),
+    path('orcamentos/editar/<int:pk>/', views.editar_orcamento, name='editar_orcamento'),
+    path('orcamentos/excluir/<int:pk>/', views.excluir_orcamento, name='excluir_orcamento'),
     
     # Relatórios
     path('relatorios/mensal/', views.relatorio_mensal, name='relatorio_mensal'),
+    path('relatorios/anual/', views.relatorio_anual, name='relatorio_anual'),
+    path('relatorios/mensal/async/', views.relatorio_mensal_async, name='relatorio_mensal_async'),
+    path('relatorios/anual/async/', views.relatorio_anual_async, name='relatorio_anual_async'),
+    # Endereço anterior da série de saldo, servido pela view da API
+    path('relatorios/serie-saldo/', views.api_evolucao_saldo, name='serie_saldo_json'),
+    path('relatorios/graficos/categorias/', views.grafico_categorias, name='grafico_categorias'),
+    path('relatorios/graficos/saldo/', views.grafico_saldo, name='grafico_saldo'),
+    
+    # Cache
+    path('cache/estatisticas/', views.estatisticas_cache, name='estatisticas_cache'),
+    
+    # API (v1)
+    path('api/v1/resumo/', views.api_resumo, name='api_resumo'),
+    path('api/v1/categorias/', views.api_categorias, name='api_categorias'),
+    path('api/v1/evolucao-saldo/', views.api_evolucao_saldo, name='api_evolucao_saldo'),
+    path('api/v1/totais-mensais/', views.api_totais_mensais, name='api_totais_mensais'),
+    path('api/v1/orcamentos/', views.api_orcamentos, name='api_orcamentos'),
+    path('api/v1/transferencias/', views.api_transferencias, name='api_transferencias'),
+    path('api/v1/transacoes-recentes/', views.api_transacoes_recentes, name='api_transacoes_recentes'),
+    path('api/v1/busca/', views.api_busca_transacoes, name='api_busca_transacoes'),
     
     # AJAX
     path('ajax/criar-categoria/', views.ajax_criar_categoria, name='ajax_criar_categoria'),
     path('ajax/criar-conta/', views.ajax_criar_conta, name='ajax_criar_conta'),
+    path('ajax/lancar-transacoes/', views.ajax_lancar_transacoes, name='ajax_lancar_transacoes'),
 ]
\ No newline at end of file
@@ -1,18 +1,26 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import login
 from django.contrib import messages
-from django.db.models import Sum, Q
+from django.db import transaction
+from django.db.models import RestrictedError, Sum, Q
 from django.utils import timezone
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET, require_POST
 from datetime import datetime, timedelta
-import io
-import base64
-import numpy as np
-import calendar
+from decimal import Decimal, InvalidOperation
+import asyncio
+import hashlib
+import json
 
-from .models import Categoria, Conta, Transacao
-from .forms import CategoriaForm, ContaForm, TransacaoForm, RegistroForm
+from . import busca, cache, exportacao, graficos, importacao, lancamentos, paginacao, recorrencias, relatorios, resumos, saldos, transferencias
+from .roteamento import leitura_replica
+from .models import Categoria, Conta, Orcamento, Recorrencia, Transacao, Transferencia
+from .forms import CategoriaForm, ContaForm, TransacaoForm, RegistroForm, FiltroTransacaoForm, ImportacaoForm, LancamentoLoteFormSet, OrcamentoForm, PeriodoExtratoForm, RecorrenciaForm, TransferenciaForm
+from .relatorios import PERIODOS, intervalo_periodo, serie_saldo, dados_grafico_evolucao
 
 def registro_usuario(request):
     if request.method == 'POST':
@@ -27,74 +35,28 @@ def registro_usuario(request):
     return render(request, 'controle/registro.html', {'form': form})
 
 @login_required
+@leitura_replica
 def dashboard(request):
-    contas = Conta.objects.filter(usuario=request.user)
-    saldo_total = contas.aggregate(total=Sum('saldo'))['total'] or 0
-    
-    # Transações recentes
-    transacoes_recentes = Transacao.objects.filter(usuario=request.user).order_by('-data')[:5]
-    
-    # Resumo mensal
     hoje = timezone.now().date()
-    primeiro_dia_mes = hoje.replace(day=1)
-    ultimo_dia_mes = (primeiro_dia_mes + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-    
-    receitas_mes = Transacao.objects.filter(
-        usuario=request.user,
-        categoria__tipo='R',
-        data__range=[primeiro_dia_mes, ultimo_dia_mes]
-    ).aggregate(total=Sum('valor'))['total'] or 0
-    
-    despesas_mes = Transacao.objects.filter(
-        usuario=request.user,
-        categoria__tipo='D',
-        data__range=[primeiro_dia_mes, ultimo_dia_mes]
-    ).aggregate(total=Sum('valor'))['total'] or 0
-    
-    # Dados para gráfico de despesas por categoria
-    categorias_despesa = Categoria.objects.filter(usuario=request.user, tipo='D')
-    dados_grafico = []
-    labels = []
-    cores = [
-        '#FF6384', '#36A2EB', '#FFCE56', '#4BC0C0', '#9966FF',
-        '#FF9F40', '#8AC249', '#EA526F', '#49ADF5', '#C8B0F5'
-    ]
-    
-    for categoria in categorias_despesa:
-        total = Transacao.objects.filter(
-            usuario=request.user,
-            categoria=categoria,
-            data__range=[primeiro_dia_mes, ultimo_dia_mes]
-        ).aggregate(total=Sum('valor'))['total'] or 0
-        
-        if total > 0:
-            dados_grafico.append(float(total))
-            labels.append(categoria.nome)
-    
-    # Preparar dados para Chart.js
-    dados_categorias = {
-        'labels': labels,
-        'datasets': [{
-            'data': dados_grafico,
-            'backgroundColor': cores[:len(dados_grafico)],
-            'borderWidth': 1
-        }]
-    }
-    
-    context = {
-        'contas': contas,
-        'saldo_total': saldo_total,
-        'transacoes_recentes': transacoes_recentes,
-        'receitas_mes': receitas_mes,
-        'despesas_mes': despesas_mes,
-        'dados_categorias': dados_categorias,
-    }
-    
+    context = cache.contexto_dashboard(request.user, hoje)
     return render(request, 'controle/dashboard.html', context)
 
+@login_required
+@leitura_replica
+async def dashboard_async(request):
+    # Mesma página, com as partes do contexto lidas pelo ORM assíncrono (ASGI);
+    # as consultas continuam rodando uma de cada vez
+    hoje = timezone.now().date()
+    context = await cache.acontexto_dashboard(await request.auser(), hoje)
+    return await sync_to_async(render)(request, 'controle/dashboard.html', context)
+
+@staff_member_required
+def estatisticas_cache(request):
+    return JsonResponse({'dashboard': cache.estatisticas()})
+
 @login_required
 def lista_categorias(request):
-    categorias = Categoria.objects.filter(usuario=request.user)
+    categorias = Categoria.objects.filter(usuario=request.user, transferencia=False)
     return render(request, 'controle/lista_categorias.html', {'categorias': categorias})
 
 @login_required
@@ -113,7 +75,7 @@ def nova_categoria(request):
 
 @login_required
 def editar_categoria(request, pk):
-    categoria = get_object_or_404(Categoria, pk=pk, usuario=request.user)
+    categoria = get_object_or_404(Categoria, pk=pk, usuario=request.user, transferencia=False)
     if request.method == 'POST':
         form = CategoriaForm(request.POST, instance=categoria)
         if form.is_valid():
@@ -126,10 +88,14 @@ def editar_categoria(request, pk):
 
 @login_required
 def excluir_categoria(request, pk):
-    categoria = get_object_or_404(Categoria, pk=pk, usuario=request.user)
+    categoria = get_object_or_404(Categoria, pk=pk, usuario=request.user, transferencia=False)
     if request.method == 'POST':
-        categoria.delete()
-        messages.success(request, 'Categoria excluída com sucesso!')
+        try:
+            categoria.delete()
+        except RestrictedError:
+            messages.error(request, 'A categoria tem transações arquivadas; restaure os anos arquivados antes de excluí-la.')
+        else:
+            messages.success(request, 'Categoria excluída com sucesso!')
         return redirect('controle:lista_categorias')
     return render(request, 'controle/confirmar_exclusao.html', {'objeto': categoria})
 
@@ -169,20 +135,91 @@ def editar_conta(request, pk):
 def excluir_conta(request, pk):
     conta = get_object_or_404(Conta, pk=pk, usuario=request.user)
     if request.method == 'POST':
-        conta.delete()
-        messages.success(request, 'Conta excluída com sucesso!')
+        try:
+            conta.delete()
+        except RestrictedError:
+            messages.error(request, 'A conta tem transações arquivadas; restaure os anos arquivados antes de excluí-la.')
+        else:
+            messages.success(request, 'Conta excluída com sucesso!')
         return redirect('controle:lista_contas')
     return render(request, 'controle/confirmar_exclusao.html', {'objeto': conta})
 
 @login_required
+@leitura_replica
+def extrato_conta(request, pk):
+    conta = get_object_or_404(Conta, pk=pk, usuario=request.user)
+    periodo = PeriodoExtratoForm(request.GET)
+    inicio, fim = periodo.periodo()
+    # Saldo após cada transação e saldos de abertura/fechamento do período
+    pagina = saldos.extrato(
+        conta, inicio, fim,
+        depois=request.GET.get('depois'),
+        antes=request.GET.get('antes'),
+    )
+    
+    parametros = request.GET.copy()
+    parametros.pop('depois', None)
+    parametros.pop('antes', None)
+    
+    context = {
+        'conta': conta,
+        'periodo': periodo,
+        'inicio': inicio,
+        'fim': fim,
+        'transacoes': pagina['itens'],
+        'saldo_abertura': pagina['saldo_abertura'],
+        'saldo_fechamento': pagina['saldo_fechamento'],
+        'cursor_proximo': pagina['cursor_proximo'],
+        'cursor_anterior': pagina['cursor_anterior'],
+        'parametros': parametros.urlencode(),
+    }
+    return render(request, 'controle/extrato_conta.html', context)
+
+@login_required
+@leitura_replica
 def lista_transacoes(request):
-    transacoes = Transacao.objects.filter(usuario=request.user)
-    return render(request, 'controle/lista_transacoes.html', {'transacoes': transacoes})
+    filtro = FiltroTransacaoForm(request.user, request.GET)
+    transacoes = filtro.filtrar(
+        Transacao.objects.filter(usuario=request.user).select_related('categoria', 'conta')
+    )
+    pagina = paginacao.paginar(
+        transacoes,
+        depois=request.GET.get('depois'),
+        antes=request.GET.get('antes'),
+    )
+    
+    # Preserva os filtros nos links de navegação entre páginas
+    parametros = request.GET.copy()
+    parametros.pop('depois', None)
+    parametros.pop('antes', None)
+    
+    context = {
+        'transacoes': pagina['itens'],
+        'filtro': filtro,
+        'cursor_proximo': pagina['cursor_proximo'],
+        'cursor_anterior': pagina['cursor_anterior'],
+        'parametros': parametros.urlencode(),
+    }
+    return render(request, 'controle/lista_transacoes.html', context)
+
+@login_required
+def exportar_transacoes(request):
+    formato = request.GET.get('formato', 'csv')
+    if formato not in exportacao.FORMATOS:
+        return HttpResponseBadRequest('Formato de exportação inválido.')
+    
+    filtro = FiltroTransacaoForm(request.user, request.GET)
+    transacoes = filtro.filtrar(Transacao.objects.filter(usuario=request.user))
+    
+    content_type, extensao = exportacao.FORMATOS[formato]
+    response = StreamingHttpResponse(exportacao.GERADORES[formato](transacoes), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="transacoes-{timezone.now():%Y%m%d}.{extensao}"'
+    return response
 
 @login_required
 def nova_transacao(request):
     if request.method == 'POST':
-        form = TransacaoForm(request.POST)
+        form = TransacaoForm(request.user, request.POST)
         if form.is_valid():
             transacao = form.save(commit=False)
             transacao.usuario = request.user
@@ -190,31 +227,45 @@ def nova_transacao(request):
             messages.success(request, 'Transação registrada com sucesso!')
             return redirect('controle:lista_transacoes')
     else:
-        form = TransacaoForm()
-        # Filtrar categorias e contas do usuário
-        form.fields['categoria'].queryset = Categoria.objects.filter(usuario=request.user)
-        form.fields['conta'].queryset = Conta.objects.filter(usuario=request.user)
+        form = TransacaoForm(request.user)
     return render(request, 'controle/form_transacao.html', {'form': form})
 
+@login_required
+def lancar_em_lote(request):
+    if request.method == 'POST':
+        formset = LancamentoLoteFormSet(request.user, request.POST)
+        if formset.is_valid():
+            criadas = lancamentos.inserir_em_lote(formset.transacoes())
+            messages.success(request, f'{len(criadas)} transações registradas com sucesso!')
+            # Volta para uma página em branco, pronta para o próximo lote
+            return redirect('controle:lancar_em_lote')
+    else:
+        formset = LancamentoLoteFormSet(request.user)
+    return render(request, 'controle/lancar_em_lote.html', {'formset': formset})
+
 @login_required
 def editar_transacao(request, pk):
     transacao = get_object_or_404(Transacao, pk=pk, usuario=request.user)
+    if transacao.transferencia_id:
+        # Editar uma perna sozinha desequilibraria a transferência
+        messages.error(request, 'Transações de transferência não podem ser editadas; exclua a transferência e crie outra.')
+        return redirect('controle:lista_transferencias')
     if request.method == 'POST':
-        form = TransacaoForm(request.POST, instance=transacao)
+        form = TransacaoForm(request.user, request.POST, instance=transacao)
         if form.is_valid():
             form.save()
             messages.success(request, 'Transação atualizada com sucesso!')
             return redirect('controle:lista_transacoes')
     else:
-        form = TransacaoForm(instance=transacao)
-        # Filtrar categorias e contas do usuário
-        form.fields['categoria'].queryset = Categoria.objects.filter(usuario=request.user)
-        form.fields['conta'].queryset = Conta.objects.filter(usuario=request.user)
+        form = TransacaoForm(request.user, instance=transacao)
     return render(request, 'controle/form_transacao.html', {'form': form})
 
 @login_required
 def excluir_transacao(request, pk):
     transacao = get_object_or_404(Transacao, pk=pk, usuario=request.user)
+    if transacao.transferencia_id:
+        # As duas pernas saem juntas
+        return redirect('controle:excluir_transferencia', pk=transacao.transferencia_id)
     if request.method == 'POST':
         transacao.delete()
         messages.success(request, 'Transação excluída com sucesso!')
@@ -222,121 +273,186 @@ def excluir_transacao(request, pk):
     return render(request, 'controle/confirmar_exclusao.html', {'objeto': transacao})
 
 @login_required
-def relatorio_mensal(request):
+def importar_transacoes(request):
+    if request.method == 'POST':
+        form = ImportacaoForm(request.user, request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                resultado = importacao.importar_arquivo(
+                    request.user,
+                    form.cleaned_data['arquivo'],
+                    form.cleaned_data['formato'],
+                    conta=form.cleaned_data['conta'],
+                    categoria_receita=form.cleaned_data['categoria_receita'],
+                    categoria_despesa=form.cleaned_data['categoria_despesa'],
+                )
+            except importacao.ErroLinha as erro:
+                form.add_error('arquivo', str(erro))
+            else:
+                messages.success(
+                    request,
+                    f"{resultado['importadas']} transações importadas, "
+                    f"{resultado['duplicadas']} duplicadas ignoradas."
+                )
+                if resultado['interrompida']:
+                    form.add_error('arquivo', (
+                        f"Importação interrompida: {resultado['interrompida']}. As transações anteriores "
+                        f"foram mantidas; ao enviar o arquivo corrigido, elas serão ignoradas como duplicadas."
+                    ))
+                if resultado['com_erro']:
+                    messages.warning(request, f"{resultado['com_erro']} linhas com erro não foram importadas.")
+                if resultado['com_erro'] or resultado['interrompida']:
+                    return render(request, 'controle/importar_transacoes.html', {'form': form, 'erros': resultado['erros']})
+                return redirect('controle:lista_transacoes')
+    else:
+        form = ImportacaoForm(request.user)
+    return render(request, 'controle/importar_transacoes.html', {'form': form})
+
+def _ano_mes(request):
+    """(ano, mes) dos parâmetros GET (padrão: mês atual) ou None se inválidos."""
     hoje = timezone.now().date()
-    mes = request.GET.get('mes', hoje.month)
-    ano = request.GET.get('ano', hoje.year)
-    
     try:
-        mes = int(mes)
-        ano = int(ano)
-        data_inicio = datetime(ano, mes, 1).date()
-        if mes == 12:
-            data_fim = datetime(ano + 1, 1, 1).date() - timedelta(days=1)
-        else:
-            data_fim = datetime(ano, mes + 1, 1).date() - timedelta(days=1)
-    except (ValueError, TypeError):
-        mes = hoje.month
-        ano = hoje.year
-        data_inicio = datetime(ano, mes, 1).date()
-        if mes == 12:
-            data_fim = datetime(ano + 1, 1, 1).date() - timedelta(days=1)
-        else:
-            data_fim = datetime(ano, mes + 1, 1).date() - timedelta(days=1)
-    
-    receitas = Transacao.objects.filter(
-        usuario=request.user,
-        categoria__tipo='R',
-        data__range=[data_inicio, data_fim]
-    )
-    
-    despesas = Transacao.objects.filter(
-        usuario=request.user,
-        categoria__tipo='D',
-        data__range=[data_inicio, data_fim]
-    )
-    
-    total_receitas = receitas.aggregate(total=Sum('valor'))['total'] or 0
-    total_despesas = despesas.aggregate(total=Sum('valor'))['total'] or 0
-    saldo_mensal = total_receitas - total_despesas
-    
-    # 1. Ajuste para o gráfico de evolução diária
-    # Pega o saldo total da conta do usuário no dia anterior ao início do mês
-    data_dia_anterior = data_inicio - timedelta(days=1)
-    
-    # Agrega receitas e despesas até o dia anterior para um cálculo mais eficiente
-    saldo_inicial_mes = Transacao.objects.filter(
-        usuario=request.user,
-        data__lte=data_dia_anterior,
-    ).aggregate(
-        total_receitas=Sum('valor', filter=Q(categoria__tipo='R')),
-        total_despesas=Sum('valor', filter=Q(categoria__tipo='D'))
-    )
+        ano = int(request.GET.get('ano', hoje.year))
+        mes = int(request.GET.get('mes', hoje.month))
+        if not 1 <= mes <= 12 or not 1 <= ano <= 9999:
+            raise ValueError
+    except ValueError:
+        return None
+    return ano, mes
 
-    # 2. Inicia o saldo acumulado com o valor do mês anterior
-    saldo_acumulado = (saldo_inicial_mes['total_receitas'] or 0) - (saldo_inicial_mes['total_despesas'] or 0)
-        
-    # Pega todas as transações do mês e ordena por data para o cálculo diário
-    transacoes_mes = Transacao.objects.filter(
-        usuario=request.user,
-        data__range=[data_inicio, data_fim]
-    ).order_by('data')
-
-    saldos_diarios = []
-    labels_datas = []
-
-    # 3. Itera sobre os dias do mês
-    current_data = data_inicio
-    while current_data <= data_fim:
-        # Pega as transações do dia
-        receita_dia = transacoes_mes.filter(
-            categoria__tipo='R',
-            data=current_data
-        ).aggregate(total=Sum('valor'))['total'] or 0
-
-        despesa_dia = transacoes_mes.filter(
-            categoria__tipo='D',
-            data=current_data
-        ).aggregate(total=Sum('valor'))['total'] or 0
-
-        # Atualiza o saldo acumulado
-        saldo_acumulado += receita_dia - despesa_dia
-        saldos_diarios.append(float(saldo_acumulado))
-        labels_datas.append(current_data.strftime('%d/%m'))
-
-        current_data += timedelta(days=1)
-
-    # Preparar dados para Chart.js
-    dados_evolucao = {
-        'labels': labels_datas,
-        'datasets': [{
-            'label': 'Saldo Acumulado',
-            'data': saldos_diarios,
-            'borderColor': '#4BC0C0',
-            'backgroundColor': 'rgba(75, 192, 192, 0.2)',
-            'borderWidth': 2,
-            'fill': True,
-            'tension': 0.4,
-            'pointRadius': 4,
-            'pointBackgroundColor': '#4BC0C0',
-            'pointHoverRadius': 6,
-            'pointHoverBackgroundColor': '#36A2EB',
-            'pointHoverBorderColor': '#fff',
-            'pointHoverBorderWidth': 2
-        }]
-    }
+@login_required
+def lista_recorrencias(request):
+    recorrencias_usuario = Recorrencia.objects.filter(usuario=request.user).select_related('categoria', 'conta')
+    return render(request, 'controle/lista_recorrencias.html', {'recorrencias': recorrencias_usuario})
+
+@login_required
+def nova_recorrencia(request):
+    if request.method == 'POST':
+        form = RecorrenciaForm(request.user, request.POST)
+        if form.is_valid():
+            recorrencia = form.save(commit=False)
+            recorrencia.usuario = request.user
+            recorrencia.save()
+            # Ocorrências já vencidas (data inicial no passado ou hoje) entram na hora
+            resultado = recorrencias.materializar(usuario=request.user)
+            messages.success(request, f"Recorrência criada com sucesso! {resultado['transacoes']} transações lançadas.")
+            return redirect('controle:lista_recorrencias')
+    else:
+        form = RecorrenciaForm(request.user)
+    return render(request, 'controle/form_recorrencia.html', {'form': form})
+
+@login_required
+def editar_recorrencia(request, pk):
+    recorrencia = get_object_or_404(Recorrencia, pk=pk, usuario=request.user)
+    if request.method == 'POST':
+        form = RecorrenciaForm(request.user, request.POST, instance=recorrencia)
+        if form.is_valid():
+            form.save()
+            recorrencias.materializar(usuario=request.user)
+            messages.success(request, 'Recorrência atualizada com sucesso!')
+            return redirect('controle:lista_recorrencias')
+    else:
+        form = RecorrenciaForm(request.user, instance=recorrencia)
+    return render(request, 'controle/form_recorrencia.html', {'form': form})
+
+@login_required
+def excluir_recorrencia(request, pk):
+    recorrencia = get_object_or_404(Recorrencia, pk=pk, usuario=request.user)
+    if request.method == 'POST':
+        # As transações já lançadas permanecem
+        recorrencia.delete()
+        messages.success(request, 'Recorrência excluída com sucesso!')
+        return redirect('controle:lista_recorrencias')
+    return render(request, 'controle/confirmar_exclusao.html', {'objeto': recorrencia})
+
+@login_required
+def lista_transferencias(request):
+    transferencias_usuario = Transferencia.objects.filter(usuario=request.user).select_related('origem', 'destino')[:100]
+    return render(request, 'controle/lista_transferencias.html', {'transferencias': transferencias_usuario})
+
+@login_required
+def nova_transferencia(request):
+    if request.method == 'POST':
+        form = TransferenciaForm(request.user, request.POST)
+        if form.is_valid():
+            dados = form.cleaned_data
+            transferencias.transferir(
+                request.user, dados['origem'], dados['destino'], dados['valor'],
+                data=dados['data'], descricao=dados['descricao'],
+            )
+            messages.success(request, 'Transferência registrada com sucesso!')
+            return redirect('controle:lista_transferencias')
+    else:
+        form = TransferenciaForm(request.user)
+    return render(request, 'controle/form_transferencia.html', {'form': form})
+
+@login_required
+def excluir_transferencia(request, pk):
+    transferencia = get_object_or_404(Transferencia, pk=pk, usuario=request.user)
+    if request.method == 'POST':
+        # As pernas saem em cascata e os sinais desfazem os saldos
+        with transaction.atomic():
+            transferencia.delete()
+        messages.success(request, 'Transferência excluída com sucesso!')
+        return redirect('controle:lista_transferencias')
+    return render(request, 'controle/confirmar_exclusao.html', {'objeto': transferencia})
+
+@login_required
+def lista_orcamentos(request):
+    hoje = timezone.now().date()
+    context = cache.parte_orcamentos(request.user, hoje.year, hoje.month)
+    context['hoje'] = hoje
+    return render(request, 'controle/lista_orcamentos.html', context)
+
+@login_required
+def novo_orcamento(request):
+    if request.method == 'POST':
+        form = OrcamentoForm(request.user, request.POST)
+        if form.is_valid():
+            orcamento = form.save(commit=False)
+            orcamento.usuario = request.user
+            orcamento.save()
+            messages.success(request, 'Orçamento criado com sucesso!')
+            return redirect('controle:lista_orcamentos')
+    else:
+        form = OrcamentoForm(request.user)
+    return render(request, 'controle/form_orcamento.html', {'form': form})
+
+@login_required
+def editar_orcamento(request, pk):
+    orcamento = get_object_or_404(Orcamento, pk=pk, usuario=request.user)
+    if request.method == 'POST':
+        form = OrcamentoForm(request.user, request.POST, instance=orcamento)
+        if form.is_valid():
+            form.save()
+            messages.success(request, 'Orçamento atualizado com sucesso!')
+            return redirect('controle:lista_orcamentos')
+    else:
+        form = OrcamentoForm(request.user, instance=orcamento)
+    return render(request, 'controle/form_orcamento.html', {'form': form})
+
+@login_required
+def excluir_orcamento(request, pk):
+    orcamento = get_object_or_404(Orcamento, pk=pk, usuario=request.user)
+    if request.method == 'POST':
+        orcamento.delete()
+        messages.success(request, 'Orçamento excluído com sucesso!')
+        return redirect('controle:lista_orcamentos')
+    return render(request, 'controle/confirmar_exclusao.html', {'objeto': orcamento})
+
+def _contexto_relatorio_mensal(ano, mes, totais, por_categoria, anos_disponiveis):
+    # Totais do mês e comparações com o mês anterior e o do ano anterior,
+    # lidos dos resumos mensais em uma única consulta agrupada
+    total_receitas = totais['receitas'][0]
+    total_despesas = totais['despesas'][0]
+    saldo_mensal = totais['saldos'][0]
+    
+    # A evolução diária do saldo é carregada pela página em api_evolucao_saldo
     
     # Calcular despesas por categoria para o mês
-    categorias_despesa = Categoria.objects.filter(usuario=request.user, tipo='D')
     despesas_por_categoria = []
     
-    for categoria in categorias_despesa:
-        total = Transacao.objects.filter(
-            usuario=request.user,
-            categoria=categoria,
-            data__range=[data_inicio, data_fim]
-        ).aggregate(total=Sum('valor'))['total'] or 0
-        
+    for categoria, total in por_categoria:
         # Incluir todas as categorias, mesmo com valor zero
         despesas_por_categoria.append({
             'categoria': categoria.nome,
@@ -353,20 +469,165 @@ def relatorio_mensal(request):
         for item in despesas_por_categoria:
             item['percentual'] = (item['valor'] / total_despesas_valor) * 100
     
-    context = {
+    return {
         'mes': mes,
         'ano': ano,
-        'receitas': receitas,
-        'despesas': despesas,
+        'anos_disponiveis': anos_disponiveis,
+        'variacao_mensal': totais['variacao_mensal'][0],
+        'variacao_anual': totais['variacao_anual'][0],
         'total_receitas': total_receitas,
         'total_despesas': total_despesas,
         'saldo_mensal': saldo_mensal,
-        'dados_evolucao': dados_evolucao,
         'despesas_por_categoria': despesas_por_categoria,
     }
-    
+
+@login_required
+@leitura_replica
+def relatorio_mensal(request):
+    hoje = timezone.now().date()
+    ano, mes = _ano_mes(request) or (hoje.year, hoje.month)
+    context = _contexto_relatorio_mensal(
+        ano, mes,
+        relatorios.totais_mensais(request.user, (ano, mes), (ano, mes)),
+        resumos.totais_por_categoria(request.user, ano, mes, incluir_zeradas=True),
+        relatorios.anos_disponiveis(request.user, hoje),
+    )
     return render(request, 'controle/relatorio_mensal.html', context)
 
+@login_required
+@leitura_replica
+async def relatorio_mensal_async(request):
+    # As três consultas pelo ORM assíncrono (ASGI), executadas em sequência
+    hoje = timezone.now().date()
+    ano, mes = _ano_mes(request) or (hoje.year, hoje.month)
+    usuario = await request.auser()
+    totais, por_categoria, anos = await asyncio.gather(
+        relatorios.atotais_mensais(usuario, (ano, mes), (ano, mes)),
+        resumos.atotais_por_categoria(usuario, ano, mes, incluir_zeradas=True),
+        relatorios.aanos_disponiveis(usuario, hoje),
+    )
+    context = _contexto_relatorio_mensal(ano, mes, totais, por_categoria, anos)
+    return await sync_to_async(render)(request, 'controle/relatorio_mensal.html', context)
+
+def _ano_relatorio(request, hoje):
+    try:
+        ano = int(request.GET.get('ano', hoje.year))
+        if not 2 <= ano <= 9999:
+            raise ValueError
+    except ValueError:
+        ano = hoje.year
+    return ano
+
+def _contexto_relatorio_anual(ano, relatorio, anos_disponiveis):
+    totais = relatorio['totais']
+    
+    linhas = [
+        {
+            'mes': mes,
+            'nome_mes': relatorios.NOMES_MESES[mes - 1],
+            'receitas': receitas,
+            'despesas': despesas,
+            'saldo': saldo,
+            'variacao_mensal': variacao_mensal['saldo'],
+            'variacao_anual': variacao_anual['saldo'],
+        }
+        for (_, mes), receitas, despesas, saldo, variacao_mensal, variacao_anual in zip(
+            totais['meses'], totais['receitas'], totais['despesas'], totais['saldos'],
+            totais['variacao_mensal'], totais['variacao_anual'],
+        )
+    ]
+    
+    dados_grafico = {
+        'labels': [f'{mes:02d}/{ano_mes}' for ano_mes, mes in totais['meses']],
+        'datasets': [
+            {'label': 'Receitas', 'data': [float(v) for v in totais['receitas']], 'backgroundColor': '#4BC0C0'},
+            {'label': 'Despesas', 'data': [float(v) for v in totais['despesas']], 'backgroundColor': '#FF6384'},
+        ],
+    }
+    
+    return {
+        'ano': ano,
+        'anos_disponiveis': anos_disponiveis,
+        'resumo': relatorio['resumo'],
+        'linhas': linhas,
+        'categorias': totais['categorias'],
+        'dados_grafico': dados_grafico,
+    }
+
+@login_required
+@leitura_replica
+def relatorio_anual(request):
+    hoje = timezone.now().date()
+    ano = _ano_relatorio(request, hoje)
+    context = _contexto_relatorio_anual(
+        ano,
+        relatorios.relatorio_anual(request.user, ano),
+        relatorios.anos_disponiveis(request.user, hoje),
+    )
+    return render(request, 'controle/relatorio_anual.html', context)
+
+@login_required
+@leitura_replica
+async def relatorio_anual_async(request):
+    hoje = timezone.now().date()
+    ano = _ano_relatorio(request, hoje)
+    usuario = await request.auser()
+    relatorio, anos = await asyncio.gather(
+        relatorios.arelatorio_anual(usuario, ano),
+        relatorios.aanos_disponiveis(usuario, hoje),
+    )
+    context = _contexto_relatorio_anual(ano, relatorio, anos)
+    return await sync_to_async(render)(request, 'controle/relatorio_anual.html', context)
+
+def _periodo_serie(request):
+    """(periodo, inicio, fim) dos parâmetros GET 'periodo' e 'data'; ValueError se inválidos."""
+    periodo = request.GET.get('periodo', 'mes')
+    if periodo not in PERIODOS:
+        raise ValueError('Período inválido')
+    try:
+        referencia = datetime.strptime(request.GET['data'], '%Y-%m-%d').date()
+    except KeyError:
+        referencia = timezone.now().date()
+    except ValueError:
+        raise ValueError('Data inválida')
+    return (periodo, *intervalo_periodo(periodo, referencia))
+
+def _resposta_grafico(conteudo, formato):
+    return HttpResponse(conteudo, content_type=graficos.FORMATOS[formato])
+
+@login_required
+@leitura_replica
+@cache_control(private=True, no_cache=True)
+async def grafico_categorias(request):
+    # Pizza de despesas por categoria do mês, em PNG ou SVG
+    formato = request.GET.get('formato', 'png')
+    ano_mes = _ano_mes(request)
+    if formato not in graficos.FORMATOS or ano_mes is None:
+        return HttpResponseBadRequest('Parâmetros inválidos')
+    ano, mes = ano_mes
+    usuario = await request.auser()
+    dados = await sync_to_async(graficos.dados_categorias)(usuario, ano, mes)
+    conteudo = await graficos.arenderizar(usuario, 'categorias', f'{ano}-{mes:02d}', dados, formato)
+    return _resposta_grafico(conteudo, formato)
+
+@login_required
+@leitura_replica
+@cache_control(private=True, no_cache=True)
+async def grafico_saldo(request):
+    # Linha do saldo diário do período, em PNG ou SVG
+    formato = request.GET.get('formato', 'png')
+    if formato not in graficos.FORMATOS:
+        return HttpResponseBadRequest('Parâmetros inválidos')
+    try:
+        periodo, data_inicio, data_fim = _periodo_serie(request)
+    except ValueError as erro:
+        return HttpResponseBadRequest(str(erro))
+    
+    usuario = await request.auser()
+    dados = await sync_to_async(graficos.dados_saldo)(usuario, data_inicio, data_fim)
+    conteudo = await graficos.arenderizar(usuario, 'saldo', f'{periodo}-{data_inicio.isoformat()}', dados, formato)
+    return _resposta_grafico(conteudo, formato)
+
 @login_required
 def ajax_criar_categoria(request):
     if request.method == 'POST' and request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -411,13 +672,16 @@ def ajax_criar_conta(request):
                 return JsonResponse({'success': False, 'error': 'Nome é obrigatório'})
             
             try:
-                saldo_inicial = float(saldo_inicial)
-            except ValueError:
+                saldo_inicial = Decimal(saldo_inicial)
+                if not saldo_inicial.is_finite():
+                    raise InvalidOperation
+            except InvalidOperation:
                 return JsonResponse({'success': False, 'error': 'Saldo inicial inválido'})
             
             # Criar conta
             conta = Conta.objects.create(
                 nome=nome,
+                saldo=saldo_inicial,
                 saldo_inicial=saldo_inicial,
                 usuario=request.user
             )
@@ -431,3 +695,264 @@ def ajax_criar_conta(request):
             return JsonResponse({'success': False, 'error': str(e)})
     
     return JsonResponse({'success': False, 'error': 'Método não permitido'})
+
+
+@login_required
+def ajax_lancar_transacoes(request):
+    # Lote de transações em JSON: {"transacoes": [{descricao, valor, data,
+    # categoria, conta, observacao}, ...]}, validadas pelo mesmo formset da
+    # página de lançamento em lote. Tudo ou nada: com qualquer linha
+    # inválida nada é gravado e a resposta lista os erros por índice.
+    if request.method != 'POST' or request.headers.get('X-Requested-With') != 'XMLHttpRequest':
+        return JsonResponse({'success': False, 'error': 'Método não permitido'})
+    try:
+        itens = json.loads(request.body)['transacoes']
+        if not isinstance(itens, list) or not all(isinstance(item, dict) for item in itens):
+            raise TypeError
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'success': False, 'error': 'JSON inválido'}, status=400)
+    if not itens or len(itens) > lancamentos.MAXIMO_LOTE:
+        return JsonResponse(
+            {'success': False, 'error': f'Envie de 1 a {lancamentos.MAXIMO_LOTE} transações'},
+            status=400,
+        )
+    
+    formset = LancamentoLoteFormSet.de_itens(request.user, itens)
+    if not formset.is_valid():
+        return JsonResponse({'success': False, 'erros': formset.erros_por_linha()}, status=400)
+    criadas = lancamentos.inserir_em_lote(formset.transacoes())
+    return JsonResponse({
+        'success': True,
+        'transacoes': [transacao.pk for transacao in criadas],
+    }, status=201)
+
+
+# API JSON (v1) dos widgets do dashboard e dos relatórios.
+# As respostas são validadas pelo instante da última alteração dos dados
+# do usuário (cache.ultima_alteracao): sem escrita desde a última
+# resposta, o navegador recebe 304 sem que nada seja recalculado.
+
+API_VERSAO = 1
+
+def _etag_api(request, *args, **kwargs):
+    # A data de hoje entra na ETag porque o mês padrão depende dela
+    partes = [
+        f'v{API_VERSAO}',
+        request.path,
+        request.GET.urlencode(),
+        str(request.user.pk),
+        str(cache.ultima_alteracao(request.user.pk).timestamp()),
+        timezone.now().date().isoformat(),
+    ]
+    return hashlib.sha256('|'.join(partes).encode()).hexdigest()[:32]
+
+def _ultima_alteracao_api(request, *args, **kwargs):
+    return cache.ultima_alteracao(request.user.pk)
+
+def api_view(view):
+    """Login, apenas GET, revalidação obrigatória, GET condicional e leitura da réplica."""
+    view = leitura_replica(view)
+    view = condition(etag_func=_etag_api, last_modified_func=_ultima_alteracao_api)(view)
+    view = cache_control(private=True, no_cache=True)(view)
+    return login_required(require_GET(view))
+
+@api_view
+def api_resumo(request):
+    ano_mes = _ano_mes(request)
+    if ano_mes is None:
+        return JsonResponse({'success': False, 'error': 'Mês inválido'}, status=400)
+    ano, mes = ano_mes
+    
+    dados_mes = cache.parte_mes(request.user, ano, mes)
+    dados_saldo = cache.parte_saldo(request.user)
+    return JsonResponse({
+        'success': True,
+        'ano': ano,
+        'mes': mes,
+        'receitas_mes': dados_mes['receitas_mes'],
+        'despesas_mes': dados_mes['despesas_mes'],
+        'saldo_mes': dados_mes['receitas_mes'] - dados_mes['despesas_mes'],
+        'saldo_total': dados_saldo['saldo_total'],
+        'contas': [
+            {'id': conta.id, 'nome': conta.nome, 'saldo': conta.saldo}
+            for conta in dados_saldo['contas']
+        ],
+    })
+
+@api_view
+def api_categorias(request):
+    ano_mes = _ano_mes(request)
+    tipo = request.GET.get('tipo', 'D')
+    if ano_mes is None or tipo not in ('D', 'R'):
+        return JsonResponse({'success': False, 'error': 'Parâmetros inválidos'}, status=400)
+    ano, mes = ano_mes
+    
+    totais = [
+        (categoria, total)
+        for categoria, total in resumos.totais_por_categoria(request.user, ano, mes, tipo=tipo)
+        if total > 0
+    ]
+    totais.sort(key=lambda item: item[1], reverse=True)
+    soma = sum(total for _, total in totais)
+    
+    return JsonResponse({
+        'success': True,
+        'ano': ano,
+        'mes': mes,
+        'tipo': tipo,
+        'total': soma,
+        'itens': [
+            {
+                'categoria_id': categoria.id,
+                'categoria': categoria.nome,
+                'valor': total,
+                'percentual': float(total / soma * 100),
+            }
+            for categoria, total in totais
+        ],
+        'grafico': {
+            'labels': [categoria.nome for categoria, _ in totais],
+            'datasets': [{
+                'data': [float(total) for _, total in totais],
+                'backgroundColor': cache.CORES_GRAFICO[:len(totais)],
+                'borderWidth': 1
+            }]
+        },
+    })
+
+@api_view
+def api_evolucao_saldo(request):
+    try:
+        periodo, data_inicio, data_fim = _periodo_serie(request)
+    except ValueError as erro:
+        return JsonResponse({'success': False, 'error': str(erro)}, status=400)
+    
+    serie = serie_saldo(request.user, data_inicio, data_fim, projetar=request.GET.get('projetar') == '1')
+    
+    return JsonResponse({
+        'success': True,
+        'periodo': periodo,
+        'inicio': data_inicio.isoformat(),
+        'fim': data_fim.isoformat(),
+        'saldo_inicial': serie['saldo_inicial'],
+        'datas': [d.isoformat() for d in serie['datas']],
+        'receitas': serie['receitas'],
+        'despesas': serie['despesas'],
+        'saldos': serie['saldos'],
+        'projecao': serie.get('projecao'),
+        'grafico': dados_grafico_evolucao(serie),
+    })
+
+def _ano_mes_parametro(texto):
+    ano, mes = (int(parte) for parte in texto.split('-'))
+    if not 1 <= mes <= 12 or not 2 <= ano <= 9999:
+        raise ValueError
+    return ano, mes
+
+@api_view
+def api_totais_mensais(request):
+    hoje = timezone.now().date()
+    try:
+        fim = _ano_mes_parametro(request.GET.get('fim', f'{hoje.year}-{hoje.month}'))
+        inicio = _ano_mes_parametro(request.GET['inicio']) if 'inicio' in request.GET else relatorios.somar_meses(*fim, -11)
+        totais = relatorios.totais_mensais(request.user, inicio, fim)
+    except ValueError as erro:
+        return JsonResponse({'success': False, 'error': str(erro) or 'Intervalo inválido'}, status=400)
+    
+    return JsonResponse({
+        'success': True,
+        'meses': [f'{ano}-{mes:02d}' for ano, mes in totais['meses']],
+        'receitas': totais['receitas'],
+        'despesas': totais['despesas'],
+        'saldos': totais['saldos'],
+        'categorias': totais['categorias'],
+        'variacao_mensal': totais['variacao_mensal'],
+        'variacao_anual': totais['variacao_anual'],
+    })
+
+@api_view
+def api_orcamentos(request):
+    ano_mes = _ano_mes(request)
+    if ano_mes is None:
+        return JsonResponse({'success': False, 'error': 'Mês inválido'}, status=400)
+    ano, mes = ano_mes
+    
+    dados = cache.parte_orcamentos(request.user, ano, mes)
+    return JsonResponse({
+        'success': True,
+        'ano': ano,
+        'mes': mes,
+        'orcamentos': dados['orcamentos'],
+        'alertas': dados['alertas_orcamento'],
+    })
+
+@login_required
+@require_POST
+def api_transferencias(request):
+    # Lote de transferências em JSON: {"transferencias": [{origem, destino,
+    # valor, data, descricao}, ...]}. Tudo ou nada: com qualquer item
+    # inválido nada é gravado e a resposta lista os erros por índice.
+    try:
+        itens = json.loads(request.body)['transferencias']
+        if not isinstance(itens, list):
+            raise TypeError
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'success': False, 'error': 'JSON inválido'}, status=400)
+    if not itens or len(itens) > transferencias.MAXIMO_LOTE:
+        return JsonResponse(
+            {'success': False, 'error': f'Envie de 1 a {transferencias.MAXIMO_LOTE} transferências'},
+            status=400,
+        )
+    
+    lote, erros = transferencias.converter_lote(request.user, itens)
+    if erros:
+        return JsonResponse({'success': False, 'erros': erros}, status=400)
+    criadas = transferencias.transferir_em_lote(request.user, lote)
+    return JsonResponse({
+        'success': True,
+        'transferencias': [transferencia.pk for transferencia in criadas],
+    }, status=201)
+
+@api_view
+def api_transacoes_recentes(request):
+    transacoes = cache.parte_recentes(request.user)['transacoes_recentes']
+    return JsonResponse({
+        'success': True,
+        'transacoes': [
+            {
+                'id': transacao.id,
+                'data': transacao.data,
+                'descricao': transacao.descricao,
+                'valor': transacao.valor,
+                'tipo': transacao.categoria.tipo,
+                'categoria': transacao.categoria.nome,
+            }
+            for transacao in transacoes
+        ],
+    })
+
+@api_view
+def api_busca_transacoes(request):
+    texto = request.GET.get('q', '')
+    try:
+        limite = min(int(request.GET.get('limite', 20)), 100)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Limite inválido'}, status=400)
+    transacoes = busca.buscar(request.user, texto, limite=max(limite, 1))
+    return JsonResponse({
+        'success': True,
+        'transacoes': [
+            {
+                'id': transacao.id,
+                'data': transacao.data,
+                'descricao': transacao.descricao,
+                'observacao': transacao.observacao,
+                'valor': transacao.valor,
+                'tipo': transacao.categoria.tipo,
+                'categoria': transacao.categoria.nome,
+                'conta': transacao.conta.nome,
+                'relevancia': round(transacao.relevancia, 4),
+            }
+            for transacao in transacoes
+        ],
+    })
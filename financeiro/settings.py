@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,11 +43,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primeiro da lista, para medir também o trabalho dos demais
+    'controle.instrumentacao.InstrumentacaoMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'controle.roteamento.LeituraPosEscritaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -55,7 +59,8 @@ ROOT_URLCONF = 'financeiro.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates com medição do tempo de render (controle/instrumentacao.py)
+        'BACKEND': 'controle.instrumentacao.DjangoTemplatesMedidos',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -73,15 +78,175 @@ WSGI_APPLICATION = 'financeiro.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+#
+# Configuração do SQLite aplicada a cada conexão nova (PRAGMAs em
+# init_command). Os padrões são voltados a vários workers do gunicorn
+# lendo e escrevendo ao mesmo tempo:
+#
+# - journal_mode WAL: leitores não bloqueiam o escritor nem são
+#   bloqueados por ele;
+# - synchronous NORMAL: seguro em WAL (uma queda de energia pode perder
+#   só as últimas transações, sem corromper o banco) e sem fsync a cada
+#   commit;
+# - busy_timeout: espera o lock de escrita em vez de falhar na hora;
+# - cache_size e mmap_size: mais páginas em memória para os relatórios.
+#
+# Com SQLITE_JOURNAL_MODE=DELETE, SQLITE_SYNCHRONOUS=FULL e
+# SQLITE_TRANSACTION_MODE=DEFERRED o comportamento volta ao padrão do
+# Django, usado como linha de base pelo comando "carga_sqlite".
+
+SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+SQLITE_CACHE_SIZE_KIB = int(os.environ.get('SQLITE_CACHE_SIZE_KIB', 64 * 1024))
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+# Com BEGIN DEFERRED os triggers da busca (FTS5) leem o índice antes de
+# escrever e a promoção do lock falha na hora com "database is locked",
+# sem esperar o busy_timeout. IMMEDIATE já começa com o lock de escrita.
+SQLITE_TRANSACTION_MODE = os.environ.get('SQLITE_TRANSACTION_MODE', 'IMMEDIATE')
+
+SQLITE_PRAGMAS = {
+    'journal_mode': SQLITE_JOURNAL_MODE,
+    'synchronous': SQLITE_SYNCHRONOUS,
+    'busy_timeout': SQLITE_BUSY_TIMEOUT_MS,
+    # Negativo: tamanho em KiB em vez de número de páginas
+    'cache_size': -SQLITE_CACHE_SIZE_KIB,
+    'mmap_size': SQLITE_MMAP_SIZE,
+    'temp_store': 'MEMORY',
+}
 
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {nome}={valor}' for nome, valor in SQLITE_PRAGMAS.items()),
+            'transaction_mode': SQLITE_TRANSACTION_MODE,
+        },
+        # Conexões reaproveitadas entre requisições (segundos; 0 fecha a
+        # cada requisição). O health check descarta conexões quebradas.
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        # Banco de testes em arquivo para permitir conexões concorrentes
+        # (testes de concorrência com threads)
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
 
+# Réplica de leitura opcional (outro arquivo SQLite ou um PostgreSQL
+# local, por exemplo), usada pelas views de relatórios e listas (ver
+# controle/roteamento.py). A replicação em si fica fora do Django. Depois
+# de uma escrita, a sessão lê do principal por DB_REPLICA_ATRASO_MAXIMO
+# segundos, que deve cobrir o atraso da réplica.
+
+DB_REPLICA_NAME = os.environ.get('DB_REPLICA_NAME')
+
+if DB_REPLICA_NAME:
+    DB_REPLICA_ENGINE = os.environ.get('DB_REPLICA_ENGINE', 'django.db.backends.sqlite3')
+    DATABASES['replica'] = {
+        'ENGINE': DB_REPLICA_ENGINE,
+        'NAME': DB_REPLICA_NAME,
+        'HOST': os.environ.get('DB_REPLICA_HOST', ''),
+        'PORT': os.environ.get('DB_REPLICA_PORT', ''),
+        'USER': os.environ.get('DB_REPLICA_USER', ''),
+        'PASSWORD': os.environ.get('DB_REPLICA_PASSWORD', ''),
+        'OPTIONS': DATABASES['default']['OPTIONS'] if DB_REPLICA_ENGINE.endswith('sqlite3') else {},
+        'CONN_MAX_AGE': DATABASES['default']['CONN_MAX_AGE'],
+        'CONN_HEALTH_CHECKS': True,
+        # Nos testes a réplica aponta para o banco de testes principal
+        'TEST': {'MIRROR': 'default'},
+    }
+
+BANCO_REPLICA = 'replica' if DB_REPLICA_NAME else None
+BANCO_REPLICA_ATRASO_MAXIMO = int(os.environ.get('DB_REPLICA_ATRASO_MAXIMO', 5))
+DATABASE_ROUTERS = ['controle.roteamento.RoteadorReplica']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+#
+# CACHE_BACKEND escolhe o backend: "locmem" (padrão, desenvolvimento e
+# testes), "file" (diretório em CACHE_LOCATION) ou "db" (tabela em
+# CACHE_LOCATION, criada com "python manage.py createcachetable").
+#
+# O locmem é separado por processo: a invalidação feita por um worker ou
+# por um comando (recalcular_saldos, reconstruir_resumos, importar_extrato,
+# arquivar_transacoes) não alcança o cache dos outros processos, que podem
+# servir o dashboard e a API com dados antigos até DASHBOARD_CACHE_TIMEOUT.
+# Com mais de um processo, use "file" ou "db".
+
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+
+if CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_LOCATION', str(BASE_DIR / 'cache')),
+        }
+    }
+elif CACHE_BACKEND == 'db':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': os.environ.get('CACHE_LOCATION', 'controle_cache'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'financeiro',
+        }
+    }
+
+# Tempo máximo (segundos) das partes do dashboard no cache; a invalidação
+# por sinais é que mantém os dados corretos
+DASHBOARD_CACHE_TIMEOUT = int(os.environ.get('DASHBOARD_CACHE_TIMEOUT', 24 * 60 * 60))
+
+# Gráficos renderizados no servidor (controle/graficos.py): diretório do
+# cache em disco, tamanho máximo antes da poda LRU e processos do pool de
+# renderização (0 desenha no próprio processo)
+GRAFICOS_CACHE_DIR = Path(os.environ.get('GRAFICOS_CACHE_DIR', BASE_DIR / 'cache' / 'graficos'))
+GRAFICOS_CACHE_MAXIMO_BYTES = int(os.environ.get('GRAFICOS_CACHE_MAXIMO_MB', 64)) * 1024 * 1024
+GRAFICOS_PROCESSOS = int(os.environ.get('GRAFICOS_PROCESSOS', 2))
+
+# Arquivamento das transações antigas (controle/arquivamento.py): diretório
+# dos arquivos .jsonl.gz e quantos anos completos, além do atual, ficam na
+# tabela de transações
+ARQUIVO_TRANSACOES_DIR = Path(os.environ.get('ARQUIVO_TRANSACOES_DIR', BASE_DIR / 'arquivo'))
+ARQUIVO_TRANSACOES_ANOS = int(os.environ.get('ARQUIVO_TRANSACOES_ANOS', 2))
+
+
+# Instrumentação das requisições (controle/instrumentacao.py)
+# Acima dos limites a requisição é registrada como WARNING; INSTRUMENTACAO_LOG_LEVEL=INFO
+# registra todas.
+
+INSTRUMENTACAO_SERVER_TIMING = os.environ.get('INSTRUMENTACAO_SERVER_TIMING', '1') == '1'
+INSTRUMENTACAO_CONSULTAS_LENTAS = int(os.environ.get('INSTRUMENTACAO_CONSULTAS_LENTAS', 3))
+INSTRUMENTACAO_LIMITE_CONSULTAS = int(os.environ.get('INSTRUMENTACAO_LIMITE_CONSULTAS', 50))
+INSTRUMENTACAO_LIMITE_MS = int(os.environ.get('INSTRUMENTACAO_LIMITE_MS', 1000))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'controle.instrumentacao': {
+            'handlers': ['console'],
+            'level': os.environ.get('INSTRUMENTACAO_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 